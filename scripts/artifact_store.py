@@ -0,0 +1,188 @@
+import os
+import sys
+import json
+import time
+import gzip
+import fcntl
+import shutil
+import tempfile
+
+scriptDir = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(scriptDir)
+
+import conf
+from utils import log
+
+# compressed store of generator artifacts (minion and aux files of generator instances, kept so that later runs of the same generator instance skip Savile Row, see generator.py)
+# - artifacts not used for conf.artifactColdAfter seconds are compressed into detailed-output/artifact-store/ and removed from detailed-output
+# - they are decompressed back to their original location in detailed-output (the scratch dir of the generator solving) when the generator instance is solved again
+# - the total size of the artifacts (compressed or not) is limited to conf.artifactStoreQuota MB. When the quota is exceeded, least recently used compressed artifacts are evicted, and their generator instances will be re-translated by Savile Row if needed
+# - zstd is used if the zstandard package is installed, gzip otherwise
+# - the store is enabled when conf.artifactStoreQuota is set (see wrapper.py)
+# - index.json keeps, for each artifact (identified by its file name), its sizes and the last time it was used. stats.json keeps hit/miss/eviction counts and the number of bytes saved by compression
+# - all changes to the store are protected by an exclusive lock on store.lock
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+storeDir = conf.detailedOutputDir + "/artifact-store"
+
+
+def is_enabled():
+    return conf.artifactStoreQuota is not None
+
+
+def compress_file(src, dst):
+    with open(src, "rb") as fIn, open(dst, "wb") as fOut:
+        if dst.endswith(".zst"):
+            zstandard.ZstdCompressor().copy_stream(fIn, fOut)
+        else:
+            with gzip.GzipFile(fileobj=fOut, mode="wb", compresslevel=6) as gz:
+                shutil.copyfileobj(fIn, gz)
+
+
+def decompress_file(src, dst):
+    # decompress to a temporary file first, so that a crashed run never leaves a partial artifact behind
+    fd, tmpFile = tempfile.mkstemp(dir=os.path.dirname(dst), suffix=".tmp")
+    with open(src, "rb") as fIn, os.fdopen(fd, "wb") as fOut:
+        if src.endswith(".zst"):
+            zstandard.ZstdDecompressor().copy_stream(fIn, fOut)
+        else:
+            with gzip.GzipFile(fileobj=fIn, mode="rb") as gz:
+                shutil.copyfileobj(gz, fOut)
+    os.replace(tmpFile, dst)
+
+
+def read_json(fn, default):
+    if not os.path.isfile(fn):
+        return default
+    with open(fn, "rt") as f:
+        return json.load(f)
+
+
+def write_json(fn, data):
+    fd, tmpFile = tempfile.mkstemp(dir=os.path.dirname(fn), suffix=".tmp")
+    with os.fdopen(fd, "wt") as f:
+        json.dump(data, f)
+    os.replace(tmpFile, fn)
+
+
+class Store:
+    """
+    locked access to the store's index and statistics, use with "with Store() as store:"
+    """
+
+    def __enter__(self):
+        os.makedirs(storeDir, exist_ok=True)
+        self.lockFile = open(os.path.join(storeDir, "store.lock"), "at")
+        fcntl.flock(self.lockFile, fcntl.LOCK_EX)
+        self.index = read_json(os.path.join(storeDir, "index.json"), {})
+        self.stats = read_json(
+            os.path.join(storeDir, "stats.json"),
+            {"hits": 0, "misses": 0, "evictions": 0, "bytesSaved": 0},
+        )
+        return self
+
+    def __exit__(self, *args):
+        write_json(os.path.join(storeDir, "index.json"), self.index)
+        self.stats["bytesSaved"] = sum(
+            [e["originalSize"] - e["compressedSize"] for e in self.index.values() if e["compressedFile"]]
+        )
+        write_json(os.path.join(storeDir, "stats.json"), self.stats)
+        self.lockFile.close()
+
+    def get_used_space(self):
+        return sum(
+            [e["compressedSize"] if e["compressedFile"] else e["originalSize"] for e in self.index.values()]
+        )
+
+
+def fetch(lsFiles):
+    """
+    make sure the artifacts of a generator instance are available at their original locations, decompress them from the store if needed
+    return True if all of them are available, False otherwise (the generator instance must be re-translated)
+    """
+    with Store() as store:
+        available = True
+        restored = False
+        for fn in lsFiles:
+            name = os.path.basename(fn)
+            entry = store.index.get(name, None)
+            if os.path.isfile(fn):
+                if entry is not None:
+                    entry["lastUsed"] = time.time()
+                continue
+            if (entry is None) or (not entry["compressedFile"]):
+                available = False
+                continue
+            decompress_file(os.path.join(storeDir, entry["compressedFile"]), fn)
+            os.remove(os.path.join(storeDir, entry["compressedFile"]))
+            entry["compressedFile"] = None
+            entry["lastUsed"] = time.time()
+            restored = True
+        if restored and available:
+            store.stats["hits"] += 1
+        elif not available:
+            store.stats["misses"] += 1
+        return available
+
+
+def release(lsFiles):
+    """
+    register the artifacts of a generator instance once a wrapper run is done with them, then compress cold artifacts and enforce the quota
+    """
+    with Store() as store:
+        for fn in lsFiles:
+            if os.path.isfile(fn):
+                store.index[os.path.basename(fn)] = {
+                    "originalSize": os.path.getsize(fn),
+                    "compressedSize": 0,
+                    "compressedFile": None,
+                    "lastUsed": time.time(),
+                }
+        maintain(store)
+
+
+def maintain(store):
+    """
+    compress artifacts not used for conf.artifactColdAfter seconds, then evict least recently used compressed artifacts until the store is within its quota
+    """
+    extension = ".zst" if zstandard else ".gz"
+    now = time.time()
+    for name, entry in store.index.items():
+        fn = os.path.join(conf.detailedOutputDir, name)
+        if (entry["compressedFile"] is None) and (now - entry["lastUsed"] > conf.artifactColdAfter):
+            if not os.path.isfile(fn):
+                continue
+            entry["compressedFile"] = name + extension
+            compress_file(fn, os.path.join(storeDir, entry["compressedFile"]))
+            entry["originalSize"] = os.path.getsize(fn)
+            entry["compressedSize"] = os.path.getsize(os.path.join(storeDir, entry["compressedFile"]))
+            os.remove(fn)
+
+    # entries whose files have been removed outside of the store are dropped
+    for name in list(store.index.keys()):
+        entry = store.index[name]
+        if entry["compressedFile"]:
+            exists = os.path.isfile(os.path.join(storeDir, entry["compressedFile"]))
+        else:
+            exists = os.path.isfile(os.path.join(conf.detailedOutputDir, name))
+        if not exists:
+            del store.index[name]
+
+    quota = conf.artifactStoreQuota * 1024 * 1024
+    if store.get_used_space() <= quota:
+        return
+    lsCompressed = sorted(
+        [name for name, e in store.index.items() if e["compressedFile"]],
+        key=lambda name: store.index[name]["lastUsed"],
+    )
+    for name in lsCompressed:
+        if store.get_used_space() <= quota:
+            break
+        log(f"Artifact store: evicting {name}")
+        os.remove(os.path.join(storeDir, store.index[name]["compressedFile"]))
+        del store.index[name]
+        store.stats["evictions"] += 1
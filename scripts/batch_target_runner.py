@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+
+# batch target runner for irace, called by targetRunnerParallel (see scenario-batch.R) with all experiments of a race step at once
+# syntax: python batch_target_runner.py <experimentFile> <resultFile>
+#   - experimentFile: one line per experiment: <iraceConfigurationId> <instanceId> <randomSeed> <instanceName> <configurationValues>
+#   - resultFile: one line per experiment (same order as in experimentFile): <score> <time>
+# scheduling:
+#   - experiments of the same configuration share the same generator instance (gen-inst-<configurationId>.minion and its negative table), so they are grouped together and run one after another
+#   - groups are run in parallel on nCores cores, largest groups first. Each evaluation may itself run up to nCoresPerEvaluation solver runs in parallel, so at most nCores // nCoresPerEvaluation groups are run at the same time
+#   - each experiment is evaluated by wrapper.main() in a forked process, with its output saved in detailed-output/out-<configurationId>-<seed> (same as target-runner), so a tuning can still be resumed
+
+import os
+import sys
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+scriptDir = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(scriptDir)
+
+from utils import log, read_file
+from wrapper_helpers import read_setting, is_valid_score_line
+from wrapper import run_to_output_file
+from conf import detailedOutputDir
+
+
+def read_experiments(experimentFile):
+    lsExperiments = []
+    for line in read_file(experimentFile):
+        if line.strip() == "":
+            continue
+        args = line.split()
+        lsExperiments.append(
+            {
+                "configurationId": int(args[0]),
+                "seed": int(args[2]),
+                "args": ["wrapper.py"] + args,
+            }
+        )
+    return lsExperiments
+
+
+def get_output_file(experiment):
+    return (
+        detailedOutputDir
+        + "/out-"
+        + str(experiment["configurationId"])
+        + "-"
+        + str(experiment["seed"])
+    )
+
+
+def read_last_line(fn):
+    if not os.path.isfile(fn):
+        return None
+    lsLines = read_file(fn)
+    if len(lsLines) == 0:
+        return ""
+    return lsLines[-1]
+
+
+def evaluate_group(lsExperiments, setting):
+    for experiment in lsExperiments:
+        outFile = get_output_file(experiment)
+
+        # if the output file already exists and contains a valid result, don't re-run it
+        lastLine = read_last_line(outFile)
+        if (lastLine is not None) and is_valid_score_line(lastLine):
+            log("Reusing existing results in " + outFile)
+            continue
+
+        log("Evaluating " + " ".join(experiment["args"][1:]))
+        run_to_output_file(experiment["args"], outFile, setting)
+
+
+def main():
+    experimentFile = sys.argv[1]
+    resultFile = sys.argv[2]
+
+    setting = read_setting("./config.json")
+    nCores = setting["generalSettings"]["nCores"]
+    # each evaluation uses up to nCoresPerEvaluation cores (parallel solver runs of an instance), so that timings aren't skewed by oversubscribed cores
+    nParallelGroups = max(1, nCores // setting["evaluationSettings"]["nCoresPerEvaluation"])
+
+    # group experiments by configuration
+    lsExperiments = read_experiments(experimentFile)
+    groups = OrderedDict()
+    for experiment in lsExperiments:
+        groups.setdefault(experiment["configurationId"], []).append(experiment)
+    lsGroups = sorted(groups.values(), key=len, reverse=True)
+    log(
+        f"Batch of {len(lsExperiments)} experiments ({len(lsGroups)} configurations) on {nCores} cores, {nParallelGroups} configuration(s) at a time"
+    )
+
+    # run all groups
+    with ThreadPoolExecutor(max_workers=nParallelGroups) as executor:
+        lsFutures = [
+            executor.submit(evaluate_group, group, setting) for group in lsGroups
+        ]
+        for future in lsFutures:
+            future.result()
+
+    # collect results, in the same order as the experiments
+    lsLines = []
+    for experiment in lsExperiments:
+        lastLine = read_last_line(get_output_file(experiment))
+        if (lastLine is None) or (not is_valid_score_line(lastLine)):
+            lsLines.append("Error! " + str(lastLine))
+        else:
+            lsLines.append(lastLine)
+    with open(resultFile, "wt") as f:
+        f.write("\n".join(lsLines) + "\n")
+
+
+if __name__ == "__main__":
+    main()
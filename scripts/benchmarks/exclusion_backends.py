@@ -0,0 +1,126 @@
+import os
+import sys
+import dbm
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import statistics
+
+scriptDir = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.dirname(scriptDir))
+
+from essence_pipeline_utils import run_minion
+from negative_table import EXCLUSION_BACKENDS, TABLE_NAME, encode_negative_table, is_already_generated
+from utils import delete_file
+
+# benchmark of the exclusion backends of generator solving (see negative_table.py, --genExclusion)
+# for each backend and each number of previously generated solutions, measure:
+#   - the time to add one more solution (encode_negative_table, done at the end of each wrapper run)
+#   - the running time of run_minion on the resulting minion file, including the dedupe check for externalDedupe (done at the beginning of each wrapper run)
+# the generator is a synthetic minion model: nVariables variables with domain {0..domainSize-1} and an alldiff constraint
+#   - the time to check if a solution has already been generated (is_already_generated, done after each minion run with externalDedupe)
+# usage: python exclusion_backends.py [--nPriorSolutions 10 1000 10000] [--nRepeats 5] [--noSolver]
+# minion must be available in PATH, unless --noSolver is used (minion's running time is then not measured)
+
+
+def write_generator_minion_file(minionFile, nVariables, domainSize, priorSolutions):
+    """
+    write the synthetic generator, with prior solutions in a negative table (layout of previous versions of AutoIG, will be converted by encode_negative_table)
+    """
+    variables = ",".join([f"x{i}" for i in range(nVariables)])
+    with open(minionFile, "wt") as f:
+        f.write("MINION 3\n**VARIABLES**\n")
+        for i in range(nVariables):
+            f.write(f"DISCRETE x{i} {{0..{domainSize - 1}}}\n")
+        f.write("**SEARCH**\n")
+        f.write("PRINT[" + ",".join([f"[x{i}]" for i in range(nVariables)]) + "]\n")
+        f.write(f"VARORDER [{variables}]\n")
+        if len(priorSolutions) > 0:
+            f.write(f"**TUPLELIST**\n{TABLE_NAME} {len(priorSolutions)} {nVariables}\n")
+            for sol in priorSolutions:
+                f.write(sol + "\n")
+        f.write(f"**CONSTRAINTS**\nalldiff([{variables}])\n")
+        if len(priorSolutions) > 0:
+            f.write(f"negativetable([{variables}],{TABLE_NAME})\n")
+        f.write("**EOF**\n")
+
+
+def make_prior_solutions(n, nVariables, domainSize, rng):
+    solutions = set()
+    while len(solutions) < n:
+        solutions.add(" ".join([str(v) for v in rng.sample(range(domainSize), nVariables)]))
+    return list(solutions)
+
+
+def prepare(backend, minionFile, priorSolutions, nVariables, domainSize, shardSize):
+    """
+    create the generator minion file with prior solutions excluded by the given backend
+    """
+    if backend == "externalDedupe":
+        write_generator_minion_file(minionFile, nVariables, domainSize, [])
+        with dbm.open(minionFile + ".solutions", "c") as solutions:
+            for sol in priorSolutions[:-1]:
+                solutions["t:" + sol] = "1"
+    else:
+        # all but the last prior solution are written in bulk, the last one triggers the conversion into the incremental layout
+        write_generator_minion_file(minionFile, nVariables, domainSize, priorSolutions[:-1])
+    encode_negative_table(minionFile, priorSolutions[-1], backend, shardSize)
+
+
+def run_benchmark(args):
+    if (not args.noSolver) and (shutil.which("minion") is None):
+        print("ERROR: minion is not found in PATH")
+        sys.exit(1)
+    rng = random.Random(args.seed)
+    workDir = tempfile.mkdtemp(prefix="autoig-exclusion-benchmark-")
+    print(f"{'backend':<16}{'nPriorSolutions':>16}{'fileSize(KB)':>14}{'update(s)':>12}{'dedupe(s)':>12}{'minion(s)':>12}")
+    for nPrior in args.nPriorSolutions:
+        priorSolutions = make_prior_solutions(nPrior, args.nVariables, args.domainSize, rng)
+        for backend in EXCLUSION_BACKENDS:
+            minionFile = os.path.join(workDir, f"gen-{backend}-{nPrior}.minion")
+            minionSolFile = minionFile + ".solution"
+            prepare(backend, minionFile, priorSolutions, args.nVariables, args.domainSize, args.shardSize)
+
+            lsUpdateTimes = []
+            lsDedupeTimes = []
+            lsSolveTimes = []
+            for i in range(args.nRepeats):
+                if not args.noSolver:
+                    start = time.time()
+                    status, _ = run_minion(minionFile, minionSolFile, args.seed + i, args.timeLimit, args.minionFlags)
+                    if (status == "sat") and (backend == "externalDedupe"):
+                        with open(minionSolFile) as f:
+                            is_already_generated(minionFile, f.read())
+                    lsSolveTimes.append(time.time() - start)
+                    delete_file([minionSolFile])
+
+                newSol = make_prior_solutions(1, args.nVariables, args.domainSize, rng)[0]
+                start = time.time()
+                is_already_generated(minionFile, newSol)
+                lsDedupeTimes.append(time.time() - start)
+                start = time.time()
+                encode_negative_table(minionFile, newSol, backend, args.shardSize)
+                lsUpdateTimes.append(time.time() - start)
+
+            solveTime = f"{statistics.median(lsSolveTimes):>12.3f}" if lsSolveTimes else f"{'-':>12}"
+            print(
+                f"{backend:<16}{nPrior:>16}{os.path.getsize(minionFile) / 1024:>14.1f}"
+                f"{statistics.median(lsUpdateTimes):>12.4f}{statistics.median(lsDedupeTimes):>12.5f}{solveTime}"
+            )
+    shutil.rmtree(workDir)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="benchmark of the exclusion backends of generator solving")
+    parser.add_argument("--nPriorSolutions", type=int, nargs="+", default=[10, 1000, 10000])
+    parser.add_argument("--nVariables", type=int, default=8)
+    parser.add_argument("--domainSize", type=int, default=10)
+    parser.add_argument("--shardSize", type=int, default=1000)
+    parser.add_argument("--nRepeats", type=int, default=5)
+    parser.add_argument("--timeLimit", type=int, default=60)
+    parser.add_argument("--minionFlags", type=str, default="-varorder domoverwdeg -valorder random")
+    parser.add_argument("--seed", type=int, default=123)
+    parser.add_argument("--noSolver", action="store_true", help="don't run minion, only measure the exclusion backends' update and dedupe check times")
+    run_benchmark(parser.parse_args())
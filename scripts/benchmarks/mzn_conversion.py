@@ -0,0 +1,68 @@
+import os
+import sys
+import glob
+import time
+import argparse
+import statistics
+
+scriptDir = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.dirname(scriptDir))
+
+from convert import (
+    UnsupportedInstance,
+    convert_essence_param_to_dzn,
+    conjure_convert_essence_instance_to_mzn,
+    get_canonical_dzn,
+)
+
+# benchmark of the conversion of generated instances from Essence to MiniZinc (see convert.py)
+# for each experiment directory (e.g., of an experiment run with one of the generators in data/models/*/generator.essence), convert all generated instances (detailed-output/inst-*.param) with conjure and with the native converter, and report the conversion time per instance of both, and the number of instances where their results are different
+# usage: python mzn_conversion.py <runDir> [<runDir> ...] [--nInstances 50]
+# conjure must be available in PATH
+
+
+def time_conversion(convert):
+    start = time.time()
+    output = convert()
+    return time.time() - start, output
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("runDirs", nargs="+", type=str)
+    parser.add_argument("--nInstances", default=50, type=int, help="max number of instances per experiment")
+    args = parser.parse_args()
+
+    print(f"{'experiment':<30} {'nInstances':>10} {'conjure(s)':>10} {'native(s)':>10} {'speed-up':>9} {'unsupported':>11} {'different':>9}")
+    for runDir in args.runDirs:
+        generatorFile = os.path.join(runDir, "generator.essence")
+        lsInstances = sorted(glob.glob(os.path.join(runDir, "detailed-output", "inst-*.param")))[: args.nInstances]
+        lsConjureTimes = []
+        lsNativeTimes = []
+        nUnsupported = nDifferent = 0
+        for instFile in lsInstances:
+            conjureTime, conjureOutput = time_conversion(
+                lambda: conjure_convert_essence_instance_to_mzn(instFile)
+            )
+            lsConjureTimes.append(conjureTime)
+            try:
+                nativeTime, nativeOutput = time_conversion(
+                    lambda: convert_essence_param_to_dzn(generatorFile, instFile)
+                )
+            except UnsupportedInstance:
+                nUnsupported += 1
+                continue
+            lsNativeTimes.append(nativeTime)
+            nDifferent += int(get_canonical_dzn(nativeOutput) != get_canonical_dzn(conjureOutput))
+        if len(lsNativeTimes) == 0:
+            print(f"{os.path.basename(os.path.abspath(runDir)):<30} {len(lsInstances):>10} (no instance can be converted natively)")
+            continue
+        conjureTime = statistics.mean(lsConjureTimes)
+        nativeTime = statistics.mean(lsNativeTimes)
+        print(
+            f"{os.path.basename(os.path.abspath(runDir)):<30} {len(lsInstances):>10} {conjureTime:>10.4f} {nativeTime:>10.4f} {conjureTime / nativeTime:>8.0f}x {nUnsupported:>11} {nDifferent:>9}"
+        )
+
+
+if __name__ == "__main__":
+    main()
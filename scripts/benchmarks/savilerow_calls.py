@@ -0,0 +1,171 @@
+import os
+import sys
+import json
+import time
+import shlex
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+scriptDir = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.dirname(scriptDir))
+
+import savilerow_server
+from file_wait import wait_for_file
+from launcher import run_limited
+from essence_pipeline_utils import run_minion
+
+# benchmark of the persistent Savile Row service (see savilerow_server.py, --SRServer)
+# run nCalls Savile Row commands of each kind, interleaved (a minion translation, a SAT translation, and a ReadSolution call on a solution found by minion), via the savilerow command line (a new JVM per call) and via nailgun servers, and report per-call latencies of both paths for each kind of command
+# each server is dedicated to one kind of command (see savilerow_server.call), and the output file of every call is compared with the one of the first command line call of the same kind, to check that Savile Row gives the same results when it's run repeatedly in the same JVM
+# usage: python savilerow_calls.py <eprimeModelFile> <eprimeParamFile> [--nailgunJar <jar>] [--nCalls 20] [--SRFlags ""]
+# savilerow, minion and java must be available in PATH
+
+
+def get_commands(eprimeModelFile, eprimeParamFile, outDir, callId, refAuxFile, minionSolFile, SRFlags):
+    """
+    Savile Row commands (without "savilerow") of each kind for one call, with the output file to compare
+    """
+    lsFlags = shlex.split(SRFlags)
+    out = lambda ext: os.path.join(outDir, f"{callId}{ext}")
+    commands = {
+        "translate (minion)": (
+            [eprimeModelFile, eprimeParamFile, "-out-aux", out(".aux"), "-out-minion", out(".minion"), "-save-symbols"] + lsFlags,
+            out(".minion"),
+        ),
+        "translate (sat)": (
+            [eprimeModelFile, eprimeParamFile, "-sat", "-out-sat", out(".dimacs")] + lsFlags,
+            out(".dimacs"),
+        ),
+    }
+    if minionSolFile is not None:
+        commands["read solution"] = (
+            [eprimeModelFile, "-mode", "ReadSolution", "-out-aux", refAuxFile, "-out-solution", out(".solution"), "-minion-sol-file", minionSolFile],
+            out(".solution"),
+        )
+    return commands
+
+
+def run_command(args, outFile, viaServer):
+    start = time.time()
+    if viaServer:
+        result = savilerow_server.call(args)
+        assert result is not None, f"ERROR: command {args} was not run on a server"
+        output, returnCode = result
+    else:
+        output, returnCode, _ = run_limited("savilerow " + shlex.join(args))
+    elapsed = time.time() - start
+    assert returnCode == 0, f"ERROR: Savile Row failed: {output}"
+    with open(outFile, "rt") as f:
+        return elapsed, f.read()
+
+
+def summarise(lsTimes):
+    # the first call to a server includes JIT warm-up
+    first = lsTimes[0]
+    lsTimes = sorted(lsTimes)
+    return {
+        "first": first,
+        "mean": statistics.mean(lsTimes),
+        "median": statistics.median(lsTimes),
+        "min": lsTimes[0],
+        "p95": lsTimes[min(len(lsTimes) - 1, int(0.95 * len(lsTimes)))],
+        "max": lsTimes[-1],
+    }
+
+
+def run_calls(args, outDir, path, refAuxFile, minionSolFile, refOutputs):
+    """
+    run nCalls commands of each kind, interleaved, and return latencies and the number of outputs different from refOutputs (filled with the first outputs if empty)
+    """
+    lsTimes = {}
+    nDifferent = {}
+    for i in range(args.nCalls):
+        commands = get_commands(
+            args.eprimeModelFile, args.eprimeParamFile, outDir, f"{path}-{i}", refAuxFile, minionSolFile, args.SRFlags
+        )
+        for kind, (cmdArgs, outFile) in commands.items():
+            elapsed, output = run_command(cmdArgs, outFile, path == "server")
+            refOutputs.setdefault(kind, output)
+            lsTimes.setdefault(kind, []).append(elapsed)
+            nDifferent[kind] = nDifferent.get(kind, 0) + int(output != refOutputs[kind])
+    return {kind: summarise(t) for kind, t in lsTimes.items()}, nDifferent
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("eprimeModelFile", type=str)
+    parser.add_argument("eprimeParamFile", type=str)
+    parser.add_argument("--nailgunJar", default=os.environ.get("NAILGUN_JAR", ""), type=str)
+    parser.add_argument("--nCalls", default=20, type=int)
+    parser.add_argument("--SRFlags", default="", type=str)
+    args = parser.parse_args()
+    args.eprimeModelFile = os.path.abspath(args.eprimeModelFile)
+    args.eprimeParamFile = os.path.abspath(args.eprimeParamFile)
+
+    outDir = tempfile.mkdtemp()
+    results = {}
+    try:
+        # a solution for the ReadSolution calls
+        refCommands = get_commands(args.eprimeModelFile, args.eprimeParamFile, outDir, "ref", None, None, args.SRFlags)
+        cmdArgs, refMinionFile = refCommands["translate (minion)"]
+        run_command(cmdArgs, refMinionFile, False)
+        refAuxFile = refMinionFile.replace(".minion", ".aux")
+        minionSolFile = os.path.join(outDir, "ref.minion-solution")
+        if run_minion(refMinionFile, minionSolFile, 0, 3600, "")[0] != "sat":
+            print("The instance has no solution, ReadSolution calls are not measured")
+            minionSolFile = None
+
+        # command line
+        refOutputs = {}
+        results["command line"], _ = run_calls(args, outDir, "cli", refAuxFile, minionSolFile, refOutputs)
+        kinds = list(results["command line"].keys())
+
+        # nailgun servers, one per kind of command
+        lsSockets = [os.path.join(outDir, f"savilerow-{i}.sock") for i in range(len(kinds))]
+        servers = [
+            subprocess.Popen(
+                savilerow_server.get_server_command(socketFile, args.nailgunJar),
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.STDOUT,
+                start_new_session=True,
+            )
+            for socketFile in lsSockets
+        ]
+        try:
+            for socketFile, server in zip(lsSockets, servers):
+                try:
+                    wait_for_file(socketFile, timeout=60, stopIf=lambda: server.poll() is not None)
+                except Exception:
+                    raise Exception("ERROR: the nailgun server failed to start")
+            serverInfoFile = os.path.join(outDir, "savilerow-server.json")
+            with open(serverInfoFile, "wt") as f:
+                json.dump({"mainClass": savilerow_server.get_main_class(), "sockets": lsSockets}, f)
+            os.environ[savilerow_server.SERVER_INFO_ENV] = serverInfoFile
+            results["server"], nDifferent = run_calls(args, outDir, "server", refAuxFile, minionSolFile, refOutputs)
+        finally:
+            for server in servers:
+                server.terminate()
+                server.wait()
+    finally:
+        shutil.rmtree(outDir)
+
+    print(f"\nLatency per Savile Row call over {args.nCalls} calls of each kind (in seconds):")
+    print(f"{'kind':<20} {'path':<14} {'first':>8} {'mean':>8} {'median':>8} {'min':>8} {'p95':>8} {'max':>8}")
+    for kind in kinds:
+        for path, r in results.items():
+            print(
+                f"{kind:<20} {path:<14} "
+                + " ".join([f"{r[kind][k]:>8.3f}" for k in ["first", "mean", "median", "min", "p95", "max"]])
+            )
+    for kind in kinds:
+        print(
+            f"{kind}: speed-up (median) {results['command line'][kind]['median'] / results['server'][kind]['median']:.1f}x, "
+            f"outputs different from the command line's: {nDifferent[kind]}/{args.nCalls}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -92,6 +92,32 @@ def read_data(runDir):
     return config, tRs, tRsNoDup
 
 
+def count_capped_base_runs(instanceResults):
+    """
+    number of base solver runs of an instance that were stopped by the base solver time cap rather than by the full time limit
+    """
+    if (instanceResults is None) or ("results" not in instanceResults) or ("base" not in instanceResults["results"]):
+        return 0
+    return sum([r.get("capped", False) for r in instanceResults["results"]["base"]["runs"]])
+
+
+def get_resource_usage_per_stage(tRs):
+    """
+    total resources used by external tools over all runs, per pipeline stage (see resource_usage.py)
+    """
+    stages = {}
+    for results in list(tRs.genResults) + list(tRs.instanceResults):
+        if (results is None) or ("resourceUsage" not in results):
+            continue
+        for stage, usage in results["resourceUsage"].items():
+            if stage not in stages:
+                stages[stage] = {"nCalls": 0, "wallTime": 0, "cpuTime": 0, "maxRSS": 0}
+            for key in ["nCalls", "wallTime", "cpuTime"]:
+                stages[stage][key] += usage[key]
+            stages[stage]["maxRSS"] = max(stages[stage]["maxRSS"], usage["maxRSS"])
+    return stages
+
+
 def print_stats(config, tRs, tRsNoDup):
     """
     print summary statistics of an instance generation experiment
@@ -112,6 +138,7 @@ def print_stats(config, tRs, tRsNoDup):
     runStatNamesCommon = {"genSRTimeOut": "#runs with unsolved generator instances (Savile Row timeouts)",
                     "gensolverTimeOut": "#runs with unsolved generator instances (minion timeouts)",
                     "genunsat": "#runs with unsolved generator instances (UNSAT)",
+                    "genexhausted": "#runs with exhausted generator instances (all solutions already generated or being evaluated)",
                     "unwantedType": "#runs with invalid instance type"}
 
     # description of each run status that are used for graded experiments only
@@ -138,6 +165,9 @@ def print_stats(config, tRs, tRsNoDup):
     print("\n")
     print(f"Total #runs: {nFinishedRuns}")
     print(f"Total #instances generated: {nInstances}")
+    if config["instanceSetting"] == "discriminating":
+        nCapped = sum([count_capped_base_runs(r) > 0 for r in tRsNoDup.instanceResults])
+        print(f"#instances where the base solver was stopped by the time cap (--baseTimeCapRatio): {nCapped}")
     print("")
     for key, val in runStatsWithoutDuplicates.items():
         if key in runStatNamesCommon:
@@ -148,6 +178,14 @@ def print_stats(config, tRs, tRsNoDup):
             print(f"{runStatNamesDis[key]}: {val} (/{runStats[key]} runs)")
         else:
             print(f"{key}: {val} (/{runStats[key]} runs)")
+
+    # print resource usage of each pipeline stage
+    stages = get_resource_usage_per_stage(tRs)
+    if len(stages) > 0:
+        print("\nResource usage per pipeline stage (all runs):")
+        print(f"{'stage':<35} {'#calls':>8} {'wall (h)':>10} {'CPU (h)':>10} {'max RSS (MB)':>13}")
+        for stage, usage in sorted(stages.items(), key=lambda x: -x[1]["cpuTime"]):
+            print(f"{stage:<35} {usage['nCalls']:>8} {usage['wallTime'] / 3600:>10.3f} {usage['cpuTime'] / 3600:>10.3f} {usage['maxRSS']:>13.1f}")
   
 
 def extract_graded_and_discriminating_instances(runDir):
@@ -177,9 +215,7 @@ def extract_graded_and_discriminating_instances(runDir):
             # extract instance type
             tInfo.loc[:,"instanceType"] = [x["results"]["favoured"]["runs"][0]["extra"]["instanceType"] for x in tInfo.instanceResults]
             # extract MiniZinc Borda score of the favoured and the base solvers
-            print("about to try to get problem type", config["problemModel"])
-
-            problemType = get_minizinc_problem_type(config["problemModel"])
+            problemType = get_minizinc_problem_type(os.path.join(runDir, "problem.mzn"))
           
 
 
@@ -194,8 +230,10 @@ def extract_graded_and_discriminating_instances(runDir):
             tInfo.loc[:,"favouredSolverMiniZincScore"] = [extract_minizinc_score(x["results"]) for x in tInfo.instanceResults]
             tInfo.loc[:,"baseSolverMiniZincScore"] = [1 - x for x in tInfo.favouredSolverMiniZincScore]    
             tInfo.loc[:,"discriminatingPower"] = tInfo["favouredSolverMiniZincScore"] / tInfo["baseSolverMiniZincScore"]
+            # number of base solver runs stopped by the time cap (not real timeouts)
+            tInfo.loc[:,"nCappedBaseRuns"] = [count_capped_base_runs(x) for x in tInfo.instanceResults]
             # re-order columns
-            tInfo = tInfo[["instance","discriminatingPower","favouredSolverMiniZincScore","baseSolverMiniZincScore","instanceType","instanceResults","genInstance","genResults","status","iraceScore","totalTime","instanceHashValue"]]
+            tInfo = tInfo[["instance","discriminatingPower","favouredSolverMiniZincScore","baseSolverMiniZincScore","nCappedBaseRuns","instanceType","instanceResults","genInstance","genResults","status","iraceScore","totalTime","instanceHashValue"]]
             # save to a .csv file
             outFile = f"{runDir}/discriminating-instances-info.csv"
             print(f"\nInfo of discriminating instances is saved to {os.path.abspath(outFile)}")
@@ -223,7 +261,7 @@ def extract_graded_and_discriminating_instances(runDir):
             tInfo.loc[:,"instanceType"] = [x["results"]["favoured"]["runs"][0]["status"] for x in tInfo.instanceResults]
             # extract Esesnce Borda score of the favoured and the base solvers
    
-            problemType = get_essence_problem_type(config["problemModel"])
+            problemType = get_essence_problem_type(os.path.join(runDir, "problem.essence"))
 
 
             def extract_essence_score(r):
@@ -238,8 +276,10 @@ def extract_graded_and_discriminating_instances(runDir):
             tInfo.loc[:,"favouredSolverEssenceScore"] = [extract_essence_score(x["results"]) for x in tInfo.instanceResults]
             tInfo.loc[:,"baseSolverEssenceScore"] = [1 - x for x in tInfo.favouredSolverEssenceScore]    
             tInfo.loc[:,"discriminatingPower"] = tInfo["favouredSolverEssenceScore"] / tInfo["baseSolverEssenceScore"]
+            # number of base solver runs stopped by the time cap (not real timeouts)
+            tInfo.loc[:,"nCappedBaseRuns"] = [count_capped_base_runs(x) for x in tInfo.instanceResults]
             # re-order columns
-            tInfo = tInfo[["instance","discriminatingPower","favouredSolverEssenceScore","baseSolverEssenceScore","instanceType","instanceResults","genInstance","genResults","status","iraceScore","totalTime","instanceHashValue"]]
+            tInfo = tInfo[["instance","discriminatingPower","favouredSolverEssenceScore","baseSolverEssenceScore","nCappedBaseRuns","instanceType","instanceResults","genInstance","genResults","status","iraceScore","totalTime","instanceHashValue"]]
             # save to a .csv file
             outFile = f"{runDir}/discriminating-instances-info.csv"
             print(f"\nInfo of discriminating instances is saved to {os.path.abspath(outFile)}")
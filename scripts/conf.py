@@ -23,4 +23,32 @@ SCORE_BEST = -9999
 detailedOutputDir = "./detailed-output"
 
 # for minizinc experiments only: solvers where -r doesn't work when being called via minizinc
-deterministicSolvers = ["ortools"]
\ No newline at end of file
+deterministicSolvers = ["ortools"]
+
+# generator solving with the externalDedupe exclusion backend (see negative_table.py): max number of minion restarts when a generated solution is a duplicate, and how random seeds of the restarts are derived from the original seed
+# a generator instance is considered exhausted (all its solutions have already been generated) once minion has given genDedupeMaxDuplicates duplicates in a row, over all wrapper runs
+genDedupeMaxRestarts = 10
+genDedupeMaxDuplicates = 20
+genDedupeSeedStride = 100003
+genDedupeMaxSeed = 2147483647
+
+# translate generator solutions from minion to Essence in-process when the generator's domains are supported (see minion_solution.py), instead of calling Savile Row and conjure
+genNativeSolutionTranslation = True
+
+# for essence experiments only: translate each instance with Savile Row once per backend family and call the backend solver directly for each run, instead of calling conjure solve for each run (see essence_backend.py). Set by --essenceTranslationReuse
+essenceTranslationReuse = False
+# with essenceTranslationReuse: use the backend solver's CPU time (user+sys, measured by the launcher, see launcher.py) as its solving time instead of its wall-clock time, so that timings used for minTime decisions are not inflated when runs are executed in parallel
+# by default, solving times are wall-clock times, which is what Savile Row reports for runs made via conjure solve. With CPU time, all solvers used in the experiment must be called directly (see essence_backend.solverBackends)
+essenceSolverCPUTime = False
+
+# for minizinc experiments only: convert generated instances from Essence to MiniZinc in-process when their types are supported (see convert.py), instead of calling conjure. The first mznConversionValidations conversions of an experiment are checked against conjure's
+mznNativeConversion = True
+mznConversionValidations = 3
+
+# compressed store of generator artifacts (see artifact_store.py). The store is disabled when artifactStoreQuota is None
+artifactStoreQuota = None  # in MB
+artifactColdAfter = 3600  # in seconds
+
+# persistent cache of solver runs, shared between experiments (see solver_cache.py). The cache is disabled when solverCacheDir is None
+solverCacheDir = None
+solverCacheMaxSize = 1024  # in MB
@@ -1,13 +1,37 @@
 import os
+import re
 import json
 import argparse
+import tempfile
+import functools
 
 import sys
 
 scriptDir = os.path.dirname(os.path.realpath(__file__))
 sys.path.append(scriptDir)
 
+import conf
 import utils
+import model_metadata
+from utils import log
+
+# conversion of generated instances from Essence to MiniZinc
+# instances are converted natively (in this process) when all parameters have supported types, by conjure (conjure autoig --remove-aux, then conjure pretty --output-format=minizinc) otherwise
+#   - the types of the instance parameters are those of the find variables of the generator model. Auxiliary variables (with prefix "Aux") are not instance parameters and are removed
+#   - supported types: int, bool, enumerated types (converted to ints, starting from 1), matrices of those (or of sets of them), sets and relations of those
+# the native conversion is validated against conjure on the first conf.mznConversionValidations instances of an experiment. If the results of both are different, the native conversion is disabled for the rest of the experiment
+# the validation state is kept in detailed-output/mzn-conversion.json
+
+conversionStateFile = conf.detailedOutputDir + "/mzn-conversion.json"
+
+
+class UnsupportedInstance(Exception):
+    """
+    the instance can't be converted natively, conjure should be used instead
+    """
+
+    pass
+
 
 def convert_essence_instance_to_mzn(
     generatorFile, essenceParamFile, outputMznFile="default"
@@ -20,24 +44,390 @@ def convert_essence_instance_to_mzn(
     output:
         outputMznFile (str): the converted instance file in MiniZinc format
     """
-    
+
     if outputMznFile == "default":
         outputMznFile = essenceParamFile.replace(".param", ".dzn")
-        
+
+    output = None
+    state = read_conversion_state()
+    if conf.mznNativeConversion and state["enabled"]:
+        try:
+            output = convert_essence_param_to_dzn(generatorFile, essenceParamFile)
+        except UnsupportedInstance as e:
+            log(f"Instance {essenceParamFile} can't be converted natively ({e}), using conjure instead")
+        except Exception as e:
+            # the native conversion must never be less robust than conjure's: any error on unexpected input falls back to conjure
+            log(f"Native conversion of {essenceParamFile} failed ({type(e).__name__}: {e}), using conjure instead")
+        # validate the native conversion against conjure's
+        if (output is not None) and (state["nValidated"] < conf.mznConversionValidations):
+            conjureOutput = conjure_convert_essence_instance_to_mzn(essenceParamFile)
+            canonical = get_canonical_dzn(output)
+            if (canonical is not None) and (canonical == get_canonical_dzn(conjureOutput)):
+                update_conversion_state(validated=True)
+            else:
+                log(f"Native conversion of {essenceParamFile} is different from conjure's, the native conversion is disabled for this experiment.\nNative conversion:\n{output}\nConjure:\n{conjureOutput}")
+                update_conversion_state(validated=False)
+                output = conjureOutput
+
+    if output is None:
+        output = conjure_convert_essence_instance_to_mzn(essenceParamFile)
+
+    with open(outputMznFile, "wt") as f:
+        f.write(output)
+    print(f"{outputMznFile} generated")
+
+
+def conjure_convert_essence_instance_to_mzn(essenceParamFile):
+    """
+    convert an instance in Essence format to MiniZinc format using conjure, return the MiniZinc instance
+    """
     # remove auxiliary variables in the Essence instance file
     auxParamFile = essenceParamFile.replace(".param", ".auxRemoved.param")
     cmd = f"conjure autoig --remove-aux {essenceParamFile} {auxParamFile}"
     print(cmd)
     utils.run_cmd_with_assertion(cmd)
-    
+
     # convert Essence instance file to MiniZinc format
     cmd = f"conjure pretty {auxParamFile} --output-format=minizinc"
     print(cmd)
     output = utils.run_cmd_with_assertion(cmd)
     output = output.replace("Parsing as a parameter file","") # remove conjure's comment
-    with open(outputMznFile, "wt") as f:
-        f.write(output)
-    print(f"{outputMznFile} generated")
-    
+
     # remove temporary file
-    os.remove(auxParamFile)
\ No newline at end of file
+    os.remove(auxParamFile)
+    return output
+
+
+def read_conversion_state():
+    if not os.path.isfile(conversionStateFile):
+        return {"enabled": True, "nValidated": 0}
+    with open(conversionStateFile, "rt") as f:
+        return json.load(f)
+
+
+def update_conversion_state(validated):
+    state = read_conversion_state()
+    if validated:
+        state["nValidated"] += 1
+    else:
+        state["enabled"] = False
+    fd, tmpFile = tempfile.mkstemp(dir=os.path.dirname(conversionStateFile), suffix=".tmp")
+    with os.fdopen(fd, "wt") as f:
+        json.dump(state, f)
+    os.replace(tmpFile, conversionStateFile)
+
+
+### parsing of Essence ###
+
+
+def tokenize_essence(s):
+    # remove comments and the language line
+    s = "\n".join([line.split("$")[0] for line in s.split("\n") if not line.strip().startswith("language ")])
+    return re.findall(r"-->|\.\.|[0-9]+|[A-Za-z_][A-Za-z0-9_']*|`[^`]*`|\S", s)
+
+
+def parse_essence_value(tokens, i):
+    """
+    parse an Essence constant starting at tokens[i], return the value and the position of the next token
+    values are represented as tuples: ("int", v), ("bool", v), ("enum", name), ("matrix", index ranges of the first dimension or None, list of values), ("set", list of values), ("relation", list of tuples)
+    """
+    t = tokens[i]
+    if t == "-":
+        val, i = parse_essence_value(tokens, i + 1)
+        if val[0] != "int":
+            raise UnsupportedInstance(f"unexpected '-' before {val}")
+        val = ("int", -val[1])
+    elif t.isdigit():
+        val, i = ("int", int(t)), i + 1
+    elif t in ["true", "false"]:
+        val, i = ("bool", t == "true"), i + 1
+    elif t == "[":
+        lsVals, i = parse_essence_values(tokens, i + 1, [";", "]"])
+        indexRange = None
+        if tokens[i] == ";":
+            indexRange, i = parse_index_domain(tokens, i + 1)
+        if tokens[i] != "]":
+            raise UnsupportedInstance("unsupported matrix literal")
+        val, i = ("matrix", indexRange, lsVals), i + 1
+    elif t == "{":
+        lsVals, i = parse_essence_values(tokens, i + 1, ["}"])
+        val, i = ("set", lsVals), i + 1
+    elif (t == "relation") and (tokens[i + 1] == "("):
+        lsVals, i = parse_essence_values(tokens, i + 2, [")"])
+        val, i = ("relation", lsVals), i + 1
+    elif t == "(":
+        lsVals, i = parse_essence_values(tokens, i + 1, [")"])
+        val, i = ("tuple", lsVals), i + 1
+    elif re.match(r"^[A-Za-z_]", t) and (tokens[i + 1] != "("):
+        val, i = ("enum", t), i + 1
+    else:
+        raise UnsupportedInstance(f"unsupported value starting with '{t}'")
+    # skip type annotations, e.g., {} : `set of int`
+    if (i + 1 < len(tokens)) and (tokens[i] == ":") and tokens[i + 1].startswith("`"):
+        i += 2
+    return val, i
+
+
+def parse_essence_values(tokens, i, lsEnds):
+    lsVals = []
+    while tokens[i] not in lsEnds:
+        val, i = parse_essence_value(tokens, i)
+        lsVals.append(val)
+        if tokens[i] == ",":
+            i += 1
+    return lsVals, i
+
+
+def parse_index_domain(tokens, i):
+    """
+    parse the index domain of a matrix literal, e.g., int(0..3), return its range (lb, ub) and the position of the next token
+    """
+    if (tokens[i] != "int") or (tokens[i + 1] != "("):
+        raise UnsupportedInstance("unsupported matrix index domain")
+    i += 2
+    lsVals = []
+    while tokens[i] != ")":
+        lb, i = parse_essence_value(tokens, i)
+        ub = lb
+        if tokens[i] == "..":
+            ub, i = parse_essence_value(tokens, i + 1)
+        lsVals.extend(range(lb[1], ub[1] + 1))
+        if tokens[i] == ",":
+            i += 1
+    if (len(lsVals) > 0) and (lsVals != list(range(lsVals[0], lsVals[-1] + 1))):
+        raise UnsupportedInstance("matrix index domain is not a range")
+    if len(lsVals) == 0:
+        return (1, 0), i + 1
+    return (lsVals[0], lsVals[-1]), i + 1
+
+
+def read_essence_param(essenceParamFile):
+    """
+    read the lettings of an Essence parameter file, return a dictionary {name: value}. Auxiliary variables (with prefix "Aux") are removed
+    """
+    with open(essenceParamFile, "rt") as f:
+        tokens = tokenize_essence(f.read())
+    tokens.append("")
+    params = {}
+    i = 0
+    while tokens[i] != "":
+        if (tokens[i] != "letting") or (tokens[i + 2] != "be"):
+            raise UnsupportedInstance(f"unexpected '{tokens[i]}'")
+        name = tokens[i + 1]
+        if name.startswith("Aux"):
+            # auxiliary variables of the generator are not instance parameters, their values (which can be of any type) are skipped
+            i += 3
+            depth = 0
+            while (tokens[i] != "") and not ((tokens[i] == "letting") and (depth == 0)):
+                depth += (tokens[i] in "([{") - (tokens[i] in ")]}")
+                i += 1
+            continue
+        params[name], i = parse_essence_value(tokens, i + 3)
+    return params
+
+
+def split_top_level(s, sep=","):
+    lsParts = []
+    depth = 0
+    current = ""
+    for c in s:
+        depth += (c in "([{") - (c in ")]}")
+        if (c == sep) and (depth == 0):
+            lsParts.append(current.strip())
+            current = ""
+        else:
+            current += c
+    lsParts.append(current.strip())
+    return lsParts
+
+
+@functools.lru_cache(maxsize=None)
+def read_generator_declarations(generatorFile):
+    """
+    read the find variables of a generator model, return a dictionary {name: domain}, a dictionary of domain lettings {name: domain} and a dictionary of enumerated types {name: list of values}
+    """
+    declarations = model_metadata.read_essence_declarations(generatorFile)
+    return declarations["find"], declarations["domainLettings"], declarations["enums"]
+
+
+def get_type(domain, domainLettings, enums):
+    """
+    type of the values of an Essence domain: ("int",), ("bool",), ("enum", values), ("matrix", nDims, inner type), ("set", inner type), ("relation", [inner types])
+    """
+    domain = domain.strip()
+    m = re.match(r"^([A-Za-z_][A-Za-z0-9_]*)\s*(.*)$", domain)
+    if m is None:
+        raise UnsupportedInstance(f"unsupported domain {domain}")
+    head, rest = m.group(1), m.group(2).strip()
+    if head == "int":
+        return ("int",)
+    if head == "bool":
+        return ("bool",)
+    if (head in enums) and (rest == ""):
+        return ("enum", enums[head])
+    if (head in domainLettings) and (rest == ""):
+        return get_type(domainLettings[head], domainLettings, enums)
+    if head == "matrix":
+        m = re.match(r"^indexed\s+by\s*\[(.*?)\]\s*of\s+(.*)$", rest)
+        if m is None:
+            raise UnsupportedInstance(f"unsupported domain {domain}")
+        nDims = len(split_top_level(m.group(1)))
+        inner = get_type(m.group(2), domainLettings, enums)
+        if inner[0] == "matrix":  # matrix indexed by [A] of matrix indexed by [B] is the same as matrix indexed by [A, B]
+            return ("matrix", nDims + inner[1], inner[2])
+        if inner[0] == "relation":
+            raise UnsupportedInstance(f"unsupported domain {domain}")
+        return ("matrix", nDims, inner)
+    if head in ["set", "relation"]:
+        # remove attributes, e.g., set (minSize 1) of int
+        if rest.startswith("("):
+            rest = rest[rest.index(")") + 1 :].strip()
+        if not rest.startswith("of "):
+            raise UnsupportedInstance(f"unsupported domain {domain}")
+        rest = rest[len("of ") :].strip()
+        if head == "set":
+            inner = get_type(rest, domainLettings, enums)
+            if inner[0] not in ["int", "bool", "enum"]:
+                raise UnsupportedInstance(f"unsupported domain {domain}")
+            return ("set", inner)
+        if not (rest.startswith("(") and rest.endswith(")")):
+            raise UnsupportedInstance(f"unsupported domain {domain}")
+        lsInner = [get_type(d, domainLettings, enums) for d in split_top_level(rest[1:-1], "*")]
+        if any([inner[0] not in ["int", "bool", "enum"] for inner in lsInner]):
+            raise UnsupportedInstance(f"unsupported domain {domain}")
+        return ("relation", lsInner)
+    raise UnsupportedInstance(f"unsupported domain {domain}")
+
+
+### writing of MiniZinc ###
+
+
+def to_dzn_scalar(val, valType):
+    if (valType[0] == "int") and (val[0] == "int"):
+        return str(val[1])
+    if (valType[0] == "bool") and (val[0] == "bool"):
+        return "true" if val[1] else "false"
+    if valType[0] == "enum":
+        if val[0] == "int":
+            return str(val[1])
+        if (val[0] == "enum") and (val[1] in valType[1]):
+            return str(valType[1].index(val[1]) + 1)
+    raise UnsupportedInstance(f"value {val} doesn't match type {valType}")
+
+
+def to_dzn_set(val, valType):
+    if val[0] != "set":
+        raise UnsupportedInstance(f"value {val} doesn't match type {valType}")
+    lsVals = [to_dzn_scalar(v, valType[1]) for v in val[1]]
+    if valType[1][0] != "bool":
+        lsVals = sorted(lsVals, key=int)
+    return "{" + ", ".join(lsVals) + "}"
+
+
+def flatten_matrix(val, nDims, lsRanges, depth=0):
+    """
+    flatten a (nested) matrix value, record the index range of each dimension in lsRanges
+    """
+    if val[0] != "matrix":
+        raise UnsupportedInstance(f"value {val} is not a matrix")
+    indexRange = val[1] or (1, len(val[2]))
+    if indexRange[1] - indexRange[0] + 1 != len(val[2]):
+        raise UnsupportedInstance("size of a matrix literal doesn't match its index domain")
+    if len(lsRanges) <= depth:
+        lsRanges.append(indexRange)
+    elif lsRanges[depth] != indexRange:
+        raise UnsupportedInstance("matrix is not rectangular")
+    if depth + 1 == nDims:
+        return list(val[2])
+    lsFlat = []
+    for v in val[2]:
+        lsFlat.extend(flatten_matrix(v, nDims, lsRanges, depth + 1))
+    return lsFlat
+
+
+def to_dzn_value(val, valType):
+    if valType[0] in ["int", "bool", "enum"]:
+        return to_dzn_scalar(val, valType)
+    if valType[0] == "set":
+        return to_dzn_set(val, valType)
+    if valType[0] == "matrix":
+        nDims, inner = valType[1], valType[2]
+        lsRanges = []
+        lsFlat = flatten_matrix(val, nDims, lsRanges)
+        if len(lsRanges) < nDims:  # empty matrix
+            return "[]"
+        lsFlat = [to_dzn_value(v, inner) for v in lsFlat]
+        sRanges = ", ".join([f"{lb}..{ub}" for lb, ub in lsRanges])
+        return f"array{nDims}d({sRanges}, [" + ", ".join(lsFlat) + "])"
+    if valType[0] == "relation":
+        if val[0] != "relation":
+            raise UnsupportedInstance(f"value {val} doesn't match type {valType}")
+        arity = len(valType[1])
+        lsFlat = []
+        for t in val[1]:
+            if (t[0] != "tuple") or (len(t[1]) != arity):
+                raise UnsupportedInstance(f"value {t} doesn't match type {valType}")
+            lsFlat.extend([to_dzn_scalar(v, innerType) for v, innerType in zip(t[1], valType[1])])
+        return f"array2d(1..{len(val[1])}, 1..{arity}, [" + ", ".join(lsFlat) + "])"
+    raise UnsupportedInstance(f"unsupported type {valType}")
+
+
+def convert_essence_param_to_dzn(generatorFile, essenceParamFile):
+    """
+    convert an instance in Essence format to MiniZinc format natively, return the MiniZinc instance
+    raise UnsupportedInstance if the instance can't be converted
+    """
+    finds, domainLettings, enums = read_generator_declarations(generatorFile)
+    params = read_essence_param(essenceParamFile)
+    lsLines = []
+    for name, val in params.items():
+        if name not in finds:
+            raise UnsupportedInstance(f"{name} is not a variable of the generator")
+        valType = get_type(finds[name], domainLettings, enums)
+        lsLines.append(f"{name} = {to_dzn_value(val, valType)};")
+    return "\n".join(lsLines) + "\n"
+
+
+### comparison of MiniZinc instances ###
+
+
+def get_canonical_dzn_value(s):
+    """
+    canonical form of a dzn value (without spaces), so that equivalent values written differently are equal, e.g., [1, 2] and array1d(1..2, [1, 2])
+    """
+    m = re.match(r"^array([0-9])d\((.*)\)$", s)
+    if m:
+        lsParts = split_top_level(m.group(2))
+        lsRanges = tuple([tuple([int(v) for v in r.split("..")]) for r in lsParts[:-1]])
+        return ("array", lsRanges, get_canonical_dzn_value(lsParts[-1])[2])
+    if s.startswith("[|"):  # 2d array
+        lsRows = [r for r in s[2:-2].split("|")]
+        lsVals = [get_canonical_dzn_value(v) for r in lsRows for v in split_top_level(r) if v != ""]
+        nRows = len(lsRows)
+        return ("array", ((1, nRows), (1, len(lsVals) // max(1, nRows))), tuple(lsVals))
+    if s.startswith("["):
+        lsVals = [get_canonical_dzn_value(v) for v in split_top_level(s[1:-1]) if v != ""]
+        return ("array", ((1, len(lsVals)),), tuple(lsVals))
+    if s.startswith("{"):
+        return ("set", frozenset([get_canonical_dzn_value(v) for v in split_top_level(s[1:-1]) if v != ""]))
+    m = re.match(r"^(-?[0-9]+)\.\.(-?[0-9]+)$", s)
+    if m:
+        return ("set", frozenset([str(v) for v in range(int(m.group(1)), int(m.group(2)) + 1)]))
+    return s
+
+
+def get_canonical_dzn(output):
+    """
+    canonical form of a dzn instance: {name: canonical value}, or None if it can't be parsed
+    """
+    lsStatements = [st for st in re.sub(r"%[^\n]*", "", output).split(";") if st.strip() != ""]
+    canonical = {}
+    for st in lsStatements:
+        if "=" not in st:
+            return None
+        name, val = st.split("=", 1)
+        try:
+            canonical[name.strip()] = get_canonical_dzn_value(re.sub(r"\s+", "", val))
+        except (ValueError, IndexError):
+            return None
+    return canonical
@@ -0,0 +1,171 @@
+import os
+import sys
+import glob
+import time
+import fcntl
+import resource
+
+scriptDir = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(scriptDir)
+
+from utils import log
+
+# CPU affinity allocator for wrapper runs executed in parallel (--pinCores)
+# - the CPUs available to AutoIG are split into nCores slots, one per wrapper run that irace (or the batch target runner / evaluation worker) can execute at the same time
+# - CPUs are ordered by NUMA node, then by physical core (hyper-threads of the same core are kept together), so that a slot's CPUs are close to each other and, whenever the slot size allows it, on the same NUMA node
+# - a run takes a free slot by locking its lock file (detailed-output/core-slots/slot-<i>.lock). The lock is held until the run's process exits, so it's also released when the run is killed
+# - the run's process is then pinned to the slot's CPUs with sched_setaffinity, which is inherited by all processes it starts (conjure, Savile Row, solvers, ...)
+# - pinning and contention metrics (slot waiting time, number of busy slots, load average, involuntary context switches of the run's tools) are logged and saved under "pinning" in the run's results
+# Savile Row calls made on the persistent service (--SRServer) are executed by the servers, outside of the runs' CPU sets
+
+# max time (in seconds) a run waits for a free slot before running without pinning
+MAX_SLOT_WAIT = 60
+
+slotDir = "./detailed-output/core-slots"
+
+# lock file of the slot held by the current process
+slotLockFile = None
+
+# involuntary context switches of the run's tools when the run was pinned
+startContextSwitches = 0
+
+
+def read_cpu_list(fn):
+    """
+    read a list of CPUs written as in /sys (e.g., "0-3,8,10-11")
+    """
+    lsCpus = []
+    with open(fn, "rt") as f:
+        for part in f.read().strip().split(","):
+            if part == "":
+                continue
+            if "-" in part:
+                lb, ub = part.split("-")
+                lsCpus.extend(range(int(lb), int(ub) + 1))
+            else:
+                lsCpus.append(int(part))
+    return lsCpus
+
+
+def get_numa_nodes():
+    """
+    NUMA node of each CPU, {cpu: node}. All CPUs are on node 0 when the topology is not available
+    """
+    cpuNodes = {}
+    for nodeDir in glob.glob("/sys/devices/system/node/node[0-9]*"):
+        node = int(os.path.basename(nodeDir)[len("node") :])
+        try:
+            for cpu in read_cpu_list(os.path.join(nodeDir, "cpulist")):
+                cpuNodes[cpu] = node
+        except OSError:
+            continue
+    return cpuNodes
+
+
+def get_core_id(cpu):
+    # hyper-threads of the same physical core have the same list of siblings, its first element identifies the core
+    fn = f"/sys/devices/system/cpu/cpu{cpu}/topology/thread_siblings_list"
+    try:
+        return read_cpu_list(fn)[0]
+    except (OSError, IndexError):
+        return cpu
+
+
+def get_ordered_cpus():
+    """
+    CPUs available to the current process, ordered by NUMA node, then by physical core
+    """
+    cpuNodes = get_numa_nodes()
+    return sorted(os.sched_getaffinity(0), key=lambda cpu: (cpuNodes.get(cpu, 0), get_core_id(cpu), cpu))
+
+
+def get_slots(nSlots):
+    """
+    split the available CPUs into nSlots slots of the same size (remaining CPUs are not used). Slots share CPUs if there are fewer CPUs than slots
+    """
+    lsCpus = get_ordered_cpus()
+    slotSize = max(1, len(lsCpus) // nSlots)
+    return [lsCpus[(i * slotSize) % len(lsCpus) : (i * slotSize) % len(lsCpus) + slotSize] for i in range(nSlots)]
+
+
+def count_busy_slots(nSlots):
+    nBusy = 0
+    for i in range(nSlots):
+        with open(os.path.join(slotDir, f"slot-{i}.lock"), "at") as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                nBusy += 1
+    return nBusy
+
+
+def acquire_slot(nSlots):
+    """
+    lock a free slot, wait for one if all of them are busy
+    return the slot index, or None if no slot is free after MAX_SLOT_WAIT seconds
+    """
+    global slotLockFile
+    os.makedirs(slotDir, exist_ok=True)
+    start = time.time()
+    delay = 0.01
+    while True:
+        for i in range(nSlots):
+            f = open(os.path.join(slotDir, f"slot-{i}.lock"), "at")
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                f.close()
+                continue
+            slotLockFile = f
+            return i
+        if time.time() - start > MAX_SLOT_WAIT:
+            return None
+        time.sleep(delay)
+        delay = min(delay * 2, 1)
+
+
+def pin_current_run(nSlots, nCoresPerEvaluation=1):
+    """
+    pin the current process (and all processes it will start) to the CPUs of a free slot
+    return pinning information to be saved in the run's results, or None if pinning isn't supported on this platform
+    """
+    global startContextSwitches
+    if not hasattr(os, "sched_setaffinity"):
+        log("WARNING: CPU pinning (--pinCores) is not supported on this platform")
+        return None
+    slots = get_slots(nSlots)
+    if len(os.sched_getaffinity(0)) < nSlots:
+        log(f"WARNING: only {len(os.sched_getaffinity(0))} CPU(s) available for {nSlots} parallel runs (--nCores), CPU slots are shared")
+    start = time.time()
+    slot = acquire_slot(nSlots)
+    info = {
+        "slot": slot,
+        "slotWaitTime": round(time.time() - start, 3),
+        "busySlots": count_busy_slots(nSlots),
+        "loadAverage": round(os.getloadavg()[0], 2),
+    }
+    if slot is None:
+        log(f"WARNING: no free CPU slot after {MAX_SLOT_WAIT}s, the run is not pinned")
+        return info
+    cpus = slots[slot]
+    os.sched_setaffinity(0, cpus)
+    cpuNodes = get_numa_nodes()
+    info["cpus"] = cpus
+    info["numaNodes"] = sorted(set([cpuNodes.get(cpu, 0) for cpu in cpus]))
+    if nCoresPerEvaluation > len(cpus):
+        log(f"WARNING: {nCoresPerEvaluation} parallel runs per evaluation (--nCoresPerEvaluation) share {len(cpus)} CPU(s)")
+    startContextSwitches = resource.getrusage(resource.RUSAGE_CHILDREN).ru_nivcsw
+    log(
+        f"Pinned to CPU slot {slot}: CPUs {cpus} (NUMA node(s) {info['numaNodes']}), waited {info['slotWaitTime']}s for the slot, {info['busySlots']}/{nSlots} slots busy, load average: {info['loadAverage']}"
+    )
+    return info
+
+
+def get_contention_metrics():
+    """
+    contention metrics of the run since it was pinned: involuntary context switches of its tools, and the current load average
+    """
+    return {
+        "involuntaryContextSwitches": resource.getrusage(resource.RUSAGE_CHILDREN).ru_nivcsw - startContextSwitches,
+        "loadAverageAtEnd": round(os.getloadavg()[0], 2),
+    }
@@ -0,0 +1,308 @@
+import os
+import sys
+import json
+import fcntl
+
+scriptDir = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(scriptDir)
+
+import conf
+import solver_cache
+from utils import log, delete_file
+from launcher import run_limited, get_wall_time_limit
+from file_wait import wait_for_file
+from essence_pipeline_utils import (
+    call_conjure_solve,
+    conjure_translate_parameter,
+    get_essence_problem_type,
+    get_minion_status,
+    get_solve_cache_key,
+    make_solver_options,
+    parse_SR_info_file,
+    run_savilerow,
+)
+
+# solving an Essence instance with Savile Row called once per (instance, backend family), instead of once per run as with conjure solve
+# - all runs on the same instance whose solvers take the same input format (a backend family) share one Savile Row translation: detailed-output/<problem>-<instance>-<family>.<ext>, and the SR info file of the translation
+# - for each run (solver, seed), the backend solver is called directly on the shared file, and a SR-like info file is written with the translation's SR time and the run's solver time/status, so that results are read the same way as for conjure solve (parse_SR_info_file)
+# - parallel runs on the same instance (see parallel_utils.py) wait for each other via a lock file, so the translation is done only once
+# - solvers not listed in solverBackends, and SAT solvers on optimisation problems (Savile Row then calls the SAT solver several times to optimise), are still solved with conjure solve
+# the translations of an instance are removed by delete_instance_translations at the end of its evaluation
+
+# backend families: Savile Row flags to write the solver input file, and the file's extension (same names as conjure's)
+backendFamilies = {
+    "minion": {"SRFlags": "-minion -out-minion", "ext": ".eprime-minion"},
+    "sat": {"SRFlags": "-sat -out-sat", "ext": ".eprime-dimacs"},
+    # flatzinc files written by Savile Row are specific to each solver
+    "fzn-chuffed": {"SRFlags": "-chuffed -out-flatzinc", "ext": ".eprime-param.fzn"},
+    "fzn-gecode": {"SRFlags": "-gecode -out-flatzinc", "ext": ".eprime-param.fzn"},
+}
+
+# backend family of each solver supported by the direct pipeline, and the command to run it
+solverBackends = {
+    "minion": {"family": "minion", "command": "minion"},
+    "glucose": {"family": "sat", "command": "glucose"},
+    "glucose-syrup": {"family": "sat", "command": "glucose-syrup"},
+    "lingeling": {"family": "sat", "command": "lingeling"},
+    "cadical": {"family": "sat", "command": "cadical"},
+    "kissat": {"family": "sat", "command": "kissat"},
+    "chuffed": {"family": "fzn-chuffed", "command": "fzn-chuffed"},
+    "gecode": {"family": "fzn-gecode", "command": "fzn-gecode"},
+}
+
+MEMOUT_STRINGS = ["Error: maximum memory exceeded", "Out of memory", "Memory exhausted!", "std::bad_alloc"]
+
+
+def clamp_solver_time(status, solverTime, solverTimeLimit):
+    """
+    timeouts are recorded with the full time limit, whatever time the solver was stopped at, and no run is recorded with more than the time limit, so that runs are ranked the same way whether their time is measured by Savile Row (conjure solve) or by the launcher (backend solver called directly)
+    """
+    if (solverTimeLimit > 0) and ((status == "solverTimeOut") or (solverTime > solverTimeLimit)):
+        return solverTimeLimit
+    return solverTime
+
+
+def get_backend_family(essenceModelFile, solver):
+    """
+    backend family used to solve an instance with a solver, or None if the run must go through conjure solve
+    """
+    if (not conf.essenceTranslationReuse) or (solver not in solverBackends):
+        return None
+    family = solverBackends[solver]["family"]
+    if (family == "sat") and (get_essence_problem_type(essenceModelFile) != "SAT"):
+        return None
+    return family
+
+
+def get_instance_base_file(eprimeModelFile, instFile):
+    return eprimeModelFile.replace(".eprime", "") + "-" + os.path.basename(instFile).replace(".param", "")
+
+
+def translate_instance(eprimeModelFile, instFile, family, SRTimeLimit, SRFlags):
+    """
+    translate an instance for a backend family with conjure and Savile Row, only once per (instance, family)
+    return the translation status (SRok/SRTimeOut/SRMemOut), the Savile Row info file of the translation, the solver input file, and the time spent on waiting for the info file
+    """
+    instBaseFile = get_instance_base_file(eprimeModelFile, instFile)
+    transBaseFile = instBaseFile + "-" + family
+    transFile = transBaseFile + backendFamilies[family]["ext"]
+    transInfoFile = transBaseFile + ".eprime-info"
+    transResultFile = transBaseFile + ".json"
+    with open(transBaseFile + ".lock", "at") as lockFile:
+        fcntl.flock(lockFile, fcntl.LOCK_EX)
+        if os.path.isfile(transResultFile):
+            with open(transResultFile, "rt") as f:
+                transResults = json.load(f)
+            log(f"Reusing translation {transFile} of {instFile}")
+            return transResults["status"], transInfoFile, transFile, 0
+
+        # the Essence Prime instance is shared by all families. If conjure can't translate it within Savile Row's time limit, the translation is counted as a Savile Row timeout
+        eprimeParamFile = instBaseFile + ".eprime-param"
+        paramTranslated = True
+        with open(eprimeParamFile + ".lock", "at") as paramLockFile:
+            fcntl.flock(paramLockFile, fcntl.LOCK_EX)
+            if not os.path.isfile(eprimeParamFile):
+                paramTranslated = conjure_translate_parameter(
+                    eprimeModelFile, instFile, eprimeParamFile, timelimit=SRTimeLimit
+                )
+
+        status = "SRok"
+        waitTime = 0
+        if not paramTranslated:
+            status = "SRTimeOut"
+        else:
+            cmd = (
+                "savilerow "
+                + eprimeModelFile
+                + " "
+                + eprimeParamFile
+                + " "
+                + backendFamilies[family]["SRFlags"]
+                + " "
+                + transFile
+                + " -out-info "
+                + transInfoFile
+            )
+            if SRTimeLimit > 0:
+                cmd += " -timelimit " + str(int(SRTimeLimit))
+            cmd += " " + SRFlags
+            log(cmd)
+            cmdOutput, returnCode = run_savilerow(cmd, SRTimeLimit)
+
+            if (
+                ("GC overhead limit exceeded" in cmdOutput)
+                or ("OutOfMemoryError" in cmdOutput)
+                or ("insufficient memory" in cmdOutput)
+            ):
+                status = "SRMemOut"
+            elif "Savile Row timed out" in cmdOutput:
+                status = "SRTimeOut"
+            elif returnCode != 0:
+                raise Exception(cmdOutput)
+            else:
+                waitTime = wait_for_file(transInfoFile, timeout=60)
+                if parse_SR_info_file(transInfoFile)[0] == "SRTimeOut":
+                    status = "SRTimeOut"
+
+        with open(transResultFile, "wt") as f:
+            json.dump({"status": status}, f)
+    return status, transInfoFile, transFile, waitTime
+
+
+def get_backend_solver_status(family, cmdOutput, returnCode, essenceModelFile):
+    """
+    status of a backend solver run: sat/unsat, or None when the solver stopped without an answer (e.g., timeout)
+    raise an exception if the solver crashed
+    """
+    if any([s in cmdOutput for s in MEMOUT_STRINGS]):
+        return "solverMemOut"
+    if family == "minion":
+        return get_minion_status(cmdOutput, returnCode)
+    if family == "sat":
+        # SAT competition convention: return code 10 for SAT, 20 for UNSAT
+        if returnCode == 10:
+            return "sat"
+        if returnCode == 20:
+            return "unsat"
+        if ("s UNKNOWN" in cmdOutput) or ("s INDETERMINATE" in cmdOutput) or (returnCode == 0):
+            return None
+        raise Exception(cmdOutput)
+    # flatzinc solvers
+    if returnCode != 0:
+        raise Exception(cmdOutput)
+    if "=====UNSATISFIABLE=====" in cmdOutput:
+        return "unsat"
+    # the search is complete only when "==========" is printed for an optimisation problem
+    if ("----------" in cmdOutput) and (get_essence_problem_type(essenceModelFile) == "SAT"):
+        return "sat"
+    if "==========" in cmdOutput:
+        return "sat"
+    return None
+
+
+def write_run_info_file(infoFile, transInfoFile, status, solverTime):
+    """
+    SR-like info file of a run: Savile Row fields from the translation's info file, solver fields from the run
+    """
+    lsLines = []
+    if os.path.isfile(transInfoFile):
+        with open(transInfoFile, "rt") as f:
+            lsLines = [l.rstrip("\n") for l in f if l.startswith("SavileRow")]
+    lsLines.extend(
+        [
+            "SolverTotalTime:" + str(solverTime),
+            "SolverSatisfiable:" + str(int(status == "sat")),
+            "SolverTimeOut:" + str(int(status in [None, "solverTimeOut"])),
+            "SolverMemOut:" + str(int(status == "solverMemOut")),
+            "SolverNodeOut:0",
+        ]
+    )
+    with open(infoFile, "wt") as f:
+        f.write("\n".join(lsLines) + "\n")
+
+
+def solve_essence_instance(
+    essenceModelFile: str,
+    eprimeModelFile: str,
+    instFile: str,
+    solver: str,
+    SRTimeLimit,
+    SRFlags,
+    solverTimeLimit,
+    solverFlags,
+    seed,
+    runTag=None,
+    memLimit=None,
+):
+    """
+    solve an instance, with the same arguments and results (status, SR time, solver time, extra) as call_conjure_solve
+    Savile Row is called once per (instance, backend family), and the backend solver is called directly for each run
+        - memLimit: memory limit of the backend solver (in MB), enforced by the launcher
+    when conf.essenceSolverCPUTime is True, the solver time is the CPU time of the backend solver, otherwise its wall-clock time (same as the time reported by Savile Row for runs made via conjure solve). CPU time can't be told apart from conjure's and Savile Row's in a conjure solve call, so all runs must then be solved directly.
+    when conf.essenceTranslationReuse is True, timeouts are recorded with the full time limit for runs made either way (see clamp_solver_time). Otherwise, results are the same as call_conjure_solve's extra contains both (cpuTime, wallTime), the solver's peak memory (peakRSS), and the time spent on waiting for the translation's SR info file (waitTime)
+    """
+    family = get_backend_family(essenceModelFile, solver)
+    if family is None:
+        # all runs of an experiment are timed the same way, so that minTime decisions compare the same kind of times
+        assert not conf.essenceSolverCPUTime, (
+            f"ERROR: solver {solver} can't be called directly on this problem, its runs can't be timed with CPU time (conf.essenceSolverCPUTime)"
+        )
+        status, SRTime, solverTime, extra = call_conjure_solve(
+            essenceModelFile, eprimeModelFile, instFile, solver, SRTimeLimit, SRFlags, solverTimeLimit, solverFlags, seed, runTag=runTag
+        )
+        if conf.essenceTranslationReuse:
+            solverTime = clamp_solver_time(status, solverTime, solverTimeLimit)
+        return status, SRTime, solverTime, extra
+
+    print()
+
+    # reuse results of an identical run from the persistent solver run cache (if enabled)
+    cacheKey = get_solve_cache_key(
+        essenceModelFile, eprimeModelFile, instFile, solver, SRTimeLimit, SRFlags, solverTimeLimit, solverFlags, seed,
+        backendFamily=family, solverTimeMeasure="cpu" if conf.essenceSolverCPUTime else "wall",
+    )
+    cachedResults = solver_cache.lookup(cacheKey)
+    if cachedResults is not None:
+        status, SRTime, solverTime = cachedResults
+        return status, SRTime, solverTime, {}
+
+    transStatus, transInfoFile, transFile, waitTime = translate_instance(
+        eprimeModelFile, instFile, family, SRTimeLimit, SRFlags
+    )
+    if transStatus != "SRok":
+        SRTime = 0
+        if os.path.isfile(transInfoFile):
+            SRTime = parse_SR_info_file(transInfoFile)[1]
+        solver_cache.store(cacheKey, [transStatus, SRTime, 0])
+        return transStatus, SRTime, 0, {"waitTime": waitTime}
+
+    # call the backend solver
+    solverOptionStr, lsTempFiles = make_solver_options(
+        solver, solverTimeLimit, solverFlags or "", seed, instFile
+    )
+    cmd = solverBackends[solver]["command"] + " " + solverOptionStr + " " + transFile
+    print("\nCalling " + solver)
+    log(cmd)
+    cmdOutput, returnCode, usage = run_limited(
+        cmd, wallTimeLimit=get_wall_time_limit(solverTimeLimit), memLimit=memLimit
+    )
+    log(cmdOutput)
+    delete_file(lsTempFiles)
+    solverTime = usage["cpuTime"] if conf.essenceSolverCPUTime else usage["wallTime"]
+    extra = {"cpuTime": usage["cpuTime"], "wallTime": usage["wallTime"], "peakRSS": usage["peakRSS"], "waitTime": waitTime}
+    if usage["memOut"]:
+        runStatus = "solverMemOut"
+    elif usage["timeOut"]:
+        runStatus = None
+    else:
+        runStatus = get_backend_solver_status(family, cmdOutput, returnCode, essenceModelFile)
+
+    # SR-like info file of the run, named as with conjure solve
+    infoFile = (
+        get_instance_base_file(eprimeModelFile, instFile)
+        + "-seed_"
+        + str(seed)
+        + "-"
+        + solver
+        + ".eprime-info"
+    )
+    write_run_info_file(infoFile, transInfoFile, runStatus, solverTime)
+    status, SRTime, solverTime = parse_SR_info_file(infoFile, timelimit=solverTimeLimit)
+    solverTime = clamp_solver_time(status, solverTime, solverTimeLimit)
+
+    solver_cache.store(cacheKey, [status, SRTime, solverTime])
+    return status, SRTime, solverTime, extra
+
+
+def delete_instance_translations(eprimeModelFile, instFile):
+    """
+    remove the shared translations of an instance once its evaluation is finished (SR info files of the translations are kept)
+    """
+    instBaseFile = get_instance_base_file(eprimeModelFile, instFile)
+    lsFiles = [instBaseFile + ".eprime-param", instBaseFile + ".eprime-param.lock"]
+    for family, info in backendFamilies.items():
+        transBaseFile = instBaseFile + "-" + family
+        lsFiles.extend(
+            [transBaseFile + info["ext"], transBaseFile + ".json", transBaseFile + ".lock"]
+        )
+    delete_file(lsFiles)
@@ -2,12 +2,19 @@ import os
 import sys
 import time
 import glob
-import json
+import shutil
+import shlex
 
 scriptDir = os.path.dirname(os.path.realpath(__file__))
 sys.path.append(scriptDir)
 
-from utils import log, read_file, search_string, run_cmd, delete_file
+import solver_cache
+import savilerow_server
+import model_metadata
+import resource_usage
+from file_wait import wait_for_file
+from launcher import run_limited, get_wall_time_limit
+from utils import log, read_file, search_string, delete_file
 
 solverInfo = {}
 solverInfo["cplex"] = {
@@ -75,40 +82,18 @@ solverInfo["or-tools"] = {
 def get_essence_problem_type(modelFile: str):
     """
     Read an Essence model and return its type (MIN/MAX/SAT)
-    Uses the conjure pretty print feature, then interprets the generated JSON
+    The type is computed once and saved with the model's metadata (see model_metadata.py)
+    """
+    return model_metadata.get_model_metadata(modelFile)["problemType"]
+
+
+
+def conjure_translate_parameter(eprimeModelFile, paramFile, eprimeParamFile, timelimit=None):
+    """
+    translate an Essence parameter file into Essence Prime, via the launcher
+        - timelimit: in seconds (the Savile Row time limit of the translation the parameter file is used for), 0 or None for no limit
+    return False if conjure was stopped because of the time limit (no Essence Prime parameter file is written), True otherwise
     """
-    cmd = f"conjure pretty {modelFile} --output-format=astjson"
-    results_dict = run_cmd(cmd)
-    try:
-        parsed_json = json.loads(results_dict[0])
-    except json.JSONDecodeError as e:
-        print("Failed to parse JSON:", e)
-        exit()
-
-    # Now check for the Maximising objective recursively
-    def check_type(data):
-        if isinstance(data, dict):
-            for key, value in data.items():
-                if key == "Objective" and isinstance(value, list):
-                    if value[0] == "Maximising":
-                        return "MAX"
-                    elif value[0] == "Minimising":
-                        return "MIN"
-                result = check_type(value)
-                if result in ("MAX", "MIN"):
-                    return result
-        elif isinstance(data, list):
-            for item in data:
-                result = check_type(item)
-                if result in ("MAX", "MIN"):
-                    return result
-        return "SAT"
-
-    return check_type(parsed_json)
-
-
-
-def conjure_translate_parameter(eprimeModelFile, paramFile, eprimeParamFile):
     cmd = (
         "conjure translate-parameter "
         + "--eprime="
@@ -119,10 +104,32 @@ def conjure_translate_parameter(eprimeModelFile, paramFile, eprimeParamFile):
         + eprimeParamFile
     )
     log(cmd)
-    cmdOutput, returnCode = run_cmd(cmd)
+    cmdOutput, returnCode, usage = run_limited(cmd, wallTimeLimit=get_wall_time_limit(timelimit))
+    log(f"conjure translate-parameter: {usage['wallTime']:.3f}s, CPU time: {usage['cpuTime']:.3f}s, peak memory: {usage['peakRSS']:.1f}MB")
 
+    if usage["timeOut"]:
+        delete_file(eprimeParamFile)
+        return False
     if returnCode != 0:
         raise Exception(cmdOutput)
+    return True
+
+
+def run_savilerow(cmd, timelimit=None):
+    """
+    run a savilerow command on the persistent Savile Row service if a server is available (see savilerow_server.py), via the command line otherwise
+        - timelimit: Savile Row's own time limit (-timelimit, in seconds). Command line calls are stopped by the launcher if Savile Row doesn't stop by itself shortly after it
+    return its output and return code, same as run_cmd
+    """
+    start = time.time()
+    result = savilerow_server.call(shlex.split(cmd)[1:])
+    if result is None:
+        cmdOutput, returnCode, usage = run_limited(cmd, wallTimeLimit=get_wall_time_limit(timelimit))
+        log(f"Savile Row call via command line: {usage['wallTime']:.3f}s, CPU time: {usage['cpuTime']:.3f}s, peak memory: {usage['peakRSS']:.1f}MB")
+        return cmdOutput, returnCode
+    resource_usage.record("savilerow (server)", time.time() - start)
+    log(f"Savile Row call via server: {time.time() - start:.3f}s")
+    return result
 
 
 def savilerow_translate(
@@ -147,7 +154,7 @@ def savilerow_translate(
     log(cmd)
 
     start = time.time()
-    cmdOutput, returnCode = run_cmd(cmd)
+    cmdOutput, returnCode = run_savilerow(cmd, timelimit)
     SRTime = time.time() - start
 
     status = "SRok"
@@ -179,7 +186,7 @@ def savilerow_parse_solution(eprimeModelFile, minionSolFile, auxFile, eprimeSolF
         + " -minion-sol-file "
         + minionSolFile
     )
-    cmdOutput, returnCode = run_cmd(cmd)
+    cmdOutput, returnCode = run_savilerow(cmd)
 
     log(cmd)
     if returnCode != 0:
@@ -201,7 +208,9 @@ def conjure_translate_solution(
     )
     log(cmd)
 
-    cmdOutput, returnCode = run_cmd(cmd)
+    # no time limit: the solution has already been found, but resource usage is recorded by the launcher
+    cmdOutput, returnCode, usage = run_limited(cmd)
+    log(f"conjure translate-solution: {usage['wallTime']:.3f}s, CPU time: {usage['cpuTime']:.3f}s, peak memory: {usage['peakRSS']:.1f}MB")
 
     if returnCode != 0:
         raise Exception(cmdOutput)
@@ -222,10 +231,15 @@ def run_minion(minionFile, minionSolFile, seed, timelimit, flags):
     )
     log(cmd)
 
-    start = time.time()
-    cmdOutput, returnCode = run_cmd(cmd)
-    runTime = time.time() - start
+    cmdOutput, returnCode, usage = run_limited(cmd, wallTimeLimit=get_wall_time_limit(timelimit))
+    log(f"minion CPU time: {usage['cpuTime']:.3f}s, peak memory: {usage['peakRSS']:.1f}MB")
+    if usage["timeOut"]:
+        return "solverTimeOut", usage["wallTime"]
+
+    return get_minion_status(cmdOutput, returnCode), usage["wallTime"]
+
 
+def get_minion_status(cmdOutput, returnCode):
     # check if minion is timeout or memout
     status = None
     if "Time out." in cmdOutput:
@@ -244,7 +258,7 @@ def run_minion(minionFile, minionSolFile, seed, timelimit, flags):
         else:
             status = "sat"
 
-    return status, runTime
+    return status
 
 
 def read_minion_variables(minionFileSections):
@@ -295,6 +309,8 @@ def write_out_modified_minion_file(minionFile, minionFileSections):
     minionSectionKeys = ["VARIABLES", "SEARCH", "TUPLELIST", "CONSTRAINTS"]
     file.write("MINION 3\n")
     for key in minionSectionKeys:
+        if len(minionFileSections.get(key, [])) == 0:
+            continue
         file.write("**{0}**".format(key) + "\n")
         for value in minionFileSections[key]:
             file.write(value.strip() + "\n")
@@ -303,56 +319,13 @@ def write_out_modified_minion_file(minionFile, minionFileSections):
     file.close()
 
 
-def encode_negative_table(minionFile, minionSolString):
-    minionFileSections = parse_minion_file(minionFile)
-
-    variables = read_minion_variables(minionFileSections)
-
-    # Grab the tuple list from the parsed minion section if it exists
-    tuple_list = minionFileSections.get("TUPLELIST", [])
-
-    # If the tuple_list is empty this must be the first time running this minion file. Add the negativetable constraint
-    if len(tuple_list) == 0:
-        minionFileSections["CONSTRAINTS"].append(
-            "negativetable([" + variables + "],negativeSol)"
-        )
-    # otherwise, remove the first line (negativeSol ...)
-    else:
-        tuple_list = tuple_list[1:]
-
-    # only update minionFile if minion finds a solution, i.e., a new instance is generated
-    if minionSolString != "":
-        tuple_list.append(minionSolString)
-        tuple_list = list(
-            set(tuple_list)
-        )  # remove duplicate solutions (shouldn't happen, but sometime it does because of crashed runs or resume)
-        minionFileSections["TUPLELIST"] = [
-            "negativeSol {0} {1}".format(len(tuple_list), len(variables.split(",")))
-        ]
-        minionFileSections["TUPLELIST"].extend(tuple_list)
-        write_out_modified_minion_file(minionFile, minionFileSections)
-
-
-def make_conjure_solve_command(
-    essenceModelFile,
-    eprimeModelFile,
-    instFile,
-    solver,
-    SRTimeLimit=0,
-    SRFlags="",
-    solverTimeLimit=0,
-    solverFlags="",
-    seed=None, # no seed as default
-):
-    # temporary files that will be removed
+def make_solver_options(solver, solverTimeLimit=0, solverFlags="", seed=None, instFile=None):
+    """
+    command line options of a solver: time limit, random seed and flags, as defined in solverInfo
+    return the options string and the list of temporary files created for it
+    """
     lsTempFiles = []
 
-    # SROptions string
-    SROptionsStr = ""
-    if SRTimeLimit > 0:
-        SROptionsStr += "-timelimit " + str(int(SRTimeLimit))
-    SROptionsStr += " " + SRFlags
-
     # solverInfo string
     solverOptionStr = ""
 
@@ -391,6 +364,31 @@ def make_conjure_solve_command(
     # solver flags
     solverOptionStr += " " + solverFlags
 
+    return solverOptionStr, lsTempFiles
+
+
+def make_conjure_solve_command(
+    essenceModelFile,
+    eprimeModelFile,
+    instFile,
+    solver,
+    SRTimeLimit=0,
+    SRFlags="",
+    solverTimeLimit=0,
+    solverFlags="",
+    seed=None, # no seed as default
+):
+    # SROptions string
+    SROptionsStr = ""
+    if SRTimeLimit > 0:
+        SROptionsStr += "-timelimit " + str(int(SRTimeLimit))
+    SROptionsStr += " " + SRFlags
+
+    # solver options string, and temporary files that will be removed
+    solverOptionStr, lsTempFiles = make_solver_options(
+        solver, solverTimeLimit, solverFlags, seed, instFile
+    )
+
     # conjure solve command
     outDir = os.path.dirname(eprimeModelFile)
     eprimeModelFile = os.path.basename(eprimeModelFile)
@@ -416,6 +414,28 @@ def make_conjure_solve_command(
 
     return conjureCmd, lsTempFiles
 
+
+def get_solve_cache_key(
+    essenceModelFile, eprimeModelFile, instFile, solver, SRTimeLimit, SRFlags, solverTimeLimit, solverFlags, seed, backendFamily=None, solverTimeMeasure="wall"
+):
+    # key of a run in the persistent solver run cache, None if the cache is disabled
+    # runs made via conjure solve (backendFamily=None) and runs of a backend solver called directly (see essence_backend.py) are cached separately, as well as runs timed with CPU time or wall-clock time
+    return solver_cache.get_key(
+        "conjure",
+        [essenceModelFile, eprimeModelFile, instFile],
+        {
+            "solver": solver,
+            "SRTimeLimit": SRTimeLimit,
+            "SRFlags": SRFlags,
+            "solverTimeLimit": solverTimeLimit,
+            "solverFlags": solverFlags,
+            "seed": seed,
+            "backendFamily": backendFamily,
+            "solverTimeMeasure": solverTimeMeasure,
+        },
+    )
+
+
 # Changed to take in the paramters directly, rather than through a provided settings dictionary
 def call_conjure_solve(
         essenceModelFile: str, 
@@ -426,12 +446,38 @@ def call_conjure_solve(
         SRFlags, 
         solverTimeLimit, 
         solverFlags, 
-        seed):
+        seed,
+        runTag=None):
+    """
+    solve an instance using conjure solve, return the run's status, SR time, solver time, and extra information about the run: CPU time (cpuTime), wall-clock time (wallTime) and peak memory (peakRSS) of the whole conjure call, and the time spent on waiting for the SR info file (waitTime). extra is empty when the results come from the solver run cache
+        - runTag: when set, the run uses its own copy of the instance file, so that several runs on the same instance can be executed in parallel without clashes between files generated by conjure
+    """
     
     lsTempFiles = []
 
     print()
 
+    # reuse results of an identical run from the persistent solver run cache (if enabled)
+    cacheKey = get_solve_cache_key(
+        essenceModelFile, eprimeModelFile, instFile, solver, SRTimeLimit, SRFlags, solverTimeLimit, solverFlags, seed
+    )
+    cachedResults = solver_cache.lookup(cacheKey)
+    if cachedResults is not None:
+        status, SRTime, solverTime = cachedResults
+        return status, SRTime, solverTime, {}
+
+    # name of the SR info file kept after the run is always based on the original instance file
+    infoBaseFile = (
+        eprimeModelFile.replace(".eprime", "")
+        + "-"
+        + os.path.basename(instFile).replace(".param", "")
+    )
+    if runTag is not None:
+        runInstFile = instFile.replace(".param", "-" + runTag + ".param")
+        shutil.copyfile(instFile, runInstFile)
+        lsTempFiles.append(runInstFile)
+        instFile = runInstFile
+
     # make conjure solve command line
     conjureCmd, tempFiles = make_conjure_solve_command(
         essenceModelFile,
@@ -449,10 +495,20 @@ def call_conjure_solve(
     # call conjure
     print("\nCalling conjure")
     log(conjureCmd)
-    cmdOutput, returnCode = run_cmd(conjureCmd)
+    wallTimeLimit = None
+    if (SRTimeLimit > 0) and (solverTimeLimit > 0):
+        wallTimeLimit = get_wall_time_limit(SRTimeLimit + solverTimeLimit)
+    cmdOutput, returnCode, usage = run_limited(conjureCmd, wallTimeLimit=wallTimeLimit)
     log(cmdOutput)
+    extra = {"cpuTime": usage["cpuTime"], "wallTime": usage["wallTime"], "peakRSS": usage["peakRSS"]}
 
     status = None
+    if usage["timeOut"]:
+        # conjure was stopped by the launcher, so there's no SR info file
+        log(f"conjure solve exceeded the time limit of {wallTimeLimit}s")
+        delete_file(lsTempFiles)
+        extra["waitTime"] = 0
+        return "solverTimeOut", 0, solverTimeLimit, extra
     if (
         ("GC overhead limit exceeded" in cmdOutput)
         or ("OutOfMemoryError" in cmdOutput)
@@ -509,23 +565,14 @@ def call_conjure_solve(
     print("Waiting for " + infoFile)
 
     # Wait a maximum of 60s for SR-info file to appear
+    extra["waitTime"] = 0
     if status != "SRMemOut":
-        max_wait = 60
-        while True:
-            if os.path.isfile(infoFile):
-                break
-            elif max_wait <= 0:
-                os.stat(infoFile)
-                raise Exception(
-                    "Waited max time for SR-info file to appear {0}".format(infoFile)
-                )
-            else:
-                time.sleep(1)
-                max_wait -= 1
+        extra["waitTime"] = wait_for_file(infoFile, timeout=60)
+        log(f"Waited {extra['waitTime']:.3f}s for SR-info file {infoFile}")
 
     if os.path.isfile(infoFile):
         # rename infoFile so that it includes random seed and solver name
-        newInfoFile = baseFile + "-seed_" + str(seed) + "-" + solver + ".eprime-info"
+        newInfoFile = infoBaseFile + "-seed_" + str(seed) + "-" + solver + ".eprime-info"
         print("Renaming SR info file: " + infoFile + " -> " + newInfoFile)
         if os.path.isfile(infoFile):
             os.rename(infoFile, newInfoFile)
@@ -539,7 +586,8 @@ def call_conjure_solve(
             status = infoStatus
 
     delete_file(lsTempFiles)
-    return status, SRTime, solverTime
+    solver_cache.store(cacheKey, [status, SRTime, solverTime])
+    return status, SRTime, solverTime, extra
 
 
 def parse_SR_info_file(fn, knownSolverMemOut=False, timelimit=0):
@@ -609,7 +657,7 @@ def calculate_essence_borda_scores(
 
     possible_status = {
     "sat",
-    "nsat",
+    "unsat",
     "SRTimeOut",
     "SRMemOut",
     "solverTimeOut",
@@ -622,7 +670,7 @@ def calculate_essence_borda_scores(
     assert problemType in ["MIN", "MAX", "SAT"]
 
     def solved(status):
-        return status in ["sat", "nsat"]
+        return status in ["sat", "unsat"]
     
 
     def calculateMnzScore(time1, time2):
@@ -0,0 +1,66 @@
+import os
+import sys
+
+scriptDir = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(scriptDir)
+
+import conf
+
+# helpers for deciding the outcome of an instance evaluation before all solver runs are done, used when early stopping of graded evaluations is enabled (--gradedEarlyStopping)
+# for graded evaluations, runs are classified into three classes: too easy, graded, too difficult. The outcome is given by the class of the median run, and a decision is made only when the class of the median run is the same whatever the remaining runs are
+
+
+def check_zero_scores():
+    # early stopping relies on all non-graded outcomes having the same score: if a remaining run would have led to another non-graded status (e.g., an unwanted instance type or inconsistent answers), the score would still be the same
+    assert (
+        conf.SCORE_TOO_EASY
+        == conf.SCORE_TOO_DIFFICULT
+        == conf.SCORE_UNWANTED_TYPE
+        == conf.SCORE_INCORRECT_ANSWER
+    ), "ERROR: early stopping of graded evaluations requires all non-graded scores to be the same"
+
+
+def get_median_index(nEvaluations):
+    # same as in the graded evaluators: the median run is runs[int(nRuns / 2)] after sorting runs from best to worst
+    return int(nEvaluations / 2)
+
+
+def get_mzn_graded_median_decision(runs, nEvaluations, minTime, problemType, instanceType=None):
+    """
+    check if the median run of a mzn graded evaluation is already known to be too easy/too difficult, whatever results of the remaining runs are
+        - runs: results of the runs done so far (as recorded by evaluate_mzn_instance_graded)
+        - instanceType: sat/unsat/None, instance type found by the runs done so far
+    return "tooEasy", "tooDifficult", or None if it's not decided yet
+    """
+    medianIndex = get_median_index(nEvaluations)
+    # unsolved runs are always ranked last by run_comparator, so if there are enough of them, the median run is one of them
+    nUnsolved = len([r for r in runs if r["status"] not in ["S", "C"]])
+    if nUnsolved >= nEvaluations - medianIndex:
+        return "tooDifficult"
+    # for optimisation problems, runs completed in less than minTime are always ranked first by run_comparator, so if there are enough of them, the median run is one of them
+    # for decision problems, solved runs are ranked by time only, so a run with status S could be ranked between two completed runs. This can't happen when the instance is unsat (a remaining run with status S would give inconsistent answers, which have the same score)
+    if (problemType != "SAT") or (instanceType == "unsat"):
+        nTooEasy = len([r for r in runs if (r["status"] == "C") and (r["time"] < minTime)])
+        if nTooEasy >= medianIndex + 1:
+            return "tooEasy"
+    return None
+
+
+def get_essence_graded_median_decision(runs, nEvaluations, timeLimit):
+    """
+    check if the median run of an Essence graded evaluation is already known to be an unsolved run, whatever results of the remaining runs are
+        - runs: results of the runs done so far, in seed order (as recorded by evaluate_essence_instance_graded)
+        - timeLimit: solver time limit. Solving times are at most timeLimit, and timeouts are recorded with exactly timeLimit (see parse_SR_info_file)
+    return "tooDifficult", or None if it's not decided yet
+    runs are ranked by solving time only, with ties kept in seed order. A remaining run is ranked either before all runs done at the time limit (if it's faster), or after all of them. So for every number of remaining runs faster than the time limit, the median position falls on a known run done at the time limit, and if none of those runs is sat, the instance is too difficult
+    a too easy instance can't be decided early: a fast unsolved remaining run (e.g., a Savile Row timeout) could always change the median run
+    """
+    medianIndex = get_median_index(nEvaluations)
+    slowRuns = [r for r in runs if r["solverTime"] >= timeLimit]  # in seed order
+    nFastRuns = len(runs) - len(slowRuns)
+    nRemainingRuns = nEvaluations - len(runs)
+    for nFastRemainingRuns in range(nRemainingRuns + 1):
+        j = medianIndex - nFastRuns - nFastRemainingRuns
+        if (j < 0) or (j >= len(slowRuns)) or (slowRuns[j]["status"] == "sat"):
+            return None
+    return "tooDifficult"
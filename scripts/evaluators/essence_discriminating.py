@@ -1,6 +1,9 @@
 import os
+import math
 from utils import log
-from essence_pipeline_utils import call_conjure_solve, get_essence_problem_type, calculate_essence_borda_scores
+from essence_pipeline_utils import get_essence_problem_type, calculate_essence_borda_scores
+from essence_backend import solve_essence_instance, delete_instance_translations
+from parallel_utils import RunScheduler
 import conf
 
 
@@ -18,9 +21,11 @@ def evaluate_essence_instance_discriminating(
     favouredSolverFlags: str = "-f", # Flags for the favoured solver, fed into Conjure
     totalTimeLimit: int = 1200, # The default time limit for each solver run
     initSeed: int = None, # The initial seed
-    totalMemLimit=8192, # Total memory limit for solver runs (currently unused)
+    totalMemLimit=8192, # Memory limit (in MB) for solver runs, enforced by the launcher on solvers called directly (see essence_backend.py)
     SRTimeLimit: int = 0, # The timelimit for SR
     SRFlags: str = "",  # Flags for SR
+    nParallelRuns: int = 1, # Max number of solver runs executed in parallel (runs of both solvers can be executed at the same time)
+    baseTimeCapRatio: float = None, # If set, a base solver run is stopped after baseTimeCapRatio times the solving time of the favoured solver's run with the same seed
 ):
     
     """evaluate a generated instance based on discriminating power with two solvers ###
@@ -57,6 +62,8 @@ def evaluate_essence_instance_discriminating(
                 "unsat",
             ], "ERROR: elements of unwantedTypes must be in {'sat','unsat'}"
     assert nEvaluations > 0
+    if baseTimeCapRatio is not None:
+        assert baseTimeCapRatio > 0, "ERROR: baseTimeCapRatio must be positive"
 
     # Initialize info and results dictionaries
     info = {
@@ -97,104 +104,164 @@ def evaluate_essence_instance_discriminating(
     lsSolvingTime["favoured"] = []
     lsSolvingTime["base"] = []
 
-    for solverType in ["favoured", "base"]:
-        solved = False
-
-        if solverType == "favouredSolver":
-            solverSetting = favouredSolverFlags
-            current_solver  = favouredSolver
-
-        else:
-            solverSetting = baseSolverFlags
-            current_solver  = baseSolver
+    # Time limit of each base solver run
+    baseTimeLimits = {}
+
+    def get_base_time_limit(i):
+        """
+        Time limit of the i-th base solver run
+        When capping is enabled and the favoured solver solves its run with the same seed, the limit is baseTimeCapRatio times the favoured solver's time
+        The limit is never lower than nEvaluations * baseMinTime, so that we can still detect instances that are too easy for the base solver
+        """
+        if i not in baseTimeLimits:
+            favouredRun = results["favoured"]["runs"][i]
+            timeLimit = totalTimeLimit
+            if (baseTimeCapRatio is not None) and (favouredRun["status"] in ["sat", "unsat"]):
+                # Solvers only accept integer time limits, and 0 means no limit
+                timeLimit = min(
+                    totalTimeLimit,
+                    max(math.ceil(baseTimeCapRatio * favouredRun["solverTime"]), nEvaluations * baseMinTime, 1),
+                )
+            baseTimeLimits[i] = timeLimit
+        return baseTimeLimits[i]
+
+    # Solver name and flags used for the runs of solverType
+    def get_solver(solverType):
+        return info[solverType]["name"], info[solverType]["flags"]
+
+    def submit_run(solverType, i, timeLimit):
+        current_solver, solverSetting = get_solver(solverType)
+        scheduler.submit(
+            (solverType, i), solve_essence_instance,
+            essenceModelFile, eprimeModelFile, instFile, current_solver, SRTimeLimit, SRFlags, timeLimit, solverSetting, initSeed + i,
+            runTag=solverType + "-run" + str(i), memLimit=totalMemLimit,
+        )
 
-        # solverSetting = str(solver) + "Flags"
-        print("Solversetting: ", solverSetting)
-        print("About to enter loop for nEvaluations")
+    # In parallel mode, runs of both solvers are started now (all runs of the favoured solver first), each on its own copy of the instance file
+    # Their results are still processed below in the same order as in the sequential mode
+    # Runs that are no longer needed are cancelled, e.g., the base solver's runs when the instance is too difficult for the favoured solver
+    # With base solver time capping, a base solver run is only started when the favoured solver's run with the same seed is finished (see below)
+    scheduler = None
+    if nParallelRuns > 1:
+        scheduler = RunScheduler(nParallelRuns)
+        for solverType in ["favoured", "base"]:
+            if (solverType == "base") and (baseTimeCapRatio is not None):
+                continue
+            for i in range(nEvaluations):
+                submit_run(solverType, i, totalTimeLimit)
+
+    try:
+        for solverType in ["favoured", "base"]:
+            solved = False
+
+            current_solver, solverSetting = get_solver(solverType)
+
+            # solverSetting = str(solver) + "Flags"
+            print("Solversetting: ", solverSetting)
+            print("About to enter loop for nEvaluations")
         
-        for i in range(nEvaluations):
-            rndSeed = initSeed + i
-
-            # Making the call to Conjure Solve
-            runStatus, SRTime, solverTime = call_conjure_solve(
-                essenceModelFile, eprimeModelFile, instFile, current_solver, SRTimeLimit, SRFlags, totalTimeLimit, solverSetting, rndSeed
-            )
-            localVars = locals()
+            for i in range(nEvaluations):
+                rndSeed = initSeed + i
 
-            # Checking the produced run status
-            if runStatus in ["sat", "nsat"]:
-                if instanceType is None:
-                    instanceType = runStatus
-                    assert instanceType in ["sat", "nsat"]
-                    solved = True
+                timeLimit = totalTimeLimit
+                if solverType == "base":
+                    timeLimit = get_base_time_limit(i)
 
-
-                # Condition if it hasn't already been run in a previous nEvaluation 
+                # Making the call to Conjure Solve
+                if scheduler:
+                    runStatus, SRTime, solverTime, extra = scheduler.result((solverType, i))
                 else:
+                    runStatus, SRTime, solverTime, extra = solve_essence_instance(
+                        essenceModelFile, eprimeModelFile, instFile, current_solver, SRTimeLimit, SRFlags, timeLimit, solverSetting, rndSeed, memLimit=totalMemLimit
+                    )
+                localVars = locals()
+
+                # Checking the produced run status
+                if runStatus in ["sat", "unsat"]:
                     if instanceType is None:
-                        # If a different result appears, verify with a third solver (chuffed)
-                        if correctedType is None:
-                            # use a third solver, chuffed, to solve the instance
-                            c_runStatus, c_SRTime, c_solverTime = call_conjure_solve(
-                                    essenceModelFile, 
-                                    eprimeModelFile,
-                                    instFile, 
-                                    "chuffed", 
-                                    SRTimeLimit, 
-                                    SRFlags, 
-                                    totalTimeLimit, 
-                                    None, 
-                                    rndSeed
+                        instanceType = runStatus
+                        assert instanceType in ["sat", "unsat"]
+                        solved = True
+
+
+                    # Condition if it hasn't already been run in a previous nEvaluation 
+                    else:
+                        if instanceType is None:
+                            # If a different result appears, verify with a third solver (chuffed)
+                            if correctedType is None:
+                                # use a third solver, chuffed, to solve the instance
+                                c_runStatus, c_SRTime, c_solverTime, c_extra = solve_essence_instance(
+                                        essenceModelFile, 
+                                        eprimeModelFile,
+                                        instFile, 
+                                        "chuffed", 
+                                        SRTimeLimit, 
+                                        SRFlags, 
+                                        totalTimeLimit, 
+                                        None, 
+                                        rndSeed
+                                    )
+                                assert c_runStatus in [
+                                    "sat",
+                                    "unsat"
+                                ], "Error: Third solver (chuffed) also fails to prove sat or unsat"
+                                correctedType = c_runStatus
+                            if instanceType == correctedType:
+                                solver = info[solverType]["name"]
+                                print(
+                                    f"WARNING: incorrect results by {solver} on {instFile} with seed {rndSeed}. Chuffed returns {correctedType}"
                                 )
-                            assert c_runStatus in [
-                                "sat",
-                                "nsat"
-                            ], "Error: Third solver (chuffed) also fails to prove sat or unsat"
-                            correctedType = c_runStatus
-                        if instanceType == correctedType:
-                            solver = info[solverType]["name"]
-                            print(
-                                f"WARNING: incorrect results by {solver} on {instFile} with seed {rndSeed}. Chuffed returns {correctedType}"
-                            )
-                            runStatus = "ERR"
-                        if status == correctedType:
-                            for st in results.keys():
-                                for r in results[st]["runs"]:
-                                    if r["status"] == instanceType:
-                                        print(
-                                            f"WARNING: incorrect results by {info[st]['name']} on {instFile} with seed {r['seed']}. Results returned: {r['extra']['instanceType']}, while chuffed returns {correctedType}"
-                                        )
-                                        r["status"] = "ERR"
-                        instanceType = correctedType
-
-            # Append run results
-            results[solverType]["runs"].append(
-                {
-                    "seed":rndSeed,
-                    "status":runStatus,
-                    "SRTime":SRTime,
-                    "solverTime":solverTime,
-                }
-            )
-
-            # Early exit if instance type is unwanted
-            if (
-                len(unwantedTypes) > 0
-                and instanceType
-                and (instanceType in unwantedTypes)
-            ):
-                print("Unwanted instance type. Quitting...")
-                score = conf.SCORE_UNWANTED_TYPE
-                status = "unwantedType"
+                                runStatus = "ERR"
+                            if status == correctedType:
+                                for st in results.keys():
+                                    for r in results[st]["runs"]:
+                                        if r["status"] == instanceType:
+                                            print(
+                                                f"WARNING: incorrect results by {info[st]['name']} on {instFile} with seed {r['seed']}. Results returned: {r['extra']['instanceType']}, while chuffed returns {correctedType}"
+                                            )
+                                            r["status"] = "ERR"
+                            instanceType = correctedType
+
+                # Append run results
+                results[solverType]["runs"].append(
+                    {
+                        "seed":rndSeed,
+                        "status":runStatus,
+                        "SRTime":SRTime,
+                        "solverTime":solverTime,
+                        "extra":extra,
+                    }
+                )
+                # Mark base solver runs stopped by the time cap, so they can be told apart from real timeouts
+                if timeLimit < totalTimeLimit:
+                    results[solverType]["runs"][-1]["timeLimit"] = timeLimit
+                    results[solverType]["runs"][-1]["capped"] = runStatus not in ["sat", "unsat"]
+                if scheduler and (solverType == "favoured") and (baseTimeCapRatio is not None):
+                    submit_run("base", i, get_base_time_limit(i))
+
+                # Early exit if instance type is unwanted
+                if (
+                    len(unwantedTypes) > 0
+                    and instanceType
+                    and (instanceType in unwantedTypes)
+                ):
+                    print("Unwanted instance type. Quitting...")
+                    score = conf.SCORE_UNWANTED_TYPE
+                    status = "unwantedType"
+                    return score, get_results()
+
+            # For the case that the instance cannot be solved by the favoured solver
+            if (solverType == "favoured") and (solved is False):
+                print("\nCannot be solved by favoured solver. Quitting...")
+                score = conf.SCORE_FAVOURED_TOO_DIFFICULT
+                status = "favouredTooDifficult"
                 return score, get_results()
-            
-
-        # For the case that the instance cannot be solved by the favoured solver
-        if (solverType == "favoured") and (solved is False):
-            print("\nCannot be solved by favoured solver. Quitting...")
-            score = conf.SCORE_FAVOURED_TOO_DIFFICULT
-            status = "favouredTooDifficult"
-            return score, get_results()            
+    finally:
+        # Stop all runs that are still in progress
+        if scheduler:
+            scheduler.shutdown()
+        # Savile Row translations shared by the runs are no longer needed
+        delete_instance_translations(eprimeModelFile, instFile)
 
     # Check if the instance is too easy for the base solver
     baseAvgTime = sum([r["solverTime"] for r in results["base"]["runs"]]) / nEvaluations
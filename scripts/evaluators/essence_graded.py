@@ -1,6 +1,9 @@
 import os
 from utils import log
-from essence_pipeline_utils import call_conjure_solve, get_essence_problem_type
+from essence_pipeline_utils import get_essence_problem_type
+from essence_backend import solve_essence_instance, delete_instance_translations
+from parallel_utils import RunScheduler
+from evaluation_utils import get_essence_graded_median_decision
 
 import conf # External file for holding static configurations, no need to redeclare here
 
@@ -23,7 +26,9 @@ def evaluate_essence_instance_graded(
     oracleSolver: str = None,
     oracleSolverFlags: str = "-f",
     oracleSolverTimeLimit: int = 3600,
-    memLimit=8192, # Total memory limit for solver runs (currently unused)
+    memLimit=8192, # Memory limit (in MB) for solver runs, enforced by the launcher on solvers called directly (see essence_backend.py)
+    nParallelRuns: int = 1, # Max number of solver runs (with different seeds) executed in parallel
+    earlyStopping: bool = False, # Stop running new seeds as soon as the median run is known to be unsolved (the score and status are the same as when all seeds are run)
 ):
     
     
@@ -52,6 +57,8 @@ def evaluate_essence_instance_graded(
         "complete",
         "incomplete",
     ], "ERROR: solver type must be either complete or incomplete"
+    # early stopping relies on timeouts being recorded with the full time limit, which is only done with shared translations (see essence_backend.clamp_solver_time)
+    assert (not earlyStopping) or conf.essenceTranslationReuse, "ERROR: earlyStopping requires conf.essenceTranslationReuse"
     # Again, leaving so can be used in the future if the oracle is implemented
     if solverType == "incomplete":
         assert (
@@ -96,39 +103,75 @@ def evaluate_essence_instance_graded(
     optimalObj = None
     lsSolverTime = []   
     
-    # Looping for each iteration of the nEvaluations parameter
-    for i in range(nEvaluations):
-        # Change seed each time
-        if initSeed:
-            seed = initSeed + i
-        else:
-            seed = None
-
-        print(
-            "\n\n----------- With seed " + str(i) + "th (" + str(seed) + ")"
-        )
-
-        # call conjure solve
-        runStatus, SRTime, solverTime = call_conjure_solve(
-            essenceModelFile, eprimeModelFile, instFile, solver, SRTimeLimit, SRFlags, timeLimit, solverFlags, seed
-        )
-
-        # Append each iteration to the runs directory
-        results["main"]["runs"].append(
-            {"seed": seed, "status": runStatus, "solverTime": solverTime,"SRTime": SRTime } # there is no extra attribute to print
-        )
-
-        # Minizinc had a check here for if the instance type was the same as the previous command
-        # checked for inconsistencies but isn't possible here, no "EXTRA" field returned
-        # there was a check here based on the optimal objective, but not possible
-
-        # Checking if the result is an unwanted type
-        if len(unwantedTypes) > 0 and runStatus and (runStatus in unwantedTypes):
-            print("Unwanted instance type. Quitting...")
-            score = conf.SCORE_UNWANTED_TYPE
-            status = "unwantedType"
-            return score, get_results()
-        
+    # In parallel mode, all runs are started now, each on its own copy of the instance file
+    # Their results are still processed in seed order below
+    scheduler = None
+    if nParallelRuns > 1:
+        scheduler = RunScheduler(min(nParallelRuns, nEvaluations))
+        for i in range(nEvaluations):
+            seed = initSeed + i if initSeed else None
+            scheduler.submit(
+                i, solve_essence_instance,
+                essenceModelFile, eprimeModelFile, instFile, solver, SRTimeLimit, SRFlags, timeLimit, solverFlags, seed,
+                runTag="run" + str(i), memLimit=memLimit,
+            )
+
+    try:
+        # Looping for each iteration of the nEvaluations parameter
+        for i in range(nEvaluations):
+            # Change seed each time
+            if initSeed:
+                seed = initSeed + i
+            else:
+                seed = None
+
+            print(
+                "\n\n----------- With seed " + str(i) + "th (" + str(seed) + ")"
+            )
+
+            # call conjure solve
+            if scheduler:
+                runStatus, SRTime, solverTime, extra = scheduler.result(i)
+            else:
+                runStatus, SRTime, solverTime, extra = solve_essence_instance(
+                    essenceModelFile, eprimeModelFile, instFile, solver, SRTimeLimit, SRFlags, timeLimit, solverFlags, seed, memLimit=memLimit
+                )
+
+            # Append each iteration to the runs directory
+            results["main"]["runs"].append(
+                {"seed": seed, "status": runStatus, "solverTime": solverTime,"SRTime": SRTime, "extra": extra }
+            )
+
+            # Minizinc had a check here for if the instance type was the same as the previous command
+            # checked for inconsistencies but isn't possible here, no "EXTRA" field returned
+            # there was a check here based on the optimal objective, but not possible
+
+            # Checking if the result is an unwanted type
+            if len(unwantedTypes) > 0 and runStatus and (runStatus in unwantedTypes):
+                print("Unwanted instance type. Quitting...")
+                score = conf.SCORE_UNWANTED_TYPE
+                status = "unwantedType"
+                return score, get_results()
+
+            # If the median run is already known to be an unsolved run, the instance is too difficult
+            # With early stopping, the remaining seeds are skipped. This is only done without unwanted types, as a remaining run could otherwise change the status to unwantedType
+            if earlyStopping and (len(unwantedTypes) == 0) and (i < nEvaluations - 1):
+                decision = get_essence_graded_median_decision(results["main"]["runs"], nEvaluations, timeLimit)
+                if decision:
+                    print(f"Instance is {decision} after {i + 1} runs. Skipping the remaining seeds...")
+                    results["earlyStopping"] = {
+                        "nRunsDone": i + 1,
+                        "skippedSeeds": [initSeed + j if initSeed else None for j in range(i + 1, nEvaluations)],
+                    }
+                    score = conf.SCORE_TOO_DIFFICULT
+                    status = decision
+                    return score, get_results()
+    finally:
+        # Stop runs that are no longer needed
+        if scheduler:
+            scheduler.shutdown()
+        # Savile Row translations shared by the runs are no longer needed
+        delete_instance_translations(eprimeModelFile, instFile)
 
     # Calculate median runtime
     results["main"]["runs"] = sorted(
@@ -1,7 +1,10 @@
 from functools import cmp_to_key
 from minizinc_utils import minizinc_solve, calculate_minizinc_borda_scores, get_minizinc_problem_type, has_better_objective
 
+from parallel_utils import RunScheduler
+
 import copy
+import math
 import conf
 
 
@@ -19,9 +22,13 @@ def evaluate_mzn_instance_discriminating(
     totalTimeLimit: int = 1200,
     initSeed: int = None,
     totalMemLimit=8192,
+    nParallelRuns: int = 1,
+    baseTimeCapRatio: float = None,
 ):
     """
     Evaluate a mzn instance under the solver-discriminating criteria
+        - nParallelRuns: max number of solver runs executed in parallel (runs of both solvers can be executed at the same time)
+        - baseTimeCapRatio: if not None, when the favoured solver completes a run in t seconds, the base solver's run with the same seed is stopped after baseTimeCapRatio * t seconds (only used with the complete scoring method)
     """
     # Scores moved to be global variables so can be used elsewhere
 
@@ -36,6 +43,12 @@ def evaluate_mzn_instance_discriminating(
                 "unsat",
             ], "ERROR: elements of unwantedTypes must be in {'sat','unsat'}"
     assert nEvaluations > 0
+    if baseTimeCapRatio is not None:
+        assert baseTimeCapRatio > 0, "ERROR: baseTimeCapRatio must be positive"
+        # with the incomplete scoring method, a base solver run stopped early could have found a better solution than the favoured solver's one
+        if scoringMethod != "complete":
+            print("WARNING: base solver time capping is only supported for the complete scoring method, it will be ignored")
+            baseTimeCapRatio = None
 
     # initialise info and results
     info = {
@@ -61,130 +74,205 @@ def evaluate_mzn_instance_discriminating(
         # print("\n",rs)
         return rs
 
+    # time limit of each base solver run
+    baseTimeLimits = {}
+
+    def get_base_time_limit(i):
+        """
+        time limit of the i-th base solver run
+        when capping is enabled and the favoured solver completes its run with the same seed, the limit is baseTimeCapRatio times the favoured solver's time
+        the limit is never lower than nEvaluations * baseMinTime, so that we can still detect instances that are too easy for the base solver
+        """
+        if i not in baseTimeLimits:
+            favouredRun = results["favoured"]["runs"][i]
+            timeLimit = totalTimeLimit
+            if (baseTimeCapRatio is not None) and (favouredRun["status"] == "C"):
+                # solvers only accept integer time limits
+                timeLimit = min(
+                    totalTimeLimit,
+                    max(math.ceil(baseTimeCapRatio * favouredRun["time"]), nEvaluations * baseMinTime, 1),
+                )
+            baseTimeLimits[i] = timeLimit
+        return baseTimeLimits[i]
+
+    def need_run(solverType, i):
+        # a deterministic solver is only run once (see below)
+        return (i == 0) or (info[solverType]["name"] not in conf.deterministicSolvers)
+
+    def submit_run(solverType, i, timeLimit):
+        seed = initSeed + i if initSeed else None
+        scheduler.submit(
+            (solverType, i),
+            minizinc_solve,
+            modelFile,
+            instFile,
+            info[solverType]["name"],
+            info[solverType]["flags"],
+            seed,
+            timeLimit,
+            totalMemLimit,
+        )
+
     # run each solver on the instance and record results
     correctedType = None
-    for solverType in ["favoured", "base"]:
-        solved = False  # check if the instance is solved by this solver
-
-        for i in range(nEvaluations):
-            if initSeed:
-                seed = initSeed + i
-            else:
-                seed = None
-
-            # there are two cases where we only need to run a solver once and copy results to the remaining runs
-            #   - case 1: the solver is deterministic
-            #   - case 2: minizinc's flattening process fails
-            if i > 0:
-                assert len(results[solverType]["runs"]) > 0
-                flattenStatus = results[solverType]["runs"][0]["extra"]["flattenStatus"]
-                if (info[solverType]["name"] in conf.deterministicSolvers) or (
-                    flattenStatus != "ok"
-                ):
-                    r = copy.deepcopy(results[solverType]["runs"][0])
-                    r["seed"] = seed
-                    results[solverType]["runs"].append(r)
-                    continue
-
-            print("\n")
-            runStatus, runTotalTime, extra = minizinc_solve(
-                modelFile,
-                instFile,
-                info[solverType]["name"],
-                info[solverType]["flags"],
-                seed,
-                totalTimeLimit,
-                totalMemLimit,
-            )
-
-            # for testing only
-            # if solverType=='favoured':
-            #    if extra['instanceType'] == 'sat':
-            #        extra['instanceType']='unsat'
-
-            # for testing only
-            # if (solverType=='base') and (extra['instanceType']=='sat'):
-            #    v = extra['objs'][-1]
-            #    extra['objs'][-1] = (v[0], v[1]+1)
-
-            # if the instance is solved by this run, update instanceType
-            if runStatus in ["S", "C"]:
-                assert extra["instanceType"] in ["sat", "unsat"]
-
-                # if this is the first run where the instance is solved
-                if instanceType is None:
-                    instanceType = extra["instanceType"]
-                    assert instanceType in ["sat", "unsat"]
-                    solved = True
-                    if len(extra["objs"]) > 0 and extra["objs"][-1]:
-                        bestObj = extra["objs"][-1]
-
-                # otherwise, check if two solvers or two runs of the same solvers return different answers
+
+    # in parallel mode, runs of both solvers are started now (all runs of the favoured solver first), and their results are still processed below in the same order as in the sequential mode
+    # runs that are no longer needed are cancelled, e.g., the base solver's runs when the instance is too difficult for the favoured solver
+    # with base solver time capping, a base solver run is only started when the favoured solver's run with the same seed is finished (see below)
+    scheduler = None
+    if nParallelRuns > 1:
+        scheduler = RunScheduler(nParallelRuns)
+        for solverType in ["favoured", "base"]:
+            if (solverType == "base") and (baseTimeCapRatio is not None):
+                continue
+            for i in range(nEvaluations):
+                if need_run(solverType, i):
+                    submit_run(solverType, i, totalTimeLimit)
+
+    try:
+        for solverType in ["favoured", "base"]:
+            solved = False  # check if the instance is solved by this solver
+
+            for i in range(nEvaluations):
+                if initSeed:
+                    seed = initSeed + i
                 else:
-                    # if instance types (sat/unsat) are inconsistent
-                    if instanceType != extra["instanceType"]:
-                        if correctedType is None:
-                            # use a third solver (chuffed) to solve the instance
-                            c_runStatus, c_runTotalTime, c_extra = minizinc_solve(
-                                modelFile,
-                                instFile,
-                                "chuffed",
-                                "-f",
-                                None,
-                                totalTimeLimit,
-                                totalMemLimit,
-                            )
-                            # TODO: what if chuffed fails to solve the instance?
-                            assert c_extra["instanceType"] in [
-                                "sat",
-                                "unsat",
-                            ], "ERROR: inconsistent results between solvers or between runs of the same solvers, and the third solver (chuffed) fails to determine which one is correct"
-                            correctedType = c_extra["instanceType"]
-                        # if the current run is the incorrected one, mark its status as ERR
-                        if instanceType == correctedType:
-                            solver = info[solverType]["name"]
-                            print(
-                                f"WARNING: incorrect results by {solver} on {instFile} with seed {seed}. Results returned: {extra['instanceType']}, while chuffed returns {correctedType}"
-                            )
-                            runStatus = "ERR"
-                        # if the previous runs were the incorrected ones, mark their statuses as ERR
-                        if extra["instanceType"] == correctedType:
-                            for st in results.keys():
-                                for r in results[st]["runs"]:
-                                    if r["extra"]["instanceType"] == instanceType:
-                                        print(
-                                            f"WARNING: incorrect results by {info[st]['name']} on {instFile} with seed {r['seed']}. Results returned: {r['extra']['instanceType']}, while chuffed returns {correctedType}"
-                                        )
-                                        r["status"] = "ERR"
-                        # assign the correct type
-                        instanceType = correctedType
-
-            results[solverType]["runs"].append(
-                {
-                    "seed": seed,
-                    "status": runStatus,
-                    "time": runTotalTime,
-                    "extra": extra,
-                }
-            )
-
-            # if the instance is of an unwanted type, we stop immediately
-            if (
-                len(unwantedTypes) > 0
-                and instanceType
-                and (instanceType in unwantedTypes)
-            ):
-                print("Unwanted instance type. Quitting...")
-                score = conf.SCORE_UNWANTED_TYPE
-                status = "unwantedType"
-                return score, get_results()
+                    seed = None
 
-        # if the favoured solver cannot solve the instance on all runs, there's no need to run the base solver. We can just stop
-        if (solverType == "favoured") and (solved is False):
-            print("\nCannot be solved by favoured solver. Quitting...")
-            score = conf.SCORE_FAVOURED_TOO_DIFFICULT
-            status = "favouredTooDifficult"
-            return score, get_results()
+                # there are two cases where we only need to run a solver once and copy results to the remaining runs
+                #   - case 1: the solver is deterministic
+                #   - case 2: minizinc's flattening process fails
+                if i > 0:
+                    assert len(results[solverType]["runs"]) > 0
+                    flattenStatus = results[solverType]["runs"][0]["extra"]["flattenStatus"]
+                    if (info[solverType]["name"] in conf.deterministicSolvers) or (
+                        flattenStatus != "ok"
+                    ):
+                        r = copy.deepcopy(results[solverType]["runs"][0])
+                        r["seed"] = seed
+                        results[solverType]["runs"].append(r)
+                        if scheduler:
+                            scheduler.cancel((solverType, i))
+                            if (solverType == "favoured") and (baseTimeCapRatio is not None) and need_run("base", i):
+                                submit_run("base", i, get_base_time_limit(i))
+                        continue
+
+                timeLimit = totalTimeLimit
+                if solverType == "base":
+                    timeLimit = get_base_time_limit(i)
+
+                print("\n")
+                if scheduler:
+                    runStatus, runTotalTime, extra = scheduler.result((solverType, i))
+                else:
+                    runStatus, runTotalTime, extra = minizinc_solve(
+                        modelFile,
+                        instFile,
+                        info[solverType]["name"],
+                        info[solverType]["flags"],
+                        seed,
+                        timeLimit,
+                        totalMemLimit,
+                    )
+
+                # for testing only
+                # if solverType=='favoured':
+                #    if extra['instanceType'] == 'sat':
+                #        extra['instanceType']='unsat'
+
+                # for testing only
+                # if (solverType=='base') and (extra['instanceType']=='sat'):
+                #    v = extra['objs'][-1]
+                #    extra['objs'][-1] = (v[0], v[1]+1)
+
+                # if the instance is solved by this run, update instanceType
+                if runStatus in ["S", "C"]:
+                    assert extra["instanceType"] in ["sat", "unsat"]
+
+                    # if this is the first run where the instance is solved
+                    if instanceType is None:
+                        instanceType = extra["instanceType"]
+                        assert instanceType in ["sat", "unsat"]
+                        solved = True
+                        if len(extra["objs"]) > 0 and extra["objs"][-1]:
+                            bestObj = extra["objs"][-1]
+
+                    # otherwise, check if two solvers or two runs of the same solvers return different answers
+                    else:
+                        # if instance types (sat/unsat) are inconsistent
+                        if instanceType != extra["instanceType"]:
+                            if correctedType is None:
+                                # use a third solver (chuffed) to solve the instance
+                                c_runStatus, c_runTotalTime, c_extra = minizinc_solve(
+                                    modelFile,
+                                    instFile,
+                                    "chuffed",
+                                    "-f",
+                                    None,
+                                    totalTimeLimit,
+                                    totalMemLimit,
+                                )
+                                # TODO: what if chuffed fails to solve the instance?
+                                assert c_extra["instanceType"] in [
+                                    "sat",
+                                    "unsat",
+                                ], "ERROR: inconsistent results between solvers or between runs of the same solvers, and the third solver (chuffed) fails to determine which one is correct"
+                                correctedType = c_extra["instanceType"]
+                            # if the current run is the incorrected one, mark its status as ERR
+                            if instanceType == correctedType:
+                                solver = info[solverType]["name"]
+                                print(
+                                    f"WARNING: incorrect results by {solver} on {instFile} with seed {seed}. Results returned: {extra['instanceType']}, while chuffed returns {correctedType}"
+                                )
+                                runStatus = "ERR"
+                            # if the previous runs were the incorrected ones, mark their statuses as ERR
+                            if extra["instanceType"] == correctedType:
+                                for st in results.keys():
+                                    for r in results[st]["runs"]:
+                                        if r["extra"]["instanceType"] == instanceType:
+                                            print(
+                                                f"WARNING: incorrect results by {info[st]['name']} on {instFile} with seed {r['seed']}. Results returned: {r['extra']['instanceType']}, while chuffed returns {correctedType}"
+                                            )
+                                            r["status"] = "ERR"
+                            # assign the correct type
+                            instanceType = correctedType
+
+                results[solverType]["runs"].append(
+                    {
+                        "seed": seed,
+                        "status": runStatus,
+                        "time": runTotalTime,
+                        "extra": extra,
+                    }
+                )
+                # a base solver run stopped by the time cap is marked, so that it can be distinguished from a real timeout
+                if timeLimit < totalTimeLimit:
+                    results[solverType]["runs"][-1]["timeLimit"] = timeLimit
+                    results[solverType]["runs"][-1]["capped"] = runStatus != "C"
+                if scheduler and (solverType == "favoured") and (baseTimeCapRatio is not None) and need_run("base", i):
+                    submit_run("base", i, get_base_time_limit(i))
+
+                # if the instance is of an unwanted type, we stop immediately
+                if (
+                    len(unwantedTypes) > 0
+                    and instanceType
+                    and (instanceType in unwantedTypes)
+                ):
+                    print("Unwanted instance type. Quitting...")
+                    score = conf.SCORE_UNWANTED_TYPE
+                    status = "unwantedType"
+                    return score, get_results()
+
+            # if the favoured solver cannot solve the instance on all runs, there's no need to run the base solver. We can just stop
+            if (solverType == "favoured") and (solved is False):
+                print("\nCannot be solved by favoured solver. Quitting...")
+                score = conf.SCORE_FAVOURED_TOO_DIFFICULT
+                status = "favouredTooDifficult"
+                return score, get_results()
+    finally:
+        # stop all runs that are still in progress
+        if scheduler:
+            scheduler.shutdown()
 
     # check if the instance is too easy for the base solver
     baseAvgTime = sum([r["time"] for r in results["base"]["runs"]]) / nEvaluations
@@ -3,6 +3,9 @@ from functools import cmp_to_key
 # Import minizinc pipeline functions 
 from minizinc_utils import minizinc_solve, run_comparator, get_minizinc_problem_type, has_better_objective
 
+from parallel_utils import RunScheduler
+from evaluation_utils import get_mzn_graded_median_decision, check_zero_scores
+
 # Import configurations file for using constants
 import conf
 
@@ -21,9 +24,13 @@ def evaluate_mzn_instance_graded(
     oracleSolverFlags: str = "-f",
     oracleSolverTimeLimit: int = 3600,
     memLimit=8192,
+    nParallelRuns: int = 1,
+    earlyStopping: bool = False,
 ):
     """
     Evaluate a mzn instance under the gradedness criteria
+        - nParallelRuns: max number of runs of the main solver (with different seeds) executed in parallel
+        - earlyStopping: stop running new seeds as soon as the median run is known to be too easy/too difficult. The score is the same as when all seeds are run
     """
     
 
@@ -46,6 +53,8 @@ def evaluate_mzn_instance_graded(
     assert (
         minTime < timeLimit
     ), "ERROR: min solving time must be less than total time limit"
+    if earlyStopping:
+        check_zero_scores()
 
     # this is used by minizinc_utils.run_comparator
     problemType = get_minizinc_problem_type(modelFile)
@@ -97,53 +106,85 @@ def evaluate_mzn_instance_graded(
     # run the main solver
     instanceType = None
     optimalObj = None
-    for i in range(nEvaluations):
-        if initSeed:
-            seed = initSeed + i
-        else:
-            seed = None
-
-        print("\n")
-        runStatus, runTotalTime, extra = minizinc_solve(
-            modelFile, instFile, solver, solverFlags, seed, timeLimit, memLimit
-        )
-        results["main"]["runs"].append(
-            {"seed": seed, "status": runStatus, "time": runTotalTime, "extra": extra}
-        )
+    # in parallel mode, all runs of the main solver are started now, their results are still processed in seed order below
+    scheduler = None
+    if nParallelRuns > 1:
+        scheduler = RunScheduler(min(nParallelRuns, nEvaluations))
+        for i in range(nEvaluations):
+            seed = initSeed + i if initSeed else None
+            scheduler.submit(
+                i, minizinc_solve, modelFile, instFile, solver, solverFlags, seed, timeLimit, memLimit
+            )
+    try:
+        for i in range(nEvaluations):
+            if initSeed:
+                seed = initSeed + i
+            else:
+                seed = None
 
-        # just for testing
-        # extra['instanceType']='unsat'
-
-        # update instance type & check for inconsistency
-        if runStatus in ["S", "C"]:
-            if instanceType is None:
-                instanceType = extra["instanceType"]
-            elif (
-                instanceType != extra["instanceType"]
-            ):  # inconsistent results between runs, return immediately
-                print("Inconsistent instance type between runs. Quitting...")
-                score = conf.SCORE_INCORRECT_ANSWER
-                status = "inconsistentInstanceTypes"
-                return score, get_results()
+            print("\n")
+            if scheduler:
+                runStatus, runTotalTime, extra = scheduler.result(i)
+            else:
+                runStatus, runTotalTime, extra = minizinc_solve(
+                    modelFile, instFile, solver, solverFlags, seed, timeLimit, memLimit
+                )
+            results["main"]["runs"].append(
+                {"seed": seed, "status": runStatus, "time": runTotalTime, "extra": extra}
+            )
 
-        # update optimal objective & check for inconsistency
-        if (runStatus == "C") and (instanceType == "sat"):
-            if optimalObj is None:
-                assert len(extra["objs"]) > 0
-                optimalObj = extra["objs"][-1][1]
-            elif optimalObj != extra["objs"][-1][1]:
-                print("Inconsistent optimal objective value between runs. Quitting...")
-                score = conf.SCORE_INCORRECT_ANSWER
-                status = "inconsistentOptimalValues"
+            # just for testing
+            # extra['instanceType']='unsat'
+
+            # update instance type & check for inconsistency
+            if runStatus in ["S", "C"]:
+                if instanceType is None:
+                    instanceType = extra["instanceType"]
+                elif (
+                    instanceType != extra["instanceType"]
+                ):  # inconsistent results between runs, return immediately
+                    print("Inconsistent instance type between runs. Quitting...")
+                    score = conf.SCORE_INCORRECT_ANSWER
+                    status = "inconsistentInstanceTypes"
+                    return score, get_results()
+
+            # update optimal objective & check for inconsistency
+            if (runStatus == "C") and (instanceType == "sat"):
+                if optimalObj is None:
+                    assert len(extra["objs"]) > 0
+                    optimalObj = extra["objs"][-1][1]
+                elif optimalObj != extra["objs"][-1][1]:
+                    print("Inconsistent optimal objective value between runs. Quitting...")
+                    score = conf.SCORE_INCORRECT_ANSWER
+                    status = "inconsistentOptimalValues"
+                    return score, get_results()
+
+            # if the instance is of an unwanted type, we stop immediately
+            if len(unwantedTypes) > 0 and instanceType and (instanceType in unwantedTypes):
+                print("Unwanted instance type. Quitting...")
+                score = conf.SCORE_UNWANTED_TYPE
+                status = "unwantedType"
+                # TODO: in this context, we don't really need to run the oracle to check correctness of instance type, since return scores for unwanted type and incorrect results are the same. But if we decide to have the two scores being different, we may need to use the oracle here
                 return score, get_results()
 
-        # if the instance is of an unwanted type, we stop immediately
-        if len(unwantedTypes) > 0 and instanceType and (instanceType in unwantedTypes):
-            print("Unwanted instance type. Quitting...")
-            score = conf.SCORE_UNWANTED_TYPE
-            status = "unwantedType"
-            # TODO: in this context, we don't really need to run the oracle to check correctness of instance type, since return scores for unwanted type and incorrect results are the same. But if we decide to have the two scores being different, we may need to use the oracle here
-            return score, get_results()
+            # with early stopping, the remaining seeds are skipped as soon as the median run is known to be too easy/too difficult
+            if earlyStopping and (i < nEvaluations - 1):
+                decision = get_mzn_graded_median_decision(
+                    results["main"]["runs"], nEvaluations, minTime, problemType, instanceType
+                )
+                if decision:
+                    print(f"Instance is {decision} after {i + 1} runs. Skipping the remaining seeds...")
+                    results["earlyStopping"] = {
+                        "nRunsDone": i + 1,
+                        "skippedSeeds": [initSeed + j if initSeed else None for j in range(i + 1, nEvaluations)],
+                    }
+                    score = conf.SCORE_TOO_EASY if decision == "tooEasy" else conf.SCORE_TOO_DIFFICULT
+                    status = decision
+                    return score, get_results()
+    finally:
+        # stop runs that are no longer needed
+        if scheduler:
+            scheduler.shutdown()
 
     # get the median run
     results["main"]["runs"] = sorted(
@@ -0,0 +1,99 @@
+import os
+import sys
+import time
+import errno
+import select
+import ctypes
+import ctypes.util
+
+scriptDir = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(scriptDir)
+
+# waiting for output files of solvers and translators (e.g., Savile Row info files) to appear
+# - on Linux, the parent directory of the file is watched with inotify, so that the wait ends as soon as the file is created
+# - files created by another machine on a shared filesystem (e.g., NFS) don't trigger inotify events, so the file is also re-checked with an exponential backoff (from MIN_DELAY to MAX_DELAY seconds). The backoff is the only mechanism when inotify is not available
+
+MIN_DELAY = 0.001
+MAX_DELAY = 1.0
+
+# inotify constants, see /usr/include/linux/inotify.h
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = getattr(os, "O_CLOEXEC", 0)
+
+libc = None
+
+
+def get_libc():
+    """
+    return libc if inotify is supported, None otherwise
+    """
+    global libc
+    if libc is None:
+        libc = False
+        if sys.platform.startswith("linux"):
+            try:
+                lib = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+                if hasattr(lib, "inotify_init1") and hasattr(lib, "inotify_add_watch"):
+                    libc = lib
+            except OSError:
+                pass
+    return libc or None
+
+
+def open_watch(dirName):
+    """
+    start watching a directory for new files, return an inotify file descriptor or None
+    """
+    lib = get_libc()
+    if lib is None:
+        return None
+    fd = lib.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+    if fd < 0:  # e.g., max_user_instances is reached
+        return None
+    if lib.inotify_add_watch(fd, os.fsencode(dirName), IN_CREATE | IN_MOVED_TO | IN_CLOSE_WRITE) < 0:
+        os.close(fd)
+        return None
+    return fd
+
+
+def drain(fd):
+    try:
+        while os.read(fd, 4096):
+            pass
+    except OSError as e:
+        if e.errno not in [errno.EAGAIN, errno.EWOULDBLOCK]:
+            raise
+
+
+def wait_for_file(fn, timeout=60, stopIf=None):
+    """
+    wait until a file exists
+        - timeout: max waiting time (in seconds)
+        - stopIf: a function called while waiting, the wait is aborted if it returns True (e.g., when the process that should create the file is dead)
+    return the time spent on waiting (in seconds), raise an exception if the file doesn't appear
+    """
+    start = time.time()
+    if os.path.exists(fn):
+        return 0
+    fd = open_watch(os.path.dirname(os.path.abspath(fn)))
+    try:
+        delay = MIN_DELAY
+        # the file may have been created before the watch started
+        while not os.path.exists(fn):
+            elapsed = time.time() - start
+            if (elapsed >= timeout) or (stopIf and stopIf()):
+                raise Exception(f"Waited {elapsed:.2f}s for file {fn} to appear")
+            wait = min(delay, timeout - elapsed)
+            if fd is None:
+                time.sleep(wait)
+            elif select.select([fd], [], [], wait)[0]:
+                drain(fd)
+                continue
+            delay = min(delay * 2, MAX_DELAY)
+    finally:
+        if fd is not None:
+            os.close(fd)
+    return time.time() - start
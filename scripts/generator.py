@@ -1,4 +1,8 @@
 import os
+import json
+import fcntl
+import shutil
+import hashlib
 
 import sys
 
@@ -14,7 +18,193 @@ from essence_pipeline_utils import (
     conjure_translate_solution,
 )
 
-from utils import delete_file, log
+from negative_table import is_already_generated, record_duplicates, restore_exclusions
+from minion_solution import translate_minion_solution
+from utils import delete_file, log, read_file
+
+import conf
+import artifact_store
+
+
+def get_generator_artifacts(minionFile):
+    # files kept between runs of the same generator instance, so that Savile Row is only called once
+    return [minionFile, minionFile.replace(".minion", ".aux")]
+
+
+def get_pool_file(minionFile):
+    return minionFile.replace(".minion", ".pool")
+
+
+def get_pool_lease_file(minionFile):
+    return minionFile.replace(".minion", ".pool-leases")
+
+
+def is_process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def read_pool_leases(minionFile):
+    """
+    solutions of the solution pool of a generator instance that are being evaluated by a wrapper run, with the pid of the run
+    a lease lasts as long as the run's process, so leases of runs that have ended or died are dropped (each wrapper run is a separate process, see wrapper.run_to_output_file)
+    must be called with the lock of the generator instance held
+    """
+    leaseFile = get_pool_lease_file(minionFile)
+    if not os.path.isfile(leaseFile):
+        return {}
+    with open(leaseFile, "rt") as f:
+        leases = json.load(f)
+    return {s: pid for s, pid in leases.items() if is_process_alive(pid)}
+
+
+def write_pool_leases(minionFile, leases):
+    leaseFile = get_pool_lease_file(minionFile)
+    with open(leaseFile + ".tmp", "wt") as f:
+        json.dump(leases, f)
+    os.replace(leaseFile + ".tmp", leaseFile)
+
+
+def take_from_pool(minionFile):
+    """
+    get the first solution in the solution pool of a generator instance that hasn't been generated yet and isn't leased by another run, or "" if there is none
+    the solution is leased to the current run, so that parallel runs of the same configuration never get the same solution. It stays in the pool until it's evaluated (see remove_from_pool), so that it's used again if the wrapper run is terminated before
+    """
+    poolFile = get_pool_file(minionFile)
+    with open(minionFile + ".lock", "at") as lockFile:
+        fcntl.flock(lockFile, fcntl.LOCK_EX)
+        if not os.path.isfile(poolFile):
+            return ""
+        lsSols = [s for s in read_file(poolFile) if s.strip() != ""]
+    # is_already_generated takes the lock itself, so candidates are checked before the lease is taken
+    lsCandidates = [s for s in lsSols if not is_already_generated(minionFile, s)]
+    with open(minionFile + ".lock", "at") as lockFile:
+        fcntl.flock(lockFile, fcntl.LOCK_EX)
+        # solutions may have left the pool or been leased in the meantime
+        if not os.path.isfile(poolFile):
+            return ""
+        lsPool = [s.strip() for s in read_file(poolFile)]
+        leases = read_pool_leases(minionFile)
+        for s in lsCandidates:
+            if (s.strip() in lsPool) and (s.strip() not in leases):
+                leases[s.strip()] = os.getpid()
+                write_pool_leases(minionFile, leases)
+                return s
+    return ""
+
+
+def get_pool_count(minionFile):
+    """
+    number of solutions in the solution pool of a generator instance (leased or not)
+    """
+    poolFile = get_pool_file(minionFile)
+    with open(minionFile + ".lock", "at") as lockFile:
+        fcntl.flock(lockFile, fcntl.LOCK_EX)
+        if not os.path.isfile(poolFile):
+            return 0
+        return len([s for s in read_file(poolFile) if s.strip() != ""])
+
+
+def add_to_pool(minionFile, lsSols):
+    lsSols = [s.strip() for s in lsSols if not is_already_generated(minionFile, s)]
+    poolFile = get_pool_file(minionFile)
+    with open(minionFile + ".lock", "at") as lockFile:
+        fcntl.flock(lockFile, fcntl.LOCK_EX)
+        lsPool = []
+        if os.path.isfile(poolFile):
+            lsPool = [s.strip() for s in read_file(poolFile)]
+        with open(poolFile, "at") as f:
+            for s in lsSols:
+                if s not in lsPool:
+                    f.write(s + "\n")
+                    lsPool.append(s)
+
+
+def remove_from_pool(minionFile, minionSolString):
+    """
+    remove a solution from the solution pool of a generator instance once its instance has been evaluated, and release its lease
+    """
+    poolFile = get_pool_file(minionFile)
+    with open(minionFile + ".lock", "at") as lockFile:
+        fcntl.flock(lockFile, fcntl.LOCK_EX)
+        if (minionSolString.strip() == "") or (not os.path.isfile(poolFile)):
+            return
+        lsSols = [s for s in read_file(poolFile) if s.strip() not in ["", minionSolString.strip()]]
+        with open(poolFile, "wt") as f:
+            f.write("".join([s + "\n" for s in lsSols]))
+        leases = read_pool_leases(minionFile)
+        leases.pop(minionSolString.strip(), None)
+        write_pool_leases(minionFile, leases)
+
+
+def release_generator_artifacts(minionFile):
+    """
+    called once a wrapper run is done with the minion file of a generator instance (including the update of its negative table)
+    """
+    if artifact_store.is_enabled():
+        artifact_store.release(get_generator_artifacts(minionFile))
+
+
+def get_generator_instance_hash(paramDict):
+    # canonical hash of generator parameter values: configurations with the same values have the same generator instance
+    s = json.dumps(sorted([(key, str(val).strip()) for key, val in paramDict.items()]))
+    return hashlib.md5(s.encode()).hexdigest()
+
+
+def translate_generator_instance(paramDict, paramFile, eprimeModelFile, setting, detailedOutputDir):
+    """
+    translate a generator instance into minion input format with conjure and Savile Row, only once per set of generator parameter values
+    the translation is shared by all configurations with the same parameter values: detailed-output/gen-trans-<hash>.minion/.aux, with results of the translation in detailed-output/gen-trans-<hash>.json
+    return the translation status (SRok/SRTimeOut/SRMemOut), the time spent on translating, and the shared minion/aux files
+    """
+    transBaseFileName = detailedOutputDir + "/gen-trans-" + get_generator_instance_hash(paramDict)
+    transMinionFile = transBaseFileName + ".minion"
+    transAuxFile = transBaseFileName + ".aux"
+    transResultFile = transBaseFileName + ".json"
+    transArtifacts = [transMinionFile, transAuxFile]
+    SRTime = 0
+    # configurations with the same parameter values running in parallel wait for each other, so the translation is done only once
+    with open(transBaseFileName + ".lock", "at") as lockFile:
+        fcntl.flock(lockFile, fcntl.LOCK_EX)
+        if artifact_store.is_enabled():
+            artifact_store.fetch(transArtifacts)
+        transResults = None
+        if os.path.isfile(transResultFile):
+            with open(transResultFile, "rt") as f:
+                transResults = json.load(f)
+            # artifacts of a successful translation can be evicted from the artifact store
+            if (transResults["status"] == "SRok") and not all([os.path.isfile(fn) for fn in transArtifacts]):
+                transResults = None
+        if transResults is None:
+            eprimeParamFile = transBaseFileName + ".eprime-param"
+            if conjure_translate_parameter(
+                eprimeModelFile, paramFile, eprimeParamFile, timelimit=setting["genSRTimeLimit"]
+            ):  # translate generator instance from Essence to Essence Prime
+                status, SRTime = savilerow_translate(
+                    transAuxFile,
+                    eprimeModelFile,
+                    eprimeParamFile,
+                    transMinionFile,
+                    setting["genSRTimeLimit"],
+                    setting["genSRFlags"],
+                )  # translate generator instance from Essence Prime to minion input format
+                os.remove(eprimeParamFile)
+            else:
+                # conjure couldn't translate the generator instance within Savile Row's time limit
+                status = "SRTimeOut"
+            transResults = {"status": status, "SRTime": SRTime}
+            with open(transResultFile, "wt") as f:
+                json.dump(transResults, f)
+        else:
+            log(f"Reusing translation {transMinionFile} of the same generator parameter values")
+        if artifact_store.is_enabled():
+            artifact_store.release(transArtifacts)
+    return transResults["status"], SRTime, transMinionFile, transAuxFile
 
 
 def solve_generator(configurationId, paramDict, setting, seed, detailedOutputDir):
@@ -53,44 +243,115 @@ def solve_generator(configurationId, paramDict, setting, seed, detailedOutputDir
     minionSolString = ""  # content of minion solution file, to be added to minion negative table in minionFile
 
     # status of the solving
-    genStatus = None  # SRTimeOut/SRMemOut/solverTimeOut/solverMemOut/sat/unsat
+    genStatus = None  # SRTimeOut/SRMemOut/solverTimeOut/solverMemOut/sat/unsat/duplicate/exhausted
+
+    # if artifacts of the generator instance have been compressed, get them back
+    if artifact_store.is_enabled():
+        artifact_store.fetch(get_generator_artifacts(minionFile))
 
-    # if the generator instance is solved for the first time
+    # if the generator instance is solved for the first time (or its artifacts have been evicted from the artifact store)
+    # the translation is shared with other configurations with the same parameter values, while each configuration has its own copy of the minion file for its own negative table
     if (not os.path.exists(minionFile)) or (os.stat(minionFile).st_size == 0):
-        eprimeParamFile = baseFileName + ".eprime-param"
-        conjure_translate_parameter(
-            eprimeModelFile, paramFile, eprimeParamFile
-        )  # translate generator instance from Essence to Essence Prime
-        genStatus, genSRTime = savilerow_translate(
-            auxFile,
-            eprimeModelFile,
-            eprimeParamFile,
-            minionFile,
-            setting["genSRTimeLimit"],
-            setting["genSRFlags"],
-        )  # translate generator instance from Essence Prime to minion input format
-        os.remove(eprimeParamFile)
+        genStatus, genSRTime, transMinionFile, transAuxFile = translate_generator_instance(
+            paramDict, paramFile, eprimeModelFile, setting, detailedOutputDir
+        )
+        if genStatus == "SRok":
+            shutil.copyfile(transAuxFile, auxFile)
+            shutil.copyfile(transMinionFile, minionFile + ".tmp")
+            os.replace(minionFile + ".tmp", minionFile)
+            restore_exclusions(
+                minionFile, setting["genExclusion"], setting["genExclusionShardSize"]
+            )
     else:
         genStatus = "SRok"
         genSRTime = 0
 
     # start solving it
     if genStatus == "SRok":
-        genStatus, genSolverTime = run_minion(
-            minionFile,
-            minionSolFile,
-            seed,
-            setting["genSolverTimeLimit"],
-            setting["genSolverFlags"],
-        )
+        poolSize = setting["genSolutionPoolSize"]
+
+        def solve_with_minion(minionSeed, timeLimit):
+            # return solving status, solving time, and a new solution (or "" if all solutions found are already generated)
+            genSolverFlags = setting["genSolverFlags"]
+            if poolSize > 1:
+                # solutions in the pool (being evaluated by other runs, or not yet taken) are not excluded from the minion file, so minion may find them again: we ask for enough solutions to get poolSize solutions that aren't in the pool yet
+                solLimit = poolSize + get_pool_count(minionFile)
+                genSolverFlags += f" -sollimit {solLimit}"
+            status, solverTime = run_minion(
+                minionFile, minionSolFile, minionSeed, timeLimit, genSolverFlags
+            )
+            # when asking for several solutions, minion may time out after finding some of them
+            lsSols = []
+            if (status == "sat") or ((poolSize > 1) and (status == "solverTimeOut")):
+                lsSols = [s for s in parse_minion_solution(minionSolFile).split("\n") if s.strip() != ""]
+            if len(lsSols) == 0:
+                return status, solverTime, ""
+            if poolSize > 1:
+                add_to_pool(minionFile, lsSols)
+                minionSolString = take_from_pool(minionFile)
+                # minion found all solutions of the generator instance, and all of them have already been generated or are being evaluated by other runs: same as an unsat generator instance once those runs are done
+                if (minionSolString == "") and (status == "sat") and (len(lsSols) < solLimit):
+                    log("All solutions of the generator instance are already generated or being evaluated by other runs")
+                    return "exhausted", solverTime, ""
+                # minion timed out before finding a solution that isn't in the pool
+                if (minionSolString == "") and (status == "solverTimeOut"):
+                    return "solverTimeOut", solverTime, ""
+                return "sat", solverTime, minionSolString
+            if (setting["genExclusion"] == "externalDedupe") and is_already_generated(minionFile, lsSols[0]):
+                return "sat", solverTime, ""
+            return "sat", solverTime, lsSols[0]
+
+        # serve the generator instance from its solution pool if possible
+        if poolSize > 1:
+            minionSolString = take_from_pool(minionFile)
+        if minionSolString != "":
+            log("Using a solution from the solution pool of the generator instance")
+            genStatus = "sat"
+            genSolverTime = 0
+        else:
+            genStatus, genSolverTime, minionSolString = solve_with_minion(
+                seed, setting["genSolverTimeLimit"]
+            )
+
+        # with the externalDedupe exclusion backend, previously generated solutions are not excluded by minion, so we restart minion with another random seed until a new solution is found
+        nRestarts = 0
+        while (genStatus == "sat") and (minionSolString == ""):
+            nRestarts += 1
+            remainingTime = float(setting["genSolverTimeLimit"]) - genSolverTime
+            if (nRestarts > conf.genDedupeMaxRestarts) or (remainingTime <= 0):
+                # the generator instance is exhausted if it keeps giving duplicates, otherwise it's penalised like a minion timeout (see wrapper.py)
+                if (setting["genExclusion"] == "externalDedupe") and (
+                    record_duplicates(minionFile, nRestarts) >= conf.genDedupeMaxDuplicates
+                ):
+                    genStatus = "exhausted"
+                else:
+                    genStatus = "duplicate"
+                break
+            log(f"Solution already generated, restarting minion ({nRestarts}/{conf.genDedupeMaxRestarts})")
+            delete_file([minionSolFile])
+            restartSeed = (seed + nRestarts * conf.genDedupeSeedStride) % conf.genDedupeMaxSeed
+            genStatus, restartTime, minionSolString = solve_with_minion(
+                restartSeed, int(max(1, remainingTime))
+            )
+            genSolverTime += restartTime
+
         if genStatus == "sat":
-            minionSolString = parse_minion_solution(minionSolFile)
-            savilerow_parse_solution(
-                eprimeModelFile, minionSolFile, auxFile, eprimeSolFile
-            )  # parse solution from minion to Essence Prime
-            conjure_translate_solution(
-                eprimeModelFile, paramFile, eprimeSolFile, essenceSolFile
-            )  # parse solution from Essence Prime to Essence
+            # minion's solution file may contain several solutions, only keep the one being used
+            with open(minionSolFile, "wt") as f:
+                f.write(minionSolString + "\n")
+            # translate the solution to Essence directly if possible, otherwise use Savile Row and conjure
+            if not (
+                conf.genNativeSolutionTranslation
+                and translate_minion_solution(
+                    eprimeModelFile, paramFile, minionFile, minionSolString, essenceSolFile
+                )
+            ):
+                savilerow_parse_solution(
+                    eprimeModelFile, minionSolFile, auxFile, eprimeSolFile
+                )  # parse solution from minion to Essence Prime
+                conjure_translate_solution(
+                    eprimeModelFile, paramFile, eprimeSolFile, essenceSolFile
+                )  # parse solution from Essence Prime to Essence
         delete_file(
             [minionSolFile, eprimeSolFile]
         )  # delete minionSolFile after used, otherwise the negativetable will have duplicated items. eprimeSolFile is removed to make sure that in the next runs, if no solution is found by minion, no Essence solution file is created
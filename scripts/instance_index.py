@@ -0,0 +1,49 @@
+import os
+import sys
+import json
+import hashlib
+import tempfile
+
+scriptDir = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(scriptDir)
+
+from conf import detailedOutputDir
+from utils import log
+
+# index of instances already evaluated during the current experiment, shared by all wrapper runs
+# each evaluated instance has an entry file detailed-output/instance-index/<md5sum of the instance file>.json, containing the score and results of its evaluation
+# entries are written atomically (write to a temporary file, then rename), so the index is safe to use by wrapper runs running in parallel. If two runs evaluate the same instance at the same time, both of them do the evaluation and the last one to finish overwrites the entry.
+
+indexDir = detailedOutputDir + "/instance-index"
+
+
+def get_instance_hash(instFile):
+    # use md5, same as extract-md5sum.sh
+    with open(instFile, "rb") as f:
+        return hashlib.md5(f.read()).hexdigest()
+
+
+def lookup(instanceHash):
+    """
+    return the index entry of an instance, or None if the instance has not been evaluated yet
+    """
+    fn = os.path.join(indexDir, instanceHash + ".json")
+    if not os.path.isfile(fn):
+        return None
+    with open(fn, "rt") as f:
+        entry = json.load(f)
+    log(f"Instance already evaluated: {entry['instFile']}")
+    return entry
+
+
+def record(instanceHash, instFile, score, instanceResults):
+    """
+    add an evaluated instance into the index
+        - instFile: the instance file used in the evaluation (.param or .dzn)
+    """
+    os.makedirs(indexDir, exist_ok=True)
+    entry = {"instFile": instFile, "score": score, "instanceResults": instanceResults}
+    fd, tmpFile = tempfile.mkstemp(dir=indexDir, suffix=".tmp")
+    with os.fdopen(fd, "wt") as f:
+        json.dump(entry, f)
+    os.replace(tmpFile, os.path.join(indexDir, instanceHash + ".json"))
@@ -0,0 +1,128 @@
+import os
+import sys
+import shutil
+import signal
+import tempfile
+
+scriptDir = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(scriptDir)
+
+import process_engine
+import resource_usage
+
+# resource-limited launcher for the external tools of the Essence pipeline (conjure solve, savilerow, minion and the other backend solvers)
+# - with runsolver (when it's in PATH, on Linux), wall-clock/CPU/memory limits are enforced on the whole process tree of a call (e.g., conjure -> savilerow -> solver), same as for MiniZinc runs (see minizinc_utils.minizinc_solve)
+# - otherwise, CPU time and memory (address space) limits are set on each process with setrlimit, and the wall-clock limit is enforced by the process engine on the whole process group
+# - in both cases, the call's CPU time (user+sys) and peak resident memory are measured with wait4 (see process_engine.py). They include all descendants the call's process waited for
+# limits are a safety net on top of the tools' own limits (e.g., minion -timelimit): callers give each tool a margin (LIMIT_MARGIN) so that the tool normally stops by itself
+# memory limits should not be used for Java-based tools (conjure solve, savilerow): the JVM reserves a large address space upfront and limits its heap by itself
+
+# extra time (in seconds) given to a tool on top of its own time limit before it's stopped by the launcher
+LIMIT_MARGIN = 10
+
+# delay (in seconds) between SIGTERM and SIGKILL when a limit is reached
+KILL_DELAY = 2
+
+
+def get_wall_time_limit(toolTimeLimit):
+    """
+    wall-clock limit of a tool call, given the tool's own time limit (in seconds, 0 or None for no limit)
+    """
+    if (toolTimeLimit is None) or (toolTimeLimit <= 0):
+        return None
+    return toolTimeLimit + LIMIT_MARGIN
+
+
+def has_runsolver():
+    return sys.platform.startswith("linux") and (shutil.which("runsolver") is not None)
+
+
+def read_runsolver_var_file(fn):
+    """
+    read the values written by runsolver -v (key=value, comment lines start with #)
+    """
+    values = {}
+    if not os.path.isfile(fn):
+        return values
+    with open(fn, "rt") as f:
+        for line in f:
+            line = line.strip()
+            if (line == "") or line.startswith("#") or ("=" not in line):
+                continue
+            key, val = line.split("=", 1)
+            values[key.strip()] = val.strip()
+    return values
+
+
+def run_limited(cmd, wallTimeLimit=None, cpuTimeLimit=None, memLimit=None, **kwargs):
+    """
+    run a command with resource limits
+        - wallTimeLimit, cpuTimeLimit: in seconds, None for no limit
+        - memLimit: in MB, None for no limit
+        - kwargs: passed to process_engine.run (e.g., onLine, keepOutput)
+    return the command's output, its return code, and its resource usage: a dictionary with
+        - wallTime, cpuTime (in seconds), peakRSS (in MB)
+        - timeOut, memOut: whether the command was stopped because of a time/memory limit
+    """
+    tmpFiles = []
+    if has_runsolver() and ((wallTimeLimit is not None) or (cpuTimeLimit is not None) or (memLimit is not None)):
+        # runsolver's report goes to a watcher file, so that the command's output is unchanged
+        fd, watcherFile = tempfile.mkstemp(suffix=".runsolver")
+        os.close(fd)
+        fd, varFile = tempfile.mkstemp(suffix=".runsolver-var")
+        os.close(fd)
+        tmpFiles = [watcherFile, varFile]
+        runsolverCmd = f"runsolver -w {watcherFile} -v {varFile} -d {KILL_DELAY}"
+        if wallTimeLimit is not None:
+            runsolverCmd += f" --wall-clock-limit {int(wallTimeLimit)}"
+        if cpuTimeLimit is not None:
+            runsolverCmd += f" --cpu-limit {int(cpuTimeLimit)}"
+        if memLimit is not None:
+            runsolverCmd += f" --vsize-limit {int(memLimit)}"
+        args = process_engine.split_command(runsolverCmd) + process_engine.split_command(cmd)
+        # the process engine only stops runsolver if it doesn't stop by itself
+        p = process_engine.run(
+            args,
+            timeLimit=(wallTimeLimit + KILL_DELAY + LIMIT_MARGIN) if wallTimeLimit else None,
+            stage=resource_usage.get_stage(process_engine.split_command(cmd)),
+            **kwargs,
+        )
+        usage = p.get_resource_usage()
+        values = read_runsolver_var_file(varFile)
+        # CPU time of the whole process tree, as measured by runsolver
+        if "CPUTIME" in values:
+            usage["cpuTime"] = float(values["CPUTIME"])
+        usage["timeOut"] = p.timedOut or (values.get("TIMEOUT", "false") == "true")
+        usage["memOut"] = values.get("MEMOUT", "false") == "true"
+        returncode = p.returncode
+        if usage["timeOut"] or usage["memOut"]:
+            # the command was killed by runsolver, which doesn't report its return code
+            returncode = -signal.SIGKILL
+        else:
+            with open(watcherFile, "rt") as f:
+                for line in f:
+                    if "Child status" in line:
+                        returncode = int(line.split(":")[1].strip())
+    else:
+        p = process_engine.run(
+            cmd,
+            timeLimit=wallTimeLimit,
+            cpuTimeLimit=cpuTimeLimit,
+            memLimit=memLimit,
+            killDelay=KILL_DELAY,
+            **kwargs,
+        )
+        usage = p.get_resource_usage()
+        returncode = p.returncode
+        # SIGXCPU at the soft CPU limit, SIGKILL at the hard limit
+        usage["timeOut"] = p.timedOut or (
+            (cpuTimeLimit is not None)
+            and (returncode in [-signal.SIGXCPU, -signal.SIGKILL])
+            and (usage["cpuTime"] >= cpuTimeLimit)
+        )
+        # a process reaching its address space limit gets allocation errors, which are reported by the tools themselves
+        usage["memOut"] = False
+
+    for fn in tmpFiles:
+        os.remove(fn)
+    return p.output, returncode, usage
@@ -0,0 +1,297 @@
+import os
+import re
+import sys
+import json
+import functools
+
+scriptDir = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(scriptDir)
+
+from utils import log
+
+# in-process translation of a generator solution found by minion into an Essence parameter file, without calling Savile Row (savilerow -mode ReadSolution) and conjure (conjure translate-solution)
+# - the Essence find variables of the generator and their domains (with the representations chosen by conjure) are read from the header conjure writes at the end of the Essence Prime model (lines starting with "$ ")
+# - the value of each minion variable is read from the minion solution, in the order of the PRINT statement of the minion file
+# - index domains of matrices are read from the find declarations of the Essence Prime model, and evaluated with the parameter values of the generator instance
+# - minion variables are named after the Essence Prime variables by Savile Row: <name> for a single variable, <name>_<index 1>_<index 2>... for an element of a matrix (indices are padded with zeros, and prefixed with "n" when negative)
+# supported domains: int, bool, matrices (of any dimension) of int/bool, and sets of int with the Occurrence representation
+# the translation gives up (and translate_minion_solution returns False, so that the caller falls back to Savile Row and conjure) when:
+#   - a find variable has an unsupported domain or representation
+#   - a variable (or matrix element) has been removed by Savile Row, e.g., because its value is fixed by the generator's constraints. Its value is then only known to Savile Row, via the aux file
+
+ESSENCE_HEADER = "language Essence 1.3"
+
+# marker of the header written by conjure at the end of the Essence Prime model
+CONJURE_HEADER = "$ Conjure's"
+
+
+@functools.lru_cache(maxsize=None)
+def read_conjure_header(eprimeModelFile):
+    """
+    read the json object written by conjure at the end of an Essence Prime model, return None if there isn't one
+    """
+    lsLines = []
+    found = False
+    with open(eprimeModelFile, "rt") as f:
+        for line in f:
+            if line.startswith(CONJURE_HEADER):
+                found = True
+                continue
+            if found and line.startswith("$ "):
+                lsLines.append(line[2:])
+    if not found:
+        return None
+    try:
+        return json.loads("".join(lsLines))
+    except json.JSONDecodeError:
+        return None
+
+
+@functools.lru_cache(maxsize=None)
+def get_generator_variables(eprimeModelFile):
+    """
+    return the list of Essence find variables of a generator model and their domains (as written by conjure), or None if any of them is not supported
+    """
+    header = read_conjure_header(eprimeModelFile)
+    if header is None:
+        return None
+    representations = {}
+    for name, domain in header.get("representations", []):
+        if "Name" in name:
+            representations[name["Name"]] = domain
+    lsVars = []
+    for name in header.get("finds", []):
+        if ("Name" not in name) or (name["Name"] not in representations):
+            return None
+        domain = representations[name["Name"]]
+        if not is_supported_domain(domain):
+            log(f"Generator variable {name['Name']} has an unsupported domain, solutions will be translated by Savile Row and conjure")
+            return None
+        lsVars.append((name["Name"], domain))
+    return lsVars
+
+
+def is_supported_domain(domain, inMatrix=False):
+    if ("DomainInt" in domain) or ("DomainBool" in domain):
+        return True
+    if "DomainMatrix" in domain:
+        return is_supported_domain(domain["DomainMatrix"][1], inMatrix=True)
+    if ("DomainSet" in domain) and (not inMatrix):
+        setRepr, _, inner = domain["DomainSet"]
+        return (setRepr == {"Set_Occurrence": []}) and ("DomainInt" in inner)
+    return False
+
+
+def get_matrix_dimension(domain):
+    nDims = 0
+    while "DomainMatrix" in domain:
+        nDims += 1
+        domain = domain["DomainMatrix"][1]
+    return nDims, domain
+
+
+@functools.lru_cache(maxsize=None)
+def read_eprime_declarations(eprimeModelFile):
+    """
+    text of the domain of each find variable of an Essence Prime model (comments and line breaks removed)
+    """
+    with open(eprimeModelFile, "rt") as f:
+        text = " ".join([line.split("$")[0].strip() for line in f])
+    declarations = {}
+    keywords = r"\b(?:find|given|letting|where|such that|branching on|minimising|maximising|heuristic)\b"
+    for m in re.finditer(r"\bfind\s+(.*?)\s*:\s*(.*?)(?=" + keywords + "|$)", text):
+        for name in m.group(1).split(","):
+            declarations[name.strip()] = m.group(2).strip()
+    return declarations
+
+
+def split_top_level(s, sep=","):
+    lsParts = []
+    depth = 0
+    current = ""
+    for c in s:
+        depth += (c in "([") - (c in ")]")
+        if (c == sep) and (depth == 0):
+            lsParts.append(current.strip())
+            current = ""
+        else:
+            current += c
+    lsParts.append(current.strip())
+    return lsParts
+
+
+def evaluate_int_expression(expr, params):
+    """
+    evaluate an integer expression of an Essence Prime model (constants, parameters, + - * / % **, brackets)
+    return None if the expression is not supported
+    """
+    lsTokens = re.findall(r"\s*([0-9]+|[A-Za-z_][A-Za-z0-9_]*|\*\*|[-+*/%()]|\S)", expr)
+    pyExpr = ""
+    for token in lsTokens:
+        if token[0].isdigit() or token in ["+", "-", "*", "**", "%", "(", ")"]:
+            pyExpr += token
+        elif token == "/":  # integer division rounds down in Essence Prime, same as in python
+            pyExpr += "//"
+        elif token in params:
+            pyExpr += "(" + str(params[token]) + ")"
+        else:
+            return None
+    try:
+        return int(eval(pyExpr, {"__builtins__": {}}, {}))
+    except (SyntaxError, ZeroDivisionError, TypeError):
+        return None
+
+
+def get_index_ranges(eprimeModelFile, name, params):
+    """
+    return the index range (lb, ub) of each dimension of an Essence Prime matrix variable, or None if they can't be computed
+    """
+    domain = read_eprime_declarations(eprimeModelFile).get(name, None)
+    lsRanges = []
+    while (domain is not None) and domain.startswith("matrix indexed by"):
+        m = re.match(r"matrix indexed by\s*\[(.*?)\]\s*of\s+(.*)$", domain)
+        if m is None:
+            return None
+        for indexDomain in split_top_level(m.group(1)):
+            r = re.match(r"^int\s*\((.*)\.\.(.*)\)$", indexDomain)
+            if r is None:  # e.g., a union of ranges
+                return None
+            lb = evaluate_int_expression(r.group(1), params)
+            ub = evaluate_int_expression(r.group(2), params)
+            if (lb is None) or (ub is None):
+                return None
+            lsRanges.append((lb, ub))
+        domain = m.group(2).strip()
+    if len(lsRanges) == 0:
+        return None
+    return lsRanges
+
+
+def read_minion_print_variables(minionFile):
+    """
+    names of the variables in the PRINT statement of a minion file, in order
+    only the beginning of the file is read (the PRINT statement is in the SEARCH section, before the constraints and negative tables)
+    """
+    s = None
+    with open(minionFile, "rt") as f:
+        for line in f:
+            if s is None:
+                if line.strip().startswith("PRINT"):
+                    s = ""
+                elif line.startswith("**CONSTRAINTS**") or line.startswith("**TUPLELIST**"):
+                    break
+            if s is not None:
+                s += line.strip()
+                if s.count("[") == s.count("]"):
+                    break
+    if s is None:
+        return None
+    return [v for v in re.split(r"[\[\],\s]+", s[len("PRINT") :]) if v != ""]
+
+
+def parse_index(s):
+    if s.startswith("n"):
+        return -int(s[1:])
+    return int(s)
+
+
+def get_elements(values, name, nDims):
+    """
+    values of the elements of an Essence Prime matrix variable, as a dictionary {index tuple: value}
+    """
+    pattern = re.compile("^" + re.escape(name) + "((?:_n?[0-9]+){" + str(nDims) + "})$")
+    elements = {}
+    for varName, val in values.items():
+        m = pattern.match(varName)
+        if m:
+            elements[tuple([parse_index(s) for s in m.group(1)[1:].split("_")])] = val
+    return elements
+
+
+def is_full_matrix(elements, lsRanges):
+    """
+    check if all elements of a matrix are in the minion solution (some of them may have been removed by Savile Row)
+    """
+    nElements = 1
+    for lb, ub in lsRanges:
+        nElements *= ub - lb + 1
+    if nElements != len(elements):
+        return False
+    return all([lb <= t[d] <= ub for t in elements for d, (lb, ub) in enumerate(lsRanges)])
+
+
+def format_value(val, isBool):
+    if isBool:
+        return "true" if val == 1 else "false"
+    return str(val)
+
+
+def format_matrix(elements, lsRanges, isBool, prefix=()):
+    lb, ub = lsRanges[len(prefix)]
+    lsVals = []
+    for i in range(lb, ub + 1):
+        if len(prefix) + 1 == len(lsRanges):
+            lsVals.append(format_value(elements[prefix + (i,)], isBool))
+        else:
+            lsVals.append(format_matrix(elements, lsRanges, isBool, prefix + (i,)))
+    return "[" + ", ".join(lsVals) + f"; int({lb}..{ub})]"
+
+
+def get_essence_value(values, name, domain, eprimeModelFile, params):
+    """
+    Essence value of a find variable, or None if it can't be retrieved from the minion solution
+    """
+    if "DomainSet" in domain:  # Occurrence representation: a matrix of bool indexed by the set's domain
+        lsRanges = get_index_ranges(eprimeModelFile, name + "_Occurrence", params)
+        elements = get_elements(values, name + "_Occurrence", 1)
+        if (lsRanges is None) or (len(lsRanges) != 1) or (not is_full_matrix(elements, lsRanges)):
+            return None
+        return "{" + ", ".join([str(t[0]) for t in sorted(elements) if elements[t] == 1]) + "}"
+
+    nDims, baseDomain = get_matrix_dimension(domain)
+    isBool = "DomainBool" in baseDomain
+    if nDims == 0:
+        if name not in values:
+            return None
+        return format_value(values[name], isBool)
+    lsRanges = get_index_ranges(eprimeModelFile, name, params)
+    elements = get_elements(values, name, nDims)
+    if (lsRanges is None) or (len(lsRanges) != nDims) or (not is_full_matrix(elements, lsRanges)):
+        return None
+    return format_matrix(elements, lsRanges, isBool)
+
+
+def read_int_params(paramFile):
+    params = {}
+    with open(paramFile, "rt") as f:
+        for m in re.finditer(r"letting\s+([A-Za-z_][A-Za-z0-9_]*)\s+be\s+(-?[0-9]+)\b", f.read()):
+            params[m.group(1)] = int(m.group(2))
+    return params
+
+
+def translate_minion_solution(eprimeModelFile, paramFile, minionFile, minionSolString, essenceSolFile):
+    """
+    translate a minion solution of a generator instance into an Essence parameter file
+        - paramFile: the generator instance, needed when index domains of matrices depend on the generator's parameters
+    return True if the translation is successful, False if it's not supported (essenceSolFile is not written, and the solution must be translated by Savile Row and conjure)
+    """
+    lsVars = get_generator_variables(eprimeModelFile)
+    if lsVars is None:
+        return False
+    lsNames = read_minion_print_variables(minionFile)
+    lsValues = minionSolString.split()
+    if (lsNames is None) or (len(lsNames) != len(lsValues)):
+        return False
+    values = dict(zip(lsNames, [int(v) for v in lsValues]))
+    params = read_int_params(paramFile)
+
+    lsLines = [ESSENCE_HEADER, ""]
+    for name, domain in lsVars:
+        val = get_essence_value(values, name, domain, eprimeModelFile, params)
+        if val is None:
+            log(f"Generator variable {name} is not fully in the minion solution, the solution will be translated by Savile Row and conjure")
+            return False
+        lsLines.append(f"letting {name} be {val}")
+    with open(essenceSolFile, "wt") as f:
+        f.write("\n".join(lsLines) + "\n")
+    return True
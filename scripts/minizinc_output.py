@@ -0,0 +1,186 @@
+import os
+import re
+import sys
+import json
+import functools
+from collections import deque
+
+scriptDir = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(scriptDir)
+
+import process_engine
+
+# streaming parser of minizinc output
+#   - each output line is turned into typed events as soon as it is read: solution, statistics, status, error
+#   - MiniZinc's --json-stream mode is used when available (MiniZinc >= 2.6), the legacy text output is parsed otherwise
+#   - the raw output is not kept, except for a bounded ring buffer of the last lines (for diagnostics) and a flag telling whether an out-of-memory marker has been seen, so memory use doesn't depend on the length of the run
+#
+# events are dicts with a "type" field:
+#   - {"type": "solution", "assignments": {name: dzn value}, "objective": float or None}
+#   - {"type": "statistics", "statistics": {name: value}}
+#   - {"type": "status", "status": one of STATUSES}
+#   - {"type": "error", "message": str}
+
+# final statuses, named as in --json-stream mode
+STATUSES = [
+    "ALL_SOLUTIONS",
+    "OPTIMAL_SOLUTION",
+    "UNSATISFIABLE",
+    "UNBOUNDED",
+    "UNSAT_OR_UNBOUNDED",
+    "UNKNOWN",
+    "ERROR",
+]
+
+# status lines of the legacy text output
+TEXT_STATUSES = {
+    "==========": "OPTIMAL_SOLUTION",
+    "=====UNSATISFIABLE=====": "UNSATISFIABLE",
+    "=====UNBOUNDED=====": "UNBOUNDED",
+    "=====UNSATorUNBOUNDED=====": "UNSAT_OR_UNBOUNDED",
+    "=====UNKNOWN=====": "UNKNOWN",
+    "=====ERROR=====": "ERROR",
+}
+
+# markers of out-of-memory errors in minizinc/solver output
+OUT_OF_MEMORY_MARKERS = [
+    "OutOfMemoryError",
+    "std::bad_alloc",
+    "MiniZinc: internal error: out of memory",
+]
+
+# number of raw output lines kept for diagnostics, and max length of each of them
+DIAGNOSTIC_LINES = 100
+DIAGNOSTIC_LINE_LENGTH = 1000
+
+
+@functools.lru_cache(maxsize=None)
+def supports_json_stream():
+    """
+    check if the installed minizinc supports --json-stream (MiniZinc >= 2.6)
+    """
+    try:
+        output = process_engine.run("minizinc --version", timeLimit=60).output
+    except OSError:
+        return False
+    m = re.search(r"version (\d+)\.(\d+)", output)
+    if m is None:
+        return False
+    return (int(m.group(1)), int(m.group(2))) >= (2, 6)
+
+
+def parse_dzn_assignments(s):
+    """
+    parse a dzn solution (e.g., "x = 3;\ny = [1, 2];\n") into a dictionary {name: value}, values are kept as dzn strings
+    """
+    assignments = {}
+    for statement in s.split(";"):
+        statement = statement.strip()
+        if (statement == "") or statement.startswith("%") or (" = " not in statement):
+            continue
+        lhs, rhs = statement.split(" = ", 1)
+        assignments[lhs.strip()] = rhs.strip()
+    return assignments
+
+
+def parse_statistic_value(s):
+    for t in [int, float]:
+        try:
+            return t(s)
+        except ValueError:
+            pass
+    return s.strip('"')
+
+
+class MiniZincOutputParser:
+    """
+    streaming parser of minizinc output, call feed() on each output line (stdout and stderr)
+        - jsonStream: whether minizinc is called with --json-stream
+    """
+
+    def __init__(self, jsonStream: bool):
+        self.jsonStream = jsonStream
+        self.tail = deque(maxlen=DIAGNOSTIC_LINES)
+        self.outOfMemory = False
+        # text mode only: lines of the solution being printed
+        self.solutionLines = []
+
+    def feed(self, line):
+        """
+        parse an output line, return the list of events it produces
+        """
+        self.tail.append(line[:DIAGNOSTIC_LINE_LENGTH])
+        if (not self.outOfMemory) and any(s in line for s in OUT_OF_MEMORY_MARKERS):
+            self.outOfMemory = True
+        line = line.strip()
+        if line == "":
+            return []
+        if self.jsonStream and line.startswith("{"):
+            try:
+                message = json.loads(line)
+            except json.JSONDecodeError:
+                return []
+            return self.parse_json_message(message)
+        # lines that are not part of the json stream (e.g., printed by runsolver or by a crashing solver) are parsed as text output
+        return self.parse_text_line(line)
+
+    def get_diagnostics(self):
+        """
+        last lines of the output
+        """
+        return "".join(self.tail)
+
+    def solution_event(self, assignments, objective=None):
+        if (objective is None) and ("_objective" in assignments):
+            objective = assignments["_objective"]
+        if objective is not None:
+            objective = float(objective)
+        return {"type": "solution", "assignments": assignments, "objective": objective}
+
+    def parse_json_message(self, message):
+        messageType = message.get("type", None)
+        if messageType == "solution":
+            output = message.get("output", {})
+            assignments = {}
+            objective = None
+            if isinstance(output.get("json", None), dict):
+                objective = output["json"].get("_objective", None)
+            for section in ["dzn", "default", "raw"]:
+                if isinstance(output.get(section, None), str):
+                    assignments = parse_dzn_assignments(output[section])
+                    break
+            return [self.solution_event(assignments, objective)]
+        if messageType == "statistics":
+            return [{"type": "statistics", "statistics": message.get("statistics", {})}]
+        if messageType == "status":
+            return [{"type": "status", "status": message["status"]}]
+        if messageType == "error":
+            errorMessage = message.get("message", "")
+            if "what" in message:
+                errorMessage = message["what"] + ": " + errorMessage
+            if any(s in errorMessage for s in OUT_OF_MEMORY_MARKERS):
+                self.outOfMemory = True
+            return [{"type": "error", "message": errorMessage}]
+        # warnings, comments, timestamps, etc are ignored
+        return []
+
+    def parse_text_line(self, line):
+        if line in TEXT_STATUSES:
+            return [{"type": "status", "status": TEXT_STATUSES[line]}]
+        if line == "----------":  # end of a solution
+            assignments = parse_dzn_assignments("\n".join(self.solutionLines))
+            self.solutionLines = []
+            return [self.solution_event(assignments)]
+        if line.startswith("%%%mzn-stat:"):
+            s = line[len("%%%mzn-stat:") :].strip()
+            if "=" not in s:
+                return []
+            name, value = s.split("=", 1)
+            return [
+                {"type": "statistics", "statistics": {name.strip(): parse_statistic_value(value.strip())}}
+            ]
+        if line.startswith("%"):
+            return []
+        if self.solutionLines or (" = " in line):
+            self.solutionLines.append(line)
+        return []
@@ -2,41 +2,27 @@ import os
 import sys
 import time
 import shutil
-import subprocess
 import tempfile
 
 scriptDir = os.path.dirname(os.path.realpath(__file__))
 sys.path.append(scriptDir)
 
 import conf
+import solver_cache
+import process_engine
+import model_metadata
+from minizinc_output import MiniZincOutputParser, supports_json_stream
 from utils import delete_file
 
 
 
 
 def get_minizinc_problem_type(modelFile: str):
-    # TODO: this function should definitely be improved
     """
     Read a MiniZinc model and return its type (MIN/MAX/SAT)
+    The type is computed once and saved with the model's metadata (see model_metadata.py)
     """
-    with open(modelFile, "rt") as f:
-        lines = f.readlines()
-
-    # remove comment lines
-    lines = [l for l in lines if len(l.strip()) > 0 and (l.strip()[0] != "%")]
-
-    def find_str(s):
-        return len(list(filter(lambda x: s in x, lines))) > 0
-
-    if find_str("minimize"):
-        return "MIN"
-    if find_str("maximize"):
-        return "MAX"
-    if find_str("satisfy"):
-        return "SAT"
-    print("ERROR: cannot determine problem type of " + modelFile)
-    sys.exit(1)
-    return None
+    return model_metadata.get_model_metadata(modelFile)["problemType"]
 
 
 def is_optimisation(modelFile: str):
@@ -92,7 +78,8 @@ def check_solution_consensus(
         if "solve" in line and not line.strip().startswith("%"):
             # paste here
             for key, val in lastSol.items():
-                tf.write(f"constraint {key} = {val}")
+                if key != "_objective":
+                    tf.write(f"constraint {key} = {val};\n")
             tf.write(line)  # now paste the solve line ...
         else:
             tf.write(line)
@@ -169,16 +156,47 @@ def minizinc_solve(
             - flattenTime (float): flattening time (in seconds)
             - instanceType (str): sat/unsat/unknown
     """
+    # reuse results of an identical run from the persistent solver run cache (if enabled)
+    cacheKey = solver_cache.get_key(
+        "minizinc",
+        [modelFile, instFile],
+        {
+            "solver": solver,
+            "flags": flags,
+            "seed": seed,
+            "timeLimit": timeLimit,
+            "memLimit": memLimit,
+            "solvers_to_check": solvers_to_check,
+        },
+    )
+    cachedResults = solver_cache.lookup(cacheKey)
+    if cachedResults is not None:
+        status, totalTime, extra = cachedResults
+        if verbose:
+            print(status, totalTime, extra)
+        return status, totalTime, extra
+
     # Bool flag to determine if we can use runsolver
     use_runsolver = sys.platform.startswith("linux")
     if solver == "yuck":
         use_runsolver = False
     # use_runsolver = False
-    runsolver_tmp_file = instFile + "." + solver + ".runsolver"
+    # each run has its own runsolver watcher file, as runs with different seeds on the same instance may be executed in parallel (see parallel_utils.py)
+    runsolver_tmp_file = None
+    if use_runsolver:
+        fd, runsolver_tmp_file = tempfile.mkstemp(
+            prefix=os.path.basename(instFile) + "." + solver + "-",
+            suffix=".runsolver",
+            dir=os.path.dirname(instFile) or ".",
+        )
+        os.close(fd)
 
     # delay between SIGTERM and SIGKILL when timeout in runsolver
     runsolver_delay = 2
 
+    # the process engine stops the whole process group if minizinc (or runsolver) doesn't stop by itself shortly after the time limit
+    deadlineMargin = 10
+
     # get problem type
     isOptimisation = is_optimisation(modelFile)
 
@@ -190,11 +208,15 @@ def minizinc_solve(
     # we store in a map the last solution.
     lastSol = {}
 
+    # minizinc output is parsed as a stream of events, using --json-stream if available
+    jsonStream = supports_json_stream()
+    jsonStreamStr = "--json-stream" if jsonStream else ""
+
     # make minizinc command
     if isOptimisation:
-        cmd = f"minizinc --time-limit {timeLimit * 1000} --solver {solver} -i {seedStr} {flags} {modelFile} {instFile} --output-mode dzn --output-objective -s"
+        cmd = f"minizinc --time-limit {timeLimit * 1000} --solver {solver} -i {seedStr} {flags} {modelFile} {instFile} --output-mode dzn --output-objective -s {jsonStreamStr}"
     else:
-        cmd = f"minizinc --time-limit {timeLimit * 1000} --solver {solver} {seedStr} {flags} {modelFile} {instFile} --output-mode dzn -s"
+        cmd = f"minizinc --time-limit {timeLimit * 1000} --solver {solver} {seedStr} {flags} {modelFile} {instFile} --output-mode dzn -s {jsonStreamStr}"
 
     # now prepend the call to runsolver if available
     if use_runsolver:
@@ -216,61 +238,68 @@ def minizinc_solve(
     # start minizinc and process the output
     startTime = time.time()
     flattenAborted = True
-    output = []
+    parser = MiniZincOutputParser(jsonStream)
     if verbose:
         print(cmd)
-    with subprocess.Popen(
+
+    def process_line(line):
+        # parse each output line as soon as minizinc prints it, so that the time when each objective value is found is recorded
+        nonlocal status, flattenAborted, lastSol
+        for event in parser.feed(line):
+            if event["type"] == "solution":
+                lastSol = event["assignments"]
+                # recover the objective value. Minizinc outputs this _objective
+                # regardless of the naming on the optimization function
+                if event["objective"] is not None:
+                    curTime = time.time() - startTime
+                    obj = event["objective"]
+                    if verbose:
+                        print(f"{curTime:.2f}: {obj:.1f}")
+                    extra["objs"].append((curTime, obj))
+            elif event["type"] == "statistics":
+                stats = event["statistics"]
+                if "flatTime" in stats:  # recover flattening time
+                    flattenAborted = False
+                    extra["flattenTime"] = float(stats["flatTime"])
+                    extra["flattenStatus"] = "ok"
+                if "nSolutions" in stats:  # check the number of solutions
+                    nSols = int(stats["nSolutions"])
+                    if nSols > 0 and status is None:
+                        status = "S"
+            elif event["type"] == "status":
+                if event["status"] in ["UNKNOWN", "ERROR"]:  # minizinc had an ERROR or what happened?
+                    status = "ERR"
+                elif event["status"] == "UNSATISFIABLE":  # instance is UNSAT
+                    status = "C"
+                    extra["instanceType"] = "unsat"
+                elif event["status"] in ["OPTIMAL_SOLUTION", "ALL_SOLUTIONS"]:  # ended the search space
+                    status = "C"
+            elif (event["type"] == "error") and verbose:
+                print(f"minizinc error: {event['message']}")
+        sys.stdout.flush()
+
+    p = process_engine.run(
         cmd,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
-        bufsize=1,
-        universal_newlines=True,
-        shell=True,
-    ) as p:
-        for line in p.stdout:
-            output.append(line)
-            # recover the objective value. Minizinc outputs this _objective
-            # regardless of the naming on the optimization function
-            if "_objective" in line:
-                curTime = time.time() - startTime
-                obj = float(line.split("=")[1].strip()[:-1])
-                if verbose:
-                    print(f"{curTime:.2f}: {obj:.1f}")
-                extra["objs"].append((curTime, obj))
-            elif "flatTime=" in line:  # recover flattening time
-                flattenAborted = False
-                extra["flattenTime"] = float(line.split("=")[1])
-                extra["flattenStatus"] = "ok"
-            elif "=====UNKNOWN=====" in line:  # what happened?
-                status = "ERR"
-            elif "=====ERROR=====" in line:  # minizinc had an ERROR
-                status = "ERR"
-            elif "=====UNSATISFIABLE=====" in line:  # instance is UNSAT
-                status = "C"
-                extra["instanceType"] = "unsat"
-            elif "==========" in line:  # ended the search space
-                status = "C"
-            elif "mzn-stat: nSolutions=" in line:  # check the number of solutions
-                nSols = int(line.split("=")[1].strip())
-                if nSols > 0 and status is None:
-                    status = "S"
-            elif (
-                not line.startswith("%") and (" = " in line) and (line.endswith(";"))
-            ):  # recover solution
-                lhs, rhs = line.split(" = ")
-                lastSol[lhs] = rhs
-            sys.stdout.flush()
+        timeLimit=timeLimit + runsolver_delay + deadlineMargin,
+        onLine=process_line,
+        keepOutput=False,
+    )
     totalTime = time.time() - startTime
 
-    # gather solver output
-    output = "\n".join([line for line in output])
-
     # now lets check runsolver output. We only need to care if there is no solution
     # already captured. This is the case for example in a optimisation problem where
     # we have intermediate solutions. The instance should be marked as "S" and give
     # the non-optimal solution. We also need to capture the return value for minizinc
     returncode = p.returncode
-    if use_runsolver:
+    if p.timedOut:
+        # minizinc was killed by the process engine, same as a timeout in runsolver
+        returncode = 0
+        if len(extra["objs"]) == 0:
+            status = "UNK"
+        elif status == None:
+            status = "S"
+    memOut = False
+    if use_runsolver and (not p.timedOut):
         with open(runsolver_tmp_file) as f:
             for index, line in enumerate(f):
                 # we check for timeouts and memouts
@@ -280,6 +309,7 @@ def minizinc_solve(
                 ):
                     # if runsolver kills the subprocess, no return code is reported.
                     returncode = 0  # killed
+                    memOut = "Maximum VSize exceeded" in line
                     if len(extra["objs"]) == 0:
                         status = "UNK"
                     elif status == None:
@@ -290,17 +320,13 @@ def minizinc_solve(
 
     # now we set the status right in case we have a funny case ...
     if (returncode != 0) and (status != "ERR"):
-        if (
-            ("OutOfMemoryError" in output)
-            or ("std::bad_alloc" in output)
-            or ("MiniZinc: internal error: out of memory" in output)
-        ):
+        if parser.outOfMemory:
             status = "ERR"
         else:
             if verbose:
                 print(f'ERROR: fail to run "{cmd}".')
                 print(f"Return code: {returncode}.")
-                print(f"Output is: {output}.\n")
+                print(f"Last lines of the output: {parser.get_diagnostics()}.\n")
             sys.exit(1)
 
     if status == "ERR" and (flattenAborted is False) and returncode == 0:
@@ -335,7 +361,12 @@ def minizinc_solve(
                 print("Status is unknown, so we can't check the solution, sorry.")
 
     # remove tmp runsolver file
-    delete_file(runsolver_tmp_file)
+    if runsolver_tmp_file is not None:
+        delete_file(runsolver_tmp_file)
+
+    # a run stopped by the memory limit is reported as UNK/S, but like other memouts, it's not cached
+    if not memOut:
+        solver_cache.store(cacheKey, [status, totalTime, extra])
 
     if verbose:
         print(status, totalTime, extra)
@@ -0,0 +1,200 @@
+import os
+import re
+import sys
+import json
+import hashlib
+import tempfile
+
+scriptDir = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(scriptDir)
+
+from utils import run_cmd
+
+# metadata of a problem (or generator) model, computed once per experiment (by setup.py) instead of every time a model is evaluated
+#   - problemType: MIN/MAX/SAT
+#   - objectiveDirection: minimising/maximising, or None for satisfaction problems
+#   - parameters: {name: type} of the instance parameters (Essence "given"s, MiniZinc parameters without a value)
+#   - variables: {name: type} of the decision variables (Essence "find"s, MiniZinc "var" declarations)
+# the metadata of <model> is saved next to it in <model>.metadata.json, together with the md5 hash of the model. It is re-computed when the model has changed (checked via its size and modification time first, then via its hash)
+
+METADATA_SUFFIX = ".metadata.json"
+
+# metadata already read by this process, {model file: (size, modification time, metadata)}
+loadedMetadata = {}
+
+
+def get_file_hash(fn):
+    with open(fn, "rb") as f:
+        return hashlib.md5(f.read()).hexdigest()
+
+
+def get_model_metadata(modelFile: str):
+    """
+    return the metadata of a model (.essence or .mzn), compute it if it's missing or out of date
+    """
+    stat = os.stat(modelFile)
+    key = os.path.abspath(modelFile)
+    if (key in loadedMetadata) and (loadedMetadata[key][:2] == (stat.st_size, stat.st_mtime)):
+        return loadedMetadata[key][2]
+
+    metadataFile = modelFile + METADATA_SUFFIX
+    metadata = None
+    if os.path.isfile(metadataFile):
+        with open(metadataFile, "rt") as f:
+            metadata = json.load(f)
+        if (metadata["size"], metadata["mtime"]) != (stat.st_size, stat.st_mtime):
+            # the model may have been touched or copied without being modified
+            if metadata["hash"] == get_file_hash(modelFile):
+                metadata["size"], metadata["mtime"] = stat.st_size, stat.st_mtime
+                write_metadata(metadataFile, metadata)
+            else:
+                metadata = None
+    if metadata is None:
+        metadata = compute_model_metadata(modelFile)
+        write_metadata(metadataFile, metadata)
+
+    loadedMetadata[key] = (stat.st_size, stat.st_mtime, metadata)
+    return metadata
+
+
+def write_metadata(metadataFile, metadata):
+    fd, tmpFile = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(metadataFile)), suffix=".tmp")
+    with os.fdopen(fd, "wt") as f:
+        json.dump(metadata, f, indent=1)
+    os.replace(tmpFile, metadataFile)
+
+
+def compute_model_metadata(modelFile: str):
+    stat = os.stat(modelFile)
+    metadata = {
+        "model": os.path.basename(modelFile),
+        "hash": get_file_hash(modelFile),
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+    }
+    if modelFile.endswith(".essence"):
+        metadata["modelType"] = "essence"
+        metadata["problemType"] = compute_essence_problem_type(modelFile)
+        declarations = read_essence_declarations(modelFile)
+        metadata["parameters"] = declarations["given"]
+        metadata["variables"] = declarations["find"]
+    else:
+        assert modelFile.endswith(".mzn"), f"ERROR: model {modelFile} must end with either .essence or .mzn"
+        metadata["modelType"] = "mzn"
+        metadata["problemType"] = compute_minizinc_problem_type(modelFile)
+        metadata["parameters"], metadata["variables"] = read_minizinc_declarations(modelFile)
+    metadata["objectiveDirection"] = {"MIN": "minimising", "MAX": "maximising", "SAT": None}[metadata["problemType"]]
+    return metadata
+
+
+def compute_essence_problem_type(modelFile: str):
+    """
+    Read an Essence model and return its type (MIN/MAX/SAT)
+    Uses the conjure pretty print feature, then interprets the generated JSON
+    """
+    cmd = f"conjure pretty {modelFile} --output-format=astjson"
+    results_dict = run_cmd(cmd)
+    try:
+        parsed_json = json.loads(results_dict[0])
+    except json.JSONDecodeError as e:
+        print("Failed to parse JSON:", e)
+        exit()
+
+    # Now check for the Maximising objective recursively
+    def check_type(data):
+        if isinstance(data, dict):
+            for key, value in data.items():
+                if key == "Objective" and isinstance(value, list):
+                    if value[0] == "Maximising":
+                        return "MAX"
+                    elif value[0] == "Minimising":
+                        return "MIN"
+                result = check_type(value)
+                if result in ("MAX", "MIN"):
+                    return result
+        elif isinstance(data, list):
+            for item in data:
+                result = check_type(item)
+                if result in ("MAX", "MIN"):
+                    return result
+        return "SAT"
+
+    return check_type(parsed_json)
+
+
+def compute_minizinc_problem_type(modelFile: str):
+    # TODO: this function should definitely be improved
+    """
+    Read a MiniZinc model and return its type (MIN/MAX/SAT)
+    """
+    with open(modelFile, "rt") as f:
+        lines = f.readlines()
+
+    # remove comment lines
+    lines = [l for l in lines if len(l.strip()) > 0 and (l.strip()[0] != "%")]
+
+    def find_str(s):
+        return len(list(filter(lambda x: s in x, lines))) > 0
+
+    if find_str("minimize"):
+        return "MIN"
+    if find_str("maximize"):
+        return "MAX"
+    if find_str("satisfy"):
+        return "SAT"
+    print("ERROR: cannot determine problem type of " + modelFile)
+    sys.exit(1)
+    return None
+
+
+def read_essence_declarations(modelFile: str):
+    """
+    read the declarations of an Essence model, return a dictionary with:
+        - "given", "find": {name: domain} of parameters and decision variables
+        - "domainLettings": {name: domain} of domains defined with "letting ... be domain"
+        - "enums": {name: list of values} of enumerated types defined with "letting ... be new type enum"
+    """
+    with open(modelFile, "rt") as f:
+        text = " ".join([line.split("$")[0].strip() for line in f])
+    keywords = r"\b(?:find|given|letting|where|such that|branching on|minimising|maximising|heuristic)\b"
+    declarations = {"given": {}, "find": {}, "domainLettings": {}, "enums": {}}
+    for m in re.finditer(r"\b(find|given)\s+(.*?)\s*:\s*(.*?)(?=" + keywords + "|$)", text):
+        for name in m.group(2).split(","):
+            declarations[m.group(1)][name.strip()] = m.group(3).strip().rstrip(",")
+    for m in re.finditer(r"\bletting\s+([A-Za-z_][A-Za-z0-9_]*)\s+be\s+domain\s+(.*?)(?=" + keywords + "|$)", text):
+        declarations["domainLettings"][m.group(1)] = m.group(2).strip()
+    for m in re.finditer(r"\bletting\s+([A-Za-z_][A-Za-z0-9_]*)\s+be\s+new\s+type\s+enum\s*\{(.*?)\}", text):
+        declarations["enums"][m.group(1)] = [v.strip() for v in m.group(2).split(",")]
+    # given enumerated types, e.g., given E new type enum
+    for m in re.finditer(r"\bgiven\s+([A-Za-z_][A-Za-z0-9_]*)\s+new\s+type\s+enum\b", text):
+        declarations["given"][m.group(1)] = "new type enum"
+    return declarations
+
+
+def read_minizinc_declarations(modelFile: str):
+    """
+    read the declarations of a MiniZinc model, return the parameters (declared without a value) and the decision variables, as dictionaries {name: type}
+    """
+    with open(modelFile, "rt") as f:
+        text = f.read()
+    text = re.sub(r"/\*.*?\*/", " ", text, flags=re.DOTALL)
+    text = re.sub(r"%[^\n]*", " ", text)
+    parameters = {}
+    variables = {}
+    for statement in text.split(";"):
+        statement = " ".join(statement.split())
+        m = re.match(r"^enum\s+([A-Za-z_][A-Za-z0-9_]*)$", statement)
+        if m:
+            parameters[m.group(1)] = "enum"
+            continue
+        if re.match(r"^(constraint|solve|output|include|predicate|function|test|annotation|enum)\b", statement):
+            continue
+        m = re.match(r"^([^:=]+?)\s*:\s*([A-Za-z_][A-Za-z0-9_]*)\s*(::[^=]*)?(=.*)?$", statement)
+        if m is None:
+            continue
+        declType, name, value = m.group(1), m.group(2), m.group(4)
+        if re.search(r"\bvar\b", declType):
+            variables[name] = declType
+        elif value is None:
+            parameters[name] = declType
+    return parameters, variables
@@ -0,0 +1,267 @@
+import os
+import re
+import sys
+import dbm
+import fcntl
+
+scriptDir = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(scriptDir)
+
+from essence_pipeline_utils import (
+    parse_minion_file,
+    read_minion_variables,
+    write_out_modified_minion_file,
+)
+
+# exclusion of solutions already generated from a generator instance, so that the same instance is never generated twice from it
+# three backends are supported (chosen per experiment with --genExclusion):
+#   - negativeTable: all solutions are added to a single negative table in the generator instance's minion file
+#   - sharded: same as negativeTable, but solutions are split into several negative tables of at most shardSize tuples each, so that no single table becomes huge
+#   - externalDedupe: the minion file is never modified. Each generated solution is checked against an index of solutions already generated, and minion is restarted with another random seed if it's a duplicate (see generator.py)
+#
+# for negativeTable/sharded, to avoid re-parsing and re-writing the (possibly huge) minion file on every wrapper run, the negative tables are kept at the end of the file:
+#       <content generated by Savile Row, without **EOF**>
+#       **TUPLELIST**
+#       negativeSol <nTuples, zero-padded to a fixed width> <nVariables>
+#       <one line per solution>
+#       **CONSTRAINTS**
+#       negativetable([<variables>],negativeSol)
+#       **EOF**
+# (with sharded tables, this is repeated for each table negativeSol0, negativeSol1, ...)
+# a new solution is spliced in the last table, right before its constraint, and the tuple count is patched in place, so the cost of an update doesn't depend on the size of the file
+# a persistent index (<minionFile>.index, a dbm database) keeps the position of the last table's tuple count, the list of variables, and all solutions in the tables (for deduplication)
+# the file is only fully parsed once: when its first solution is added (or when it has been modified outside of this module, e.g., by an older version of AutoIG or with another backend)
+#
+# for externalDedupe, solutions are kept in another dbm database (<minionFile>.solutions), together with the number of duplicates minion has given in a row since the last new solution (see record_duplicates)
+# updates are protected by an exclusive lock on <minionFile>.lock
+
+EXCLUSION_BACKENDS = ["negativeTable", "sharded", "externalDedupe"]
+
+TABLE_NAME = "negativeSol"
+
+# width of the tuple count in the tuple list header
+COUNT_WIDTH = 10
+
+
+def get_table_name(shardSize, shardId):
+    # a single table keeps the name used by previous versions of AutoIG
+    if shardSize is None:
+        return TABLE_NAME
+    return TABLE_NAME + str(shardId)
+
+
+def get_table_header(tableName, nVariables):
+    """
+    header of a tuple list, return the header and the offset of the tuple count in it
+    """
+    prefix = f"**TUPLELIST**\n{tableName} "
+    return (prefix + f"{0:0{COUNT_WIDTH}d} {nVariables}\n").encode(), len(prefix.encode())
+
+
+def get_tail(variables, tableName):
+    return f"**CONSTRAINTS**\nnegativetable([{variables}],{tableName})\n**EOF**\n".encode()
+
+
+def normalise_tuple(minionSolString):
+    return " ".join(minionSolString.split())
+
+
+def split_negative_tables(minionFileSections):
+    """
+    remove the negative tables (their tuple lists and constraints) from the sections of a parsed minion file, return the list of tuples in them
+    other tuple lists (e.g., generated by Savile Row) are kept
+    """
+    isTableHeader = re.compile("^" + TABLE_NAME + r"[0-9]* ")
+    isTableConstraint = re.compile(r"^negativetable\(.*," + TABLE_NAME + r"[0-9]*\)$")
+    tuples = []
+    lsOther = []
+    lines = [line.strip() for line in minionFileSections.get("TUPLELIST", [])]
+    i = 0
+    while i < len(lines):
+        if isTableHeader.match(lines[i]):
+            nTuples = int(lines[i].split()[1])
+            tuples.extend(lines[i + 1 : i + 1 + nTuples])
+            i += nTuples + 1
+        else:
+            lsOther.append(lines[i])
+            i += 1
+    minionFileSections["TUPLELIST"] = lsOther
+    minionFileSections["CONSTRAINTS"] = [
+        line
+        for line in minionFileSections.get("CONSTRAINTS", [])
+        if not isTableConstraint.match(line.strip())
+    ]
+    return tuples
+
+
+def write_table(f, index, shardId, tuples):
+    """
+    write a negative table at the current position of f (which must be the end of the file), and update the index accordingly
+    """
+    variables = index["variables"].decode()
+    tableName = get_table_name(get_shard_size(index), shardId)
+    header, countOffset = get_table_header(tableName, len(variables.split(",")))
+    countPos = f.tell() + countOffset
+    f.write(header)
+    for t in tuples:
+        f.write((t + "\n").encode())
+    f.write(get_tail(variables, tableName))
+    f.seek(countPos)
+    f.write(f"{len(tuples):0{COUNT_WIDTH}d}".encode())
+    f.seek(0, os.SEEK_END)
+    index["countPos"] = str(countPos)
+    index["nTuples"] = str(len(tuples))
+    index["nShards"] = str(shardId + 1)
+    index["fileSize"] = str(f.tell())
+
+
+def get_shard_size(index):
+    shardSize = int(index["shardSize"])
+    if shardSize == 0:
+        return None
+    return shardSize
+
+
+def rebuild(minionFile, index, shardSize):
+    """
+    (re-)write the minion file with negative tables at the end and (re-)build its index
+    """
+    minionFileSections = parse_minion_file(minionFile)
+    variables = read_minion_variables(minionFileSections).strip()
+    tuples = split_negative_tables(minionFileSections)
+    # solutions already in the index are kept, e.g., when the minion file has been re-translated by Savile Row
+    tuples.extend([key.decode()[2:] for key in index.keys() if key.startswith(b"t:")])
+    # remove duplicate solutions (shouldn't happen, but sometime it does because of crashed runs or resume)
+    tuples = list(dict.fromkeys([normalise_tuple(t) for t in tuples if t.strip() != ""]))
+
+    for key in list(index.keys()):
+        del index[key]
+    index["variables"] = variables
+    index["shardSize"] = str(shardSize or 0)
+    for t in tuples:
+        index["t:" + t] = "1"
+
+    # write all sections except the negative tables, then append the negative tables
+    write_out_modified_minion_file(minionFile, minionFileSections)
+    with open(minionFile, "r+b") as f:
+        content = f.read()
+        eofPos = content.rfind(b"**EOF**")
+        assert eofPos >= 0, f"ERROR: **EOF** is missing in {minionFile}"
+        f.seek(eofPos)
+        f.truncate()
+        if shardSize is None:
+            write_table(f, index, 0, tuples)
+        else:
+            lsShards = [tuples[i : i + shardSize] for i in range(0, len(tuples), shardSize)]
+            for shardId, shardTuples in enumerate(lsShards or [[]]):
+                if shardId > 0:
+                    # remove **EOF** of the previous table
+                    f.seek(-len(b"**EOF**\n"), os.SEEK_END)
+                    f.truncate()
+                write_table(f, index, shardId, shardTuples)
+
+
+def is_index_valid(minionFile, index, shardSize):
+    # the index is only valid if the file hasn't been modified since the last update, and with the same backend settings
+    return (
+        ("fileSize" in index)
+        and (int(index["fileSize"]) == os.path.getsize(minionFile))
+        and (int(index["shardSize"]) == (shardSize or 0))
+    )
+
+
+def add_to_table(minionFile, newTuple, shardSize):
+    with dbm.open(minionFile + ".index", "c") as index:
+        if not is_index_valid(minionFile, index, shardSize):
+            rebuild(minionFile, index, shardSize)
+        if ("t:" + newTuple) in index:
+            return
+        nShards = int(index["nShards"])
+        nTuples = int(index["nTuples"])
+        with open(minionFile, "r+b") as f:
+            if (shardSize is not None) and (nTuples >= shardSize):
+                # the last table is full, start a new one by replacing **EOF**
+                f.seek(-len(b"**EOF**\n"), os.SEEK_END)
+                f.truncate()
+                write_table(f, index, nShards, [newTuple])
+            else:
+                # overwrite the tail of the last table with the new tuple followed by the tail, then patch the tuple count
+                tail = get_tail(index["variables"].decode(), get_table_name(shardSize, nShards - 1))
+                f.seek(int(index["fileSize"]) - len(tail))
+                f.write((newTuple + "\n").encode() + tail)
+                fileSize = f.tell()
+                f.seek(int(index["countPos"]))
+                f.write(f"{nTuples + 1:0{COUNT_WIDTH}d}".encode())
+                index["nTuples"] = str(nTuples + 1)
+                index["fileSize"] = str(fileSize)
+        index["t:" + newTuple] = "1"
+
+
+def restore_exclusions(minionFile, backend="negativeTable", shardSize=1000):
+    """
+    add solutions already generated from a generator instance to its minion file after it has been re-translated by Savile Row (e.g., after it has been evicted from the artifact store)
+    """
+    if backend == "externalDedupe":
+        return
+    with open(minionFile + ".lock", "at") as lockFile:
+        fcntl.flock(lockFile, fcntl.LOCK_EX)
+        try:
+            index = dbm.open(minionFile + ".index", "w")
+        except dbm.error:  # no solution recorded yet
+            return
+        with index:
+            shardSize = shardSize if backend == "sharded" else None
+            if not is_index_valid(minionFile, index, shardSize):
+                rebuild(minionFile, index, shardSize)
+
+
+def is_already_generated(minionFile, minionSolString):
+    """
+    check if a solution has already been generated from a generator instance (with any of the exclusion backends)
+    """
+    key = "t:" + normalise_tuple(minionSolString)
+    with open(minionFile + ".lock", "at") as lockFile:
+        fcntl.flock(lockFile, fcntl.LOCK_SH)
+        for db in [".solutions", ".index"]:
+            try:
+                with dbm.open(minionFile + db, "r") as solutions:
+                    if key in solutions:
+                        return True
+            except dbm.error:  # no solution recorded yet
+                pass
+        return False
+
+
+def record_duplicates(minionFile, nDuplicates):
+    """
+    (externalDedupe only) record that solving a generator instance has only given duplicates, nDuplicates times in a row
+    return the number of duplicates given in a row since the last new solution of the generator instance, over all wrapper runs
+    """
+    with open(minionFile + ".lock", "at") as lockFile:
+        fcntl.flock(lockFile, fcntl.LOCK_EX)
+        with dbm.open(minionFile + ".solutions", "c") as solutions:
+            nDuplicates += int(solutions.get("nDuplicates", b"0"))
+            solutions["nDuplicates"] = str(nDuplicates)
+    return nDuplicates
+
+
+def encode_negative_table(minionFile, minionSolString, backend="negativeTable", shardSize=1000):
+    """
+    exclude a solution generated by minion from future solving of a generator instance
+        - backend: one of EXCLUSION_BACKENDS
+        - shardSize: (sharded only) max number of solutions per negative table
+    """
+    assert backend in EXCLUSION_BACKENDS, f"ERROR: exclusion backend {backend} is not supported"
+    # only update if minion finds a solution, i.e., a new instance is generated
+    if minionSolString.strip() == "":
+        return
+    newTuple = normalise_tuple(minionSolString)
+    with open(minionFile + ".lock", "at") as lockFile:
+        fcntl.flock(lockFile, fcntl.LOCK_EX)
+        if backend == "externalDedupe":
+            with dbm.open(minionFile + ".solutions", "c") as solutions:
+                solutions["t:" + newTuple] = "1"
+                solutions["nDuplicates"] = "0"
+        else:
+            assert (backend == "negativeTable") or (shardSize > 0), "ERROR: shard size must be positive"
+            add_to_table(minionFile, newTuple, shardSize if backend == "sharded" else None)
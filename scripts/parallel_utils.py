@@ -0,0 +1,148 @@
+import os
+import sys
+import signal
+import traceback
+import multiprocessing
+from multiprocessing.connection import wait
+
+scriptDir = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(scriptDir)
+
+import resource_usage
+
+# delay between SIGTERM and SIGKILL when stopping a run
+KILL_DELAY = 2
+
+
+def run_in_child(func, args, kwargs, sender):
+    # put the child in its own process group, so that the whole process tree of a run (e.g., runsolver -> minizinc -> solver) can be stopped at once
+    os.setpgid(0, 0)
+    # only calls made by this run are sent back to the parent (see resource_usage.py)
+    resource_usage.take()
+    try:
+        value = func(*args, **kwargs)
+        sender.send((True, (value, resource_usage.take())))
+    except BaseException:
+        sender.send((False, traceback.format_exc()))
+    finally:
+        sender.close()
+
+
+class BackgroundRun:
+    """
+    a function call running in a forked child process
+    """
+
+    def __init__(self, func, args, kwargs):
+        context = multiprocessing.get_context("fork")
+        self.receiver, sender = context.Pipe(duplex=False)
+        sys.stdout.flush()
+        self.process = context.Process(
+            target=run_in_child, args=(func, args, kwargs, sender)
+        )
+        self.process.start()
+        # also set the process group from the parent, so that it is set before stop() can be called
+        try:
+            os.setpgid(self.process.pid, self.process.pid)
+        except OSError:
+            pass
+        sender.close()
+
+    def get_result(self):
+        try:
+            ok, value = self.receiver.recv()
+        except EOFError:
+            ok, value = False, "process exited with code " + str(self.process.exitcode)
+        self.process.join()
+        self.receiver.close()
+        if not ok:
+            raise Exception("ERROR: a parallel run failed:\n" + value)
+        value, usageRecords = value
+        resource_usage.merge(usageRecords)
+        return value
+
+    def stop(self):
+        """
+        stop the run and all processes started by it
+        """
+        if self.process.is_alive():
+            for sig in [signal.SIGTERM, signal.SIGKILL]:
+                try:
+                    os.killpg(self.process.pid, sig)
+                except ProcessLookupError:
+                    break
+                self.process.join(KILL_DELAY)
+                if not self.process.is_alive():
+                    break
+        self.process.join()
+        self.receiver.close()
+
+
+class RunScheduler:
+    """
+    run function calls (e.g., solver runs) in parallel on at most nWorkers processes
+    calls are started in the order they are submitted, and their results are retrieved by key, so the caller can still process them in its own order (e.g., seed order)
+    """
+
+    def __init__(self, nWorkers):
+        assert nWorkers > 0
+        self.nWorkers = nWorkers
+        self.queue = []  # list of (key, func, args, kwargs) not started yet
+        self.running = {}  # key -> BackgroundRun
+        self.results = {}  # key -> (ok, result or exception)
+
+    def submit(self, key, func, *args, **kwargs):
+        assert (key not in self.running) and (key not in self.results)
+        self.queue.append((key, func, args, kwargs))
+        self.start_runs()
+
+    def start_runs(self):
+        while (len(self.running) < self.nWorkers) and (len(self.queue) > 0):
+            key, func, args, kwargs = self.queue.pop(0)
+            self.running[key] = BackgroundRun(func, args, kwargs)
+
+    def collect_finished_runs(self):
+        """
+        wait until at least one of the running calls finishes and collect its results
+        """
+        receivers = {run.receiver: key for key, run in self.running.items()}
+        for receiver in wait(list(receivers.keys())):
+            key = receivers[receiver]
+            run = self.running.pop(key)
+            try:
+                self.results[key] = (True, run.get_result())
+            except Exception as e:
+                self.results[key] = (False, e)
+        self.start_runs()
+
+    def result(self, key):
+        """
+        get results of a submitted call, wait for it to finish if needed
+        """
+        while key not in self.results:
+            assert (key in self.running) or (
+                key in [q[0] for q in self.queue]
+            ), f"ERROR: {key} is not submitted"
+            self.collect_finished_runs()
+        ok, value = self.results[key]
+        if not ok:
+            raise value
+        return value
+
+    def cancel(self, key):
+        """
+        cancel a submitted call: drop it if it is not started yet, or stop it if it is running
+        """
+        self.queue = [q for q in self.queue if q[0] != key]
+        if key in self.running:
+            self.running.pop(key).stop()
+            self.start_runs()
+
+    def shutdown(self):
+        """
+        drop all calls that are not started yet and stop all running ones
+        """
+        self.queue = []
+        for run in self.running.values():
+            run.stop()
+        self.running = {}
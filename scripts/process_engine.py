@@ -0,0 +1,333 @@
+import os
+import sys
+import math
+import time
+import shlex
+import codecs
+import signal
+import atexit
+import asyncio
+import resource
+import threading
+import subprocess
+
+scriptDir = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(scriptDir)
+
+import resource_usage
+
+# asyncio-based engine for running external processes (conjure, savilerow, minion, minizinc, runsolver, ...)
+#   - processes are started without a shell, each in its own process group, so that the whole process tree of a call can be stopped at once
+#   - since they are then out of reach of signals sent to the caller's process group, the process groups still running are killed when the caller exits or gets SIGTERM (e.g., from irace or worker.py). Nothing can be done if the caller gets SIGKILL
+#   - stdout/stderr are streamed line by line to (optional) incremental parsers
+#   - a wall-clock deadline can be enforced on each call, as well as CPU time and memory limits (per process, with setrlimit)
+#   - processes are reaped with wait4, so that their resource usage (CPU time, peak memory, including all descendants they waited for) is known
+#   - run_process/run_processes are awaitable, so several processes can be run from the same event loop. run() is a blocking wrapper
+
+# delay between SIGTERM and SIGKILL when stopping a process
+KILL_DELAY = 2
+
+# size of chunks read from a process output
+READ_CHUNK_SIZE = 65536
+
+# process groups started by run_process and still running: pgid -> pid of the process that started it (a forked process inherits the groups of its parent, but must not kill them)
+liveProcessGroups = {}
+
+# pid of the process where kill_live_process_groups is installed as SIGTERM handler and atexit hook
+cleanupPid = None
+
+
+class ProcessResult:
+    """
+    results of a process call
+        - cmd: list of command arguments
+        - returncode: return code of the process (negative if killed by a signal)
+        - output: output of the process (stdout and stderr, unless they are kept separately), or None if keepOutput=False
+        - stderr: stderr of the process when mergeStderr=False
+        - elapsed: wall-clock running time (in seconds)
+        - timedOut: whether the process was stopped because of the deadline
+        - rusage: resource usage of the process (resource.struct_rusage, as returned by wait4)
+    """
+
+    def __init__(self, cmd, returncode, output, stderr, elapsed, timedOut, rusage=None):
+        self.cmd = cmd
+        self.returncode = returncode
+        self.output = output
+        self.stderr = stderr
+        self.elapsed = elapsed
+        self.timedOut = timedOut
+        self.rusage = rusage
+
+    def get_resource_usage(self):
+        """
+        wall-clock time, CPU time (user+sys) and peak resident memory (in MB) of the call
+        """
+        usage = {"wallTime": self.elapsed, "cpuTime": None, "peakRSS": None}
+        if self.rusage is not None:
+            usage["cpuTime"] = self.rusage.ru_utime + self.rusage.ru_stime
+            # ru_maxrss is in KB on Linux, in bytes on macOS
+            usage["peakRSS"] = self.rusage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+        return usage
+
+
+class ChildProcess:
+    """
+    a process started by subprocess.Popen and reaped with wait4 in a separate thread, so that its resource usage is available once it has exited
+    """
+
+    def __init__(self, popen, loop):
+        self.popen = popen
+        self.pid = popen.pid
+        self.returncode = None
+        self.rusage = None
+        self.exited = loop.create_future()
+        threading.Thread(target=self.reap, args=(loop,), daemon=True).start()
+
+    def reap(self, loop):
+        _, waitStatus, rusage = os.wait4(self.pid, 0)
+        loop.call_soon_threadsafe(self.set_exited, os.waitstatus_to_exitcode(waitStatus), rusage)
+
+    def set_exited(self, returncode, rusage):
+        self.returncode = returncode
+        self.rusage = rusage
+        # the process has been reaped, Popen must not wait for it
+        self.popen.returncode = returncode
+        self.exited.set_result(returncode)
+
+    async def wait(self):
+        return await asyncio.shield(self.exited)
+
+
+def make_limit_setter(cpuTimeLimit, memLimit, killDelay):
+    """
+    function setting CPU time (in seconds) and address space (in MB) limits of a child process before it starts
+    when the CPU time limit is reached, the process gets SIGXCPU, then SIGKILL killDelay seconds later
+    """
+    if (cpuTimeLimit is None) and (memLimit is None):
+        return None
+
+    def set_limits():
+        if cpuTimeLimit is not None:
+            resource.setrlimit(
+                resource.RLIMIT_CPU,
+                (int(math.ceil(cpuTimeLimit)), int(math.ceil(cpuTimeLimit + killDelay))),
+            )
+        if memLimit is not None:
+            memBytes = int(memLimit * 1024 * 1024)
+            resource.setrlimit(resource.RLIMIT_AS, (memBytes, memBytes))
+
+    return set_limits
+
+
+async def open_stream(pipe, loop):
+    reader = asyncio.StreamReader(loop=loop)
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader, loop=loop), pipe)
+    return reader
+
+
+def split_command(cmd):
+    if isinstance(cmd, str):
+        return shlex.split(cmd)
+    return [str(s) for s in cmd]
+
+
+def kill_process_group(proc, sig):
+    try:
+        os.killpg(proc.pid, sig)
+    except ProcessLookupError:
+        pass
+
+
+def kill_live_process_groups():
+    """
+    kill all process groups started by the current process that are still running
+    """
+    for pgid, ownerPid in list(liveProcessGroups.items()):
+        if ownerPid == os.getpid():
+            try:
+                os.killpg(pgid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            liveProcessGroups.pop(pgid, None)
+
+
+def install_cleanup():
+    """
+    make sure kill_live_process_groups is called when the current process exits or gets SIGTERM
+    the SIGTERM handler can only be installed from the main thread, so it's not installed if the first process is started from another thread (the atexit hook still is)
+    """
+    global cleanupPid
+    if cleanupPid == os.getpid():
+        return
+    cleanupPid = os.getpid()
+    atexit.register(kill_live_process_groups)
+    if threading.current_thread() is not threading.main_thread():
+        return
+    previousHandler = signal.getsignal(signal.SIGTERM)
+    if previousHandler == signal.SIG_IGN:
+        return
+
+    def on_sigterm(signum, frame):
+        kill_live_process_groups()
+        if callable(previousHandler):
+            previousHandler(signum, frame)
+        else:
+            # default action: exit with the same status as if the handler wasn't installed
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            os.kill(os.getpid(), signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, on_sigterm)
+
+
+async def terminate(proc, killDelay=KILL_DELAY):
+    """
+    stop a process and all processes started by it: SIGTERM first, then SIGKILL if it's still alive after killDelay seconds
+    """
+    kill_process_group(proc, signal.SIGTERM)
+    try:
+        await asyncio.wait_for(proc.wait(), killDelay)
+    except asyncio.TimeoutError:
+        pass
+    # also kill remaining processes of the group, even if the main one has exited
+    kill_process_group(proc, signal.SIGKILL)
+    await proc.wait()
+
+
+async def read_stream(stream, onLine, lsOutput):
+    """
+    read a process output stream until EOF, pass each line (including its trailing newline) to onLine and keep it in lsOutput (if not None)
+    lines are split from raw chunks, so there is no limit on line length
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    buffer = ""
+
+    def process_line(line):
+        if lsOutput is not None:
+            lsOutput.append(line)
+        if onLine:
+            onLine(line)
+
+    while True:
+        chunk = await stream.read(READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        buffer += decoder.decode(chunk)
+        lines = buffer.split("\n")
+        buffer = lines.pop()
+        for line in lines:
+            process_line(line + "\n")
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        process_line(buffer)
+
+
+async def run_process(
+    cmd,
+    timeLimit: float = None,
+    onLine=None,
+    onStderrLine=None,
+    mergeStderr: bool = True,
+    keepOutput: bool = True,
+    cwd: str = None,
+    env: dict = None,
+    killDelay: float = KILL_DELAY,
+    cpuTimeLimit: float = None,
+    memLimit: float = None,
+    stage: str = None,
+):
+    """
+    run a command and wait for it to finish
+        - cmd: command line (string, split as in a POSIX shell but never run by a shell) or list of arguments
+        - timeLimit: wall-clock deadline (in seconds). The process group is stopped when it is reached. Default: None (no deadline)
+        - onLine: function called on each output line as soon as it is read (incremental parser)
+        - onStderrLine: same as onLine, for stderr when mergeStderr=False
+        - mergeStderr: redirect stderr to stdout
+        - keepOutput: keep the whole output in memory and return it in ProcessResult.output
+        - cpuTimeLimit, memLimit: CPU time (in seconds) and address space (in MB) limits of the process, set with setrlimit. They apply to each process separately, not to the whole process tree
+        - stage: name of the pipeline stage the call is accounted to (see resource_usage.py). Default: derived from the command
+    if the call is cancelled (e.g., by asyncio.wait_for or Task.cancel), the process group is stopped before the cancellation is propagated
+    """
+    args = split_command(cmd)
+    startTime = time.time()
+    loop = asyncio.get_running_loop()
+    install_cleanup()
+    popen = subprocess.Popen(
+        args,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT if mergeStderr else subprocess.PIPE,
+        cwd=cwd,
+        env=env,
+        start_new_session=True,
+        preexec_fn=make_limit_setter(cpuTimeLimit, memLimit, killDelay),
+    )
+    liveProcessGroups[popen.pid] = os.getpid()
+    try:
+        return await communicate_process(popen, loop, args, startTime, timeLimit, onLine, onStderrLine, mergeStderr, keepOutput, killDelay, stage)
+    finally:
+        liveProcessGroups.pop(popen.pid, None)
+
+
+async def communicate_process(popen, loop, args, startTime, timeLimit, onLine, onStderrLine, mergeStderr, keepOutput, killDelay, stage):
+    """
+    stream the output of a process started by run_process and wait for it to finish (see run_process)
+    """
+    proc = ChildProcess(popen, loop)
+    lsOutput = [] if keepOutput else None
+    lsStderr = [] if (keepOutput and not mergeStderr) else None
+    readers = [read_stream(await open_stream(popen.stdout, loop), onLine, lsOutput)]
+    if not mergeStderr:
+        readers.append(read_stream(await open_stream(popen.stderr, loop), onStderrLine, lsStderr))
+
+    async def communicate():
+        await asyncio.gather(*readers)
+        await proc.wait()
+
+    task = asyncio.ensure_future(communicate())
+    timedOut = False
+    try:
+        await asyncio.wait_for(asyncio.shield(task), timeLimit)
+    except asyncio.TimeoutError:
+        timedOut = True
+        await terminate(proc, killDelay)
+        # the readers get EOF once the process group is gone, so the rest of the output is still collected
+        await task
+    except asyncio.CancelledError:
+        await terminate(proc, killDelay)
+        await asyncio.gather(task, return_exceptions=True)
+        raise
+
+    resource_usage.record(stage or resource_usage.get_stage(args), time.time() - startTime, proc.rusage)
+
+    return ProcessResult(
+        cmd=args,
+        returncode=proc.returncode,
+        output="".join(lsOutput) if keepOutput else None,
+        stderr="".join(lsStderr) if lsStderr is not None else None,
+        elapsed=time.time() - startTime,
+        timedOut=timedOut,
+        rusage=proc.rusage,
+    )
+
+
+async def run_processes(lsCmds, maxParallel: int = None, **kwargs):
+    """
+    run a list of commands concurrently (at most maxParallel at a time), return their ProcessResult in the same order
+    kwargs are passed to run_process
+    """
+    semaphore = asyncio.Semaphore(maxParallel) if maxParallel else None
+
+    async def run_one(cmd):
+        if semaphore is None:
+            return await run_process(cmd, **kwargs)
+        async with semaphore:
+            return await run_process(cmd, **kwargs)
+
+    return await asyncio.gather(*[run_one(cmd) for cmd in lsCmds])
+
+
+def run(cmd, **kwargs):
+    """
+    blocking version of run_process, for callers that are not running an event loop
+    """
+    return asyncio.run(run_process(cmd, **kwargs))
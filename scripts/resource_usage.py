@@ -0,0 +1,85 @@
+import os
+import sys
+
+scriptDir = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(scriptDir)
+
+# accounting of resources used by external tool calls, per pipeline stage, so that each run can report which stage uses the most CPU time and memory
+# - every call made via the process engine is recorded (see process_engine.py), with its rusage as returned by wait4. Savile Row calls on the persistent service (see savilerow_server.py) only have a wall-clock time
+# - a stage is a tool, plus the subcommand for conjure, e.g., "conjure translate-parameter", "savilerow", "minion"
+# - usage of a stage: {"nCalls", "wallTime", "cpuTime", "userTime", "sysTime" (in seconds, summed over all calls), "maxRSS" (in MB, max over all calls), "minorFaults", "majorFaults" (summed over all calls)}
+# - calls made by runs executed in parallel (see parallel_utils.py) are recorded in the parallel processes and merged back into the parent's records when the runs finish. Runs that are stopped before they finish are not accounted for
+
+# usage of the current process, {stage: usage}
+records = {}
+
+
+def get_stage(args):
+    """
+    name of the pipeline stage of a call, from its list of arguments
+    """
+    if len(args) == 0:
+        return "unknown"
+    tool = os.path.basename(args[0])
+    if (tool == "conjure") and (len(args) > 1) and (not args[1].startswith("-")):
+        return tool + " " + args[1]
+    return tool
+
+
+def new_usage():
+    return {
+        "nCalls": 0,
+        "wallTime": 0,
+        "cpuTime": 0,
+        "userTime": 0,
+        "sysTime": 0,
+        "maxRSS": 0,
+        "minorFaults": 0,
+        "majorFaults": 0,
+    }
+
+
+def record(stage, wallTime, rusage=None):
+    """
+    record a call
+        - rusage: resource.struct_rusage of the call, or None if it's not available
+    """
+    usage = records.setdefault(stage, new_usage())
+    usage["nCalls"] += 1
+    usage["wallTime"] += wallTime
+    if rusage is None:
+        return
+    usage["userTime"] += rusage.ru_utime
+    usage["sysTime"] += rusage.ru_stime
+    usage["cpuTime"] += rusage.ru_utime + rusage.ru_stime
+    # ru_maxrss is in KB on Linux, in bytes on macOS
+    usage["maxRSS"] = max(usage["maxRSS"], rusage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024))
+    usage["minorFaults"] += rusage.ru_minflt
+    usage["majorFaults"] += rusage.ru_majflt
+
+
+def merge(otherRecords):
+    """
+    add records of another process (e.g., a parallel run) to the current ones
+    """
+    for stage, other in otherRecords.items():
+        usage = records.setdefault(stage, new_usage())
+        for key, val in other.items():
+            if key == "maxRSS":
+                usage[key] = max(usage[key], val)
+            else:
+                usage[key] += val
+
+
+def take():
+    """
+    return the records since the last call (or since the process started), and start new ones
+    values are rounded so that they can be printed in the run's results
+    """
+    global records
+    lsRecords = records
+    records = {}
+    for usage in lsRecords.values():
+        for key in ["wallTime", "cpuTime", "userTime", "sysTime", "maxRSS"]:
+            usage[key] = round(usage[key], 3)
+    return lsRecords
@@ -1,8 +1,30 @@
 #!/bin/bash
 
+# start the persistent evaluation worker (it exits immediately if evaluationWorker is disabled in config.json)
+python3 $AUTOIG/scripts/worker.py --serve > detailed-output/worker.log 2>&1 &
+workerPid=$!
+for i in $(seq 1 50); do
+    if [ -S detailed-output/worker.sock ] || ! kill -0 $workerPid 2>/dev/null; then
+        break
+    fi
+    sleep 0.2
+done
+
+# start the persistent Savile Row servers (it exits immediately if SRServer is disabled in config.json)
+python3 $AUTOIG/scripts/savilerow_server.py --serve > detailed-output/savilerow-server.log 2>&1 &
+SRServerPid=$!
+
 # start the instance generation process with irace 
 bash run-irace.sh
 
+# stop the evaluation worker
+kill $workerPid 2>/dev/null
+wait $workerPid 2>/dev/null
+
+# stop the Savile Row servers
+kill $SRServerPid 2>/dev/null
+wait $SRServerPid 2>/dev/null
+
 # extract output
 pushd detailed-output
 bash $AUTOIG/scripts/read-output-files.sh
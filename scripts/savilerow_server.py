@@ -0,0 +1,318 @@
+#!/usr/bin/env python
+
+# persistent Savile Row service, so that each Savile Row call (generator translation, generator solution parsing, and instance translations during evaluations) does not pay the start-up and JIT warm-up costs of a new JVM
+# Savile Row is run inside long-lived nailgun servers (https://github.com/facebook/nailgun), each listening on a Unix socket in detailed-output
+# syntax:
+#   - server mode: python savilerow_server.py --serve [--nServers <n>]
+#       start n JVMs running a nailgun server with Savile Row on their classpath, restart them if they stop, and stop them when this process is killed (by run.sh after irace finishes)
+#       if the service is disabled in config.json (SRServer=false), the server exits immediately
+#   - client: call() sends one Savile Row command to a free server and returns its output and return code
+#       Savile Row keeps global state between runs, so each server runs one command at a time (a lock file per server). When all servers are busy, or when no server can be reached, call() returns None and the caller falls back to the savilerow command line
+#       Savile Row's command line flags are static fields (CmdFlags), which are only set by the options given to a command, so a command run after another one in the same JVM could see flags of the previous command. Each server is therefore dedicated to one kind of command (see get_command_kind): the kind of the first command it runs after being started, recorded in <socket>.kind. Two commands of the same kind set the same flags, so a command never sees flags it doesn't set itself
+#       only translation commands (Normal and ReadSolution modes) are sent to the servers. Commands that also run a solver (-run-solver) are always run via the command line, as the solver is a child process of Savile Row
+#       the savilerow-shim/savilerow script does the same for programs calling savilerow via PATH (i.e., conjure solve), see wrapper.py
+# NOTE: the client part only uses python's standard library, don't add any heavy import at the top of this file
+
+import os
+import sys
+import json
+import fcntl
+import select
+import socket
+import struct
+import zipfile
+
+scriptDir = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(scriptDir)
+
+# description of the running servers (main class of Savile Row and socket files), written by the server process
+serverInfoFile = "./detailed-output/savilerow-server.json"
+
+# environment variable pointing to serverInfoFile (absolute path), set by wrapper.py when the service is enabled
+SERVER_INFO_ENV = "AUTOIG_SR_SERVER"
+
+# directory of the savilerow PATH shim
+shimDir = os.path.join(scriptDir, "savilerow-shim")
+
+# nailgun main class
+NAILGUN_SERVER_CLASS = "com.facebook.nailgun.NGServer"
+
+# JVM options of the servers (same as in the savilerow script)
+JAVA_FLAGS = "-ea -XX:ParallelGCThreads=1 -Xmx8G"
+
+# interval between heartbeats sent to a server while a command is running (nailgun drops clients that are silent for 10 seconds)
+HEARTBEAT_INTERVAL = 1
+
+# a server that stops within this time (in seconds) after being started is considered crashed, the server process gives up after MAX_CRASHES consecutive crashes
+CRASH_TIME = 10
+MAX_CRASHES = 3
+
+# Savile Row options whose value is an output file
+OUTPUT_FILE_OPTIONS = ["-minion-sol-file", "-out-solution"]
+
+
+def find_savilerow():
+    """
+    return the directory of the real savilerow installation (not the shim) and the path of its jar file
+    """
+    for d in os.environ.get("PATH", "").split(os.pathsep):
+        fn = os.path.join(d, "savilerow")
+        if os.path.realpath(d) == os.path.realpath(shimDir):
+            continue
+        if os.path.isfile(fn) and os.access(fn, os.X_OK):
+            srDir = os.path.dirname(os.path.realpath(fn))
+            return fn, os.path.join(srDir, "savilerow.jar")
+    return None, None
+
+
+def read_main_class(jarFile):
+    with zipfile.ZipFile(jarFile) as z:
+        manifest = z.read("META-INF/MANIFEST.MF").decode("utf-8")
+    for line in manifest.splitlines():
+        if line.startswith("Main-Class:"):
+            return line.split(":", 1)[1].strip()
+    raise Exception(f"ERROR: cannot find the main class of {jarFile}")
+
+
+def make_absolute(args, cwd):
+    """
+    the JVM of a server resolves relative paths against its own working directory, so paths of input and output files are made absolute
+    """
+    lsOut = []
+    for i, arg in enumerate(args):
+        prev = args[i - 1] if i > 0 else ""
+        isOutputFile = prev.startswith("-out-") or (prev in OUTPUT_FILE_OPTIONS)
+        if (not arg.startswith("-")) and (isOutputFile or os.path.exists(os.path.join(cwd, arg))):
+            arg = os.path.join(cwd, arg)
+        lsOut.append(arg)
+    return lsOut
+
+
+def send_chunk(s, chunkType, data=b""):
+    s.sendall(struct.pack(">ic", len(data), chunkType) + data)
+
+
+def recv_exactly(s, n):
+    data = b""
+    while len(data) < n:
+        chunk = s.recv(n - len(data))
+        if not chunk:
+            raise ConnectionError("connection closed by the Savile Row server")
+        data += chunk
+    return data
+
+
+def run_on_server(socketFile, mainClass, args, cwd):
+    """
+    run a command on a nailgun server, return its output (stdout and stderr) and return code
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.connect(socketFile)
+        for arg in args:
+            send_chunk(s, b"A", arg.encode("utf-8"))
+        for key, val in os.environ.items():
+            send_chunk(s, b"E", f"{key}={val}".encode("utf-8"))
+        send_chunk(s, b"D", cwd.encode("utf-8"))
+        send_chunk(s, b"C", mainClass.encode("utf-8"))
+        lsOutput = []
+        while True:
+            ready, _, _ = select.select([s], [], [], HEARTBEAT_INTERVAL)
+            if not ready:
+                send_chunk(s, b"H")
+                continue
+            length, chunkType = struct.unpack(">ic", recv_exactly(s, 5))
+            data = recv_exactly(s, length)
+            if chunkType in [b"1", b"2"]:
+                lsOutput.append(data)
+            elif chunkType == b"S":  # Savile Row doesn't read stdin
+                send_chunk(s, b".")
+            elif chunkType == b"X":
+                return b"".join(lsOutput).decode("utf-8", errors="replace"), int(data.decode().strip())
+
+
+def read_server_info():
+    fn = os.environ.get(SERVER_INFO_ENV, None)
+    if (fn is None) or (not os.path.isfile(fn)):
+        return None
+    with open(fn, "rt") as f:
+        return json.load(f)
+
+
+def enable():
+    """
+    send Savile Row calls of this process and of its child processes (e.g., conjure solve) to the servers, if they are running
+    """
+    if not os.path.isfile(serverInfoFile):
+        return
+    os.environ[SERVER_INFO_ENV] = os.path.abspath(serverInfoFile)
+    if os.environ.get("PATH", "").split(os.pathsep)[0] != shimDir:
+        os.environ["PATH"] = shimDir + os.pathsep + os.environ.get("PATH", "")
+
+
+def is_number(s):
+    try:
+        float(s)
+    except ValueError:
+        return False
+    return True
+
+
+def get_command_kind(args):
+    """
+    kind of a Savile Row command: the names of all its options (e.g., -mode, -out-minion, -O2), whatever their values are
+    """
+    return " ".join(sorted(set([a for a in args if a.startswith("-") and not is_number(a)])))
+
+
+def get_kind_file(socketFile):
+    return socketFile + ".kind"
+
+
+def call(args, cwd=None):
+    """
+    run a Savile Row command (list of arguments, without "savilerow") on a free server dedicated to its kind of command, or on a free server that hasn't run any command yet
+    return its output and return code, or None if the command must be run via the command line (it runs a solver, or no server is available)
+    """
+    if "-run-solver" in args:
+        return None
+    info = read_server_info()
+    if info is None:
+        return None
+    kind = get_command_kind(args)
+    cwd = os.path.abspath(cwd or os.getcwd())
+    args = make_absolute(args, cwd)
+    # servers already dedicated to this kind of command are used first
+    for useNewServer in [False, True]:
+        for socketFile in info["sockets"]:
+            if not os.path.exists(socketFile):
+                continue
+            with open(socketFile + ".lock", "at") as lockFile:
+                try:
+                    fcntl.flock(lockFile, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:  # the server is busy
+                    continue
+                kindFile = get_kind_file(socketFile)
+                if os.path.isfile(kindFile):
+                    with open(kindFile, "rt") as f:
+                        if useNewServer or (f.read() != kind):
+                            continue
+                elif useNewServer:
+                    with open(kindFile, "wt") as f:
+                        f.write(kind)
+                else:
+                    continue
+                try:
+                    return run_on_server(socketFile, info["mainClass"], args, cwd)
+                except (ConnectionError, OSError, struct.error):
+                    # e.g., the server was killed during the run, the command is re-run via the command line
+                    return None
+    return None
+
+
+def get_java_flags():
+    from utils import run_cmd
+    import re
+
+    flags = JAVA_FLAGS
+    # since Java 18, the security manager nailgun relies on to catch System.exit must be explicitly allowed
+    output, _ = run_cmd("java -version")
+    m = re.search(r'version "(\d+)(\.(\d+))?', output)
+    if (m is not None) and (int(m.group(1)) >= 18):
+        flags += " -Djava.security.manager=allow"
+    return flags
+
+
+def get_main_class():
+    srBin, srJar = find_savilerow()
+    assert srBin is not None, "ERROR: savilerow is not found in PATH"
+    return read_main_class(srJar)
+
+
+def get_server_command(socketFile, nailgunJar):
+    """
+    command line of a JVM running a nailgun server with Savile Row on its classpath, listening on socketFile
+    """
+    assert os.path.isfile(nailgunJar), f"ERROR: nailgun server jar file {nailgunJar} is missing. Please set --nailgunJar in setup.py or the NAILGUN_JAR environment variable"
+    _, srJar = find_savilerow()
+    srDir = os.path.dirname(srJar)
+    return (
+        ["java"]
+        + get_java_flags().split()
+        + ["-Djava.library.path=" + os.path.join(srDir, "lib")]
+        + ["-cp", nailgunJar + os.pathsep + srJar]
+        + [NAILGUN_SERVER_CLASS, "local:" + socketFile]
+    )
+
+
+def run_server(nServers):
+    import asyncio
+    import signal
+    import process_engine
+    from utils import log
+    from wrapper_helpers import read_setting
+
+    setting = read_setting("./config.json")
+    if setting["generalSettings"]["SRServer"] is False:
+        print("Savile Row server is disabled in config.json. Exitting...")
+        return
+
+    nailgunJar = setting["generalSettings"]["nailgunJar"] or os.environ.get("NAILGUN_JAR", "")
+    lsSockets = [os.path.abspath(f"./detailed-output/savilerow-{i}.sock") for i in range(nServers)]
+    mainClass = get_main_class()
+
+    async def supervise(socketFile):
+        nCrashes = 0
+        while nCrashes < MAX_CRASHES:
+            # remove socket file left by a previous (killed) server. The new JVM hasn't run any command yet, so it's not dedicated to any kind of command
+            with open(socketFile + ".lock", "at") as lockFile:
+                fcntl.flock(lockFile, fcntl.LOCK_EX)
+                for fn in [socketFile, get_kind_file(socketFile)]:
+                    if os.path.exists(fn):
+                        os.remove(fn)
+            p = await process_engine.run_process(
+                get_server_command(socketFile, nailgunJar),
+                onLine=lambda line: print(f"[{os.path.basename(socketFile)}] {line}", end=""),
+                keepOutput=False,
+            )
+            log(f"Savile Row server {socketFile} stopped with return code {p.returncode}")
+            nCrashes = nCrashes + 1 if p.elapsed < CRASH_TIME else 0
+        log(f"Savile Row server {socketFile} keeps crashing, giving up")
+
+    async def serve():
+        # stop the servers cleanly when run.sh kills this process after irace finishes (run_process stops the JVMs when it's cancelled)
+        task = asyncio.ensure_future(asyncio.gather(*[supervise(fn) for fn in lsSockets]))
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, task.cancel)
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    with open(serverInfoFile, "wt") as f:
+        json.dump({"mainClass": mainClass, "sockets": lsSockets}, f)
+    log(f"Starting {nServers} Savile Row server(s), main class: {mainClass}")
+    try:
+        asyncio.run(serve())
+    finally:
+        os.remove(serverInfoFile)
+        for fn in lsSockets + [get_kind_file(fn) for fn in lsSockets]:
+            if os.path.exists(fn):
+                os.remove(fn)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Persistent Savile Row service")
+    parser.add_argument("--serve", action="store_true", required=True, help="start the Savile Row servers")
+    parser.add_argument("--nServers", default=None, type=int, help="number of servers, i.e., maximum number of Savile Row calls running in parallel on the servers (default: nCores in config.json)")
+    args = parser.parse_args()
+
+    nServers = args.nServers
+    if nServers is None:
+        with open("./config.json") as f:
+            nServers = json.load(f)["nCores"]
+    run_server(nServers)
+
+
+if __name__ == "__main__":
+    main()
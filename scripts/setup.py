@@ -14,6 +14,7 @@ scriptDir = os.path.dirname(os.path.realpath(__file__))
 sys.path.append(scriptDir)
 
 import utils
+import model_metadata
 from utils import log
 
 
@@ -27,6 +28,11 @@ def read_config(args):
         "seed",
         "maxEvaluations",
         "nCores",
+        "evaluationWorker",
+        "batchTargetRunner",
+        "SRServer",
+        "nailgunJar",
+        "pinCores",
     ]
     genSettings = [
         "genMaxInt",
@@ -35,6 +41,11 @@ def read_config(args):
         "genSolver",
         "genSolverTimeLimit",
         "genSolverFlags",
+        "genExclusion",
+        "genExclusionShardSize",
+        "genSolutionPoolSize",
+        "artifactStoreQuota",
+        "artifactColdAfter",
         "repairModel",
 
     ]
@@ -45,6 +56,11 @@ def read_config(args):
         "maxSolverTime",
         "SRTimeLimit",
         "nRunsPerInstance",
+        "nCoresPerEvaluation",
+        "reuseDuplicateInstances",
+        "solverCacheDir",
+        "solverCacheMaxSize",
+        "essenceTranslationReuse",
     ]
 
     # read common settings for both graded/discriminating experiments
@@ -57,7 +73,7 @@ def read_config(args):
         del config["genMaxInt"]
 
     # convert all paths into absolute paths
-    for name in ["runDir", "problemModel", "generatorModel"]:
+    for name in ["runDir", "problemModel", "generatorModel", "solverCacheDir"]:
         if name in config:
             config[name] = os.path.abspath(config[name])
 
@@ -68,6 +84,10 @@ def read_config(args):
                 getattr(args, name) is not None
             ), f"ERROR: --{name} is required for graded instance generation experiments."
             config[name] = getattr(args, name)
+        config["gradedEarlyStopping"] = args.gradedEarlyStopping
+        # early stopping of Essence graded evaluations relies on timeouts being recorded with the full time limit (see evaluation_utils.py)
+        if args.gradedEarlyStopping and config["problemModel"].endswith(".essence"):
+            assert args.essenceTranslationReuse, "ERROR: --gradedEarlyStopping requires --essenceTranslationReuse for Essence models"
 
     # read discriminating-specific settings
     else:
@@ -81,6 +101,9 @@ def read_config(args):
                 getattr(args, name) is not None
             ), f"ERROR: --{name} is required for discriminating instance generation experiments."
             config[name] = getattr(args, name)
+        if args.baseTimeCapRatio is not None:
+            assert args.baseTimeCapRatio > 0, "ERROR: --baseTimeCapRatio must be positive"
+            config["baseTimeCapRatio"] = args.baseTimeCapRatio
 
     return config
 
@@ -236,10 +259,25 @@ def setup(config):
             if os.path.isfile(os.path.join(config["runDir"], fn)):
                 copy(os.path.join(config["runDir"], fn), detailedOutDir)
 
+    # compute metadata of the problem and generator models once for the whole experiment (see model_metadata.py)
+    for fn in [problemModelFile, generatorModelFile]:
+        model_metadata.get_model_metadata(fn)
+
     # copy other neccessary files
     for fn in ["instances", "run-irace.sh", "run.sh"]:
         copy(os.path.join(scriptDir, fn), config["runDir"])
 
+    # irace scenario file: if the batch target runner is used, a copy of scenario.R with irace's targetRunnerParallel function added is put in runDir
+    scenarioFile = f"{scriptDir}/scenario.R"
+    if config["batchTargetRunner"]:
+        scenarioFile = os.path.join(config["runDir"], "scenario.R")
+        with open(os.path.join(scriptDir, "scenario.R"), "rt") as f:
+            lsLines = f.readlines()
+        with open(os.path.join(scriptDir, "scenario-batch.R"), "rt") as f:
+            lsLines.extend([s.replace("<scriptDir>", scriptDir) for s in f.readlines()])
+        with open(scenarioFile, "wt") as f:
+            f.writelines(lsLines)
+
     # update fields in run-irace.sh
     iraceFile = os.path.join(config["runDir"], "run-irace.sh")
     dictValues = {
@@ -247,7 +285,7 @@ def setup(config):
         "nCores": config["nCores"],
         "maxExperiments": config["maxEvaluations"],
         "targetRunner": f"{scriptDir}/target-runner",
-        "scenario": f"{scriptDir}/scenario.R",
+        "scenario": scenarioFile,
     }
     with open(iraceFile, "rt") as f:
         lsLines = f.readlines()
@@ -297,6 +335,32 @@ def main():
         type=int,
         help="how many processes running in parallel for the tuning",
     )
+    parser.add_argument(
+        "--evaluationWorker",
+        action="store_true",
+        help="use a persistent worker process to run the evaluations, instead of starting a new python process for each irace call",
+    )
+    parser.add_argument(
+        "--batchTargetRunner",
+        action="store_true",
+        help="let irace send all evaluations of a race step at once to a batch target runner, which schedules them on nCores cores",
+    )
+    parser.add_argument(
+        "--SRServer",
+        action="store_true",
+        help="(for Essence models only) run Savile Row in persistent JVM servers, instead of starting a new JVM for each Savile Row call",
+    )
+    parser.add_argument(
+        "--nailgunJar",
+        default="",
+        type=str,
+        help="(for --SRServer only) path to the nailgun server jar file (default: the NAILGUN_JAR environment variable)",
+    )
+    parser.add_argument(
+        "--pinCores",
+        action="store_true",
+        help="give each of the nCores parallel runs an exclusive set of CPUs (NUMA-aware), inherited by all solvers it calls, to reduce timing noise under full load",
+    )
 
     # generator settings
     parser.add_argument(
@@ -331,6 +395,36 @@ def main():
         default="-varorder domoverwdeg -valorder random",
         help="extra flags for the generator solver",
     )
+    parser.add_argument(
+        "--genExclusion",
+        default="negativeTable",
+        choices=["negativeTable", "sharded", "externalDedupe"],
+        help="how instances already generated from a generator instance are excluded when solving it again: negativeTable (a single negative table in the minion file), sharded (several negative tables of at most genExclusionShardSize solutions each), externalDedupe (minion is restarted with another random seed when it finds a solution already generated)",
+    )
+    parser.add_argument(
+        "--genExclusionShardSize",
+        default=1000,
+        type=int,
+        help="(genExclusion=sharded only) max number of solutions per negative table",
+    )
+    parser.add_argument(
+        "--genSolutionPoolSize",
+        default=1,
+        type=int,
+        help="number of solutions minion is asked for (within genSolverTimeLimit) each time a generator instance is solved. Extra solutions are kept in a pool and used by the next runs of the same generator instance, without calling minion again. Default: 1 (no pool)",
+    )
+    parser.add_argument(
+        "--artifactStoreQuota",
+        default=None,
+        type=int,
+        help="disk quota (in MB) of the files kept for each generator instance (minion and aux files). Files not used for artifactColdAfter seconds are compressed, and least recently used compressed files are removed when the quota is exceeded. Default: None (files are kept uncompressed)",
+    )
+    parser.add_argument(
+        "--artifactColdAfter",
+        default=3600,
+        type=int,
+        help="(with artifactStoreQuota only) files of a generator instance not used for this number of seconds are compressed. It should be larger than the duration of a wrapper run",
+    )
 
     # instance settings (for both graded and discriminating)
     parser.add_argument(
@@ -377,6 +471,34 @@ def main():
     parser.add_argument(
         "--nRunsPerInstance", default=1, type=int, help="number of runs per instance"
     )
+    parser.add_argument(
+        "--nCoresPerEvaluation",
+        default=1,
+        type=int,
+        help="number of cores used by each instance evaluation: the nRunsPerInstance solver runs (with different random seeds) of an instance are executed in parallel on at most this number of cores. Default: 1 (runs are executed one after another)",
+    )
+    parser.add_argument(
+        "--reuseDuplicateInstances",
+        action="store_true",
+        help="if an instance generated during the tuning has already been evaluated before (e.g., generated by another configuration), reuse the evaluation results instead of re-evaluating it",
+    )
+    parser.add_argument(
+        "--solverCacheDir",
+        default=None,
+        type=str,
+        help="directory of a persistent cache of solver runs, which can be shared between experiments. Solver runs with the same model, instance and solver settings are not re-run. Default: None (no cache)",
+    )
+    parser.add_argument(
+        "--essenceTranslationReuse",
+        action="store_true",
+        help="(for Essence models only) translate each instance with Savile Row once per solver input format, and call the solvers directly on the shared translation for each run, instead of calling conjure solve for each run. Solver timeouts are then recorded with the full time limit",
+    )
+    parser.add_argument(
+        "--solverCacheMaxSize",
+        default=1024,
+        type=int,
+        help="maximum size of the solver run cache (in MB). Least recently used runs are removed when the cache is full",
+    )
 
     # instance setting (for graded experiment only)
     parser.add_argument(
@@ -390,6 +512,11 @@ def main():
         default="",
         help="(graded instance generation only) extra flags for solver",
     )
+    parser.add_argument(
+        "--gradedEarlyStopping",
+        action="store_true",
+        help="(graded instance generation only) stop running new seeds of an instance as soon as its median run is known to be too easy or too difficult. Scores are the same as when all seeds are run",
+    )
 
     # instance setting (for discriminating experiment only)
     parser.add_argument(
@@ -414,6 +541,12 @@ def main():
         default="",
         help="(discriminating instance generation only) extra flags for the base solver.",
     )
+    parser.add_argument(
+        "--baseTimeCapRatio",
+        type=float,
+        default=None,
+        help="(discriminating instance generation only) when the favoured solver solves an instance in t seconds, stop the base solver's run with the same random seed after baseTimeCapRatio * t seconds instead of maxSolverTime. Default: None (no capping)",
+    )
 
     # read all settings into one variable and check setting validity
     args = parser.parse_args()
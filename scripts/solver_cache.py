@@ -0,0 +1,150 @@
+import os
+import sys
+import json
+import fcntl
+import hashlib
+import tempfile
+import functools
+
+scriptDir = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(scriptDir)
+
+import conf
+import utils
+
+# persistent on-disk cache of solver runs, shared between experiments
+# - a run is identified by a hash of the content of its model/instance files and of its solver settings (solver name, flags, seed, time limit, etc) and tool versions
+# - each cached run is a small .json file: <cacheDir>/<first 2 characters of key>/<key>.json
+# - the cache is enabled when conf.solverCacheDir is set (see wrapper.py), its size is limited to conf.solverCacheMaxSize MB. When the limit is reached, least recently used entries are removed
+# - the total size of the cache is kept in <cacheDir>/usage.json, so that we don't have to scan the whole cache on every write
+
+CACHE_FORMAT_VERSION = 1
+
+# statuses of failed runs (crashes, memouts), which depend on the machine's state rather than on the run itself, they are never cached
+UNCACHED_STATUSES = ["ERR", "SRMemOut", "solverMemOut", "solverCrash"]
+
+
+def is_enabled():
+    return conf.solverCacheDir is not None
+
+
+@functools.lru_cache(maxsize=None)
+def get_file_hash(fn, mtime, size):
+    # mtime and size are part of the arguments so that a file modified during the run is re-hashed
+    h = hashlib.sha256()
+    with open(fn, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def get_tool_version(tool):
+    if tool == "minizinc":
+        return utils.get_minizinc_version()
+    if tool == "conjure":
+        return [utils.get_conjure_version(), utils.get_SR_version()]
+    return None
+
+
+def get_key(tool, lsFiles, settings):
+    """
+    get cache key of a run
+        - tool (str): minizinc/conjure
+        - lsFiles (list): model and instance files used by the run
+        - settings (dict): all other settings that can affect the run's results
+    return None if the cache is disabled
+    """
+    if not is_enabled():
+        return None
+    h = hashlib.sha256()
+    h.update(f"{CACHE_FORMAT_VERSION} {tool} {get_tool_version(tool)}\n".encode("utf-8"))
+    for fn in lsFiles:
+        st = os.stat(fn)
+        h.update((get_file_hash(os.path.abspath(fn), st.st_mtime, st.st_size) + "\n").encode("utf-8"))
+    h.update(json.dumps(settings, sort_keys=True).encode("utf-8"))
+    return h.hexdigest()
+
+
+def get_entry_file(key):
+    return os.path.join(conf.solverCacheDir, key[:2], key + ".json")
+
+
+def lookup(key):
+    """
+    return the stored results of a run, or None if the run is not in the cache
+    """
+    if key is None:
+        return None
+    fn = get_entry_file(key)
+    try:
+        with open(fn, "rt") as f:
+            results = json.load(f)["results"]
+        os.utime(fn)  # mark entry as recently used
+    except (OSError, ValueError, KeyError):
+        return None
+    utils.log(f"Solver run cache hit: {fn}")
+    return results
+
+
+def store(key, results):
+    """
+    save results of a run into the cache
+        - results (list): [status, time, extra], runs with a status in UNCACHED_STATUSES are not saved
+    """
+    if (key is None) or (results[0] in UNCACHED_STATUSES):
+        return
+    fn = get_entry_file(key)
+    os.makedirs(os.path.dirname(fn), exist_ok=True)
+    # write to a temporary file first, so that concurrent readers never see a partial entry
+    fd, tmpFile = tempfile.mkstemp(dir=os.path.dirname(fn), suffix=".tmp")
+    with os.fdopen(fd, "wt") as f:
+        json.dump({"results": results}, f)
+    entrySize = os.path.getsize(tmpFile)
+    # an existing entry of the same run (e.g., stored by a concurrent run) is replaced, only the size difference is added
+    oldSize = os.path.getsize(fn) if os.path.isfile(fn) else 0
+    os.replace(tmpFile, fn)
+    update_usage(entrySize - oldSize)
+
+
+def update_usage(addedSize):
+    maxSize = conf.solverCacheMaxSize * 1024 * 1024
+    usageFile = os.path.join(conf.solverCacheDir, "usage.json")
+    with open(os.path.join(conf.solverCacheDir, "usage.lock"), "at") as lockFile:
+        fcntl.flock(lockFile, fcntl.LOCK_EX)
+        totalSize = 0
+        if os.path.isfile(usageFile):
+            with open(usageFile, "rt") as f:
+                totalSize = json.load(f)["totalSize"]
+        totalSize += addedSize
+        if totalSize > maxSize:
+            totalSize = evict(int(maxSize * 0.8))
+        with open(usageFile, "wt") as f:
+            json.dump({"totalSize": totalSize}, f)
+
+
+def evict(targetSize):
+    """
+    remove least recently used entries until the cache size is below targetSize (in bytes)
+    return the new cache size
+    """
+    lsEntries = []
+    for root, _, files in os.walk(conf.solverCacheDir):
+        for name in files:
+            if name.endswith(".json") and root != conf.solverCacheDir:
+                fn = os.path.join(root, name)
+                try:
+                    st = os.stat(fn)
+                except OSError:
+                    continue
+                lsEntries.append((st.st_mtime, st.st_size, fn))
+    totalSize = sum([e[1] for e in lsEntries])
+    nRemoved = 0
+    for _, size, fn in sorted(lsEntries):
+        if totalSize <= targetSize:
+            break
+        utils.delete_file([fn])
+        totalSize -= size
+        nRemoved += 1
+    utils.log(f"Solver run cache: {nRemoved} least recently used entries removed")
+    return totalSize
@@ -0,0 +1,66 @@
+#!/bin/bash
+
+: <<'COMMENT'
+ Tests for Essence Instance Generation with the Direct Backend Pipeline
+
+ Runs all scripts put in ./push_essence_direct_tests and makes sure that the run contains provided lines.
+
+ Each script involves a full run of the vessel_loading problem (graded or discriminating), where Essence instances are solved by calling the backend solvers directly on a Savile Row translation shared by all runs of an instance (see scripts/essence_backend.py), instead of calling conjure solve for each run.
+
+ Solvers tested with include minion and chuffed. 
+
+ This script runs less intensive tests (vessel_loading runs with the small generator), and is intended for pushes to any branch.
+COMMENT
+
+# Lines being checked for
+lines=(
+    "# Best configurations (first number is the configuration ID; listed from best to worst according to the sum of ranks):"
+    "# Best configurations as commandlines (first number is the configuration ID; same order as above):"
+    "Essence instances solved with the direct backend pipeline"
+)
+
+testsPassed=0
+testsRun=0
+
+start=$(date +%s)
+
+# Loop through each script in the tests directory
+for file in push_essence_direct_tests/*; do
+    ((testsRun++))
+    # Check if file
+    if [[ -f "$file" ]]; then
+
+        # Run contents of file
+        output=$(bash "$file")
+        all_lines_found=true
+
+        # Check for each line in the array
+        for line in "${lines[@]}"; do
+            if [[ "$output" != *"$line"* ]]; then
+                all_lines_found=false
+                echo "Test $testsRun: $file failed, line not found: $line"
+            fi
+        done
+
+        # If all lines are found, count as passed
+        if $all_lines_found; then
+            echo "Test $testsRun: $file passed, all lines found in output"
+            ((testsPassed++))
+        fi
+    fi
+    # Record end time and calculate elapsed time
+    end=$(date +%s)
+    elapsedTime=$((end - start))
+
+    # Display time elapsed
+    echo "Time elapsed: $elapsedTime seconds"
+done
+
+# Final results
+if [[ "$testsRun" -eq "$testsPassed" ]]; then
+    printf "\e[32mAll tests passed: %d/%d! :D\e[0m\n" "$testsPassed" "$testsRun"
+    exit 0
+else
+    printf "\e[31mSome cases failing, only %d/%d passed.\e[0m\n" "$testsPassed" "$testsRun"
+    exit 1
+fi
@@ -0,0 +1,13 @@
+#!/bin/bash
+
+# Testing discriminating instance generation for the vessel loading problem with chuffed (favoured) and minion (base), where both solvers are called directly on Savile Row translations shared by all runs of an instance (see scripts/essence_backend.py)
+mkdir -p "$AUTOIG/experiments/vessel_loading-discrim-direct"
+cd "$AUTOIG/experiments/vessel_loading-discrim-direct"
+python3 "$AUTOIG/scripts/setup.py" --generatorModel "$AUTOIG/data/models/vessel-loading/generator.essence" --problemModel "$AUTOIG/data/models/vessel-loading/problem.essence" --instanceSetting discriminating --minSolverTime 0 --maxSolverTime 5 --favouredSolver chuffed --favouredSolverFlags="-f" --baseSolver minion --nRunsPerInstance 2 --maxEvaluations 180 --genSolverTimeLimit 3 --essenceTranslationReuse
+
+bash "$AUTOIG/experiments/vessel_loading-discrim-direct/run.sh"
+
+# the translation of an instance is only reused by the direct pipeline
+if grep -q "Reusing translation .*\.eprime-minion" detailed-output/out-* && grep -q "Reusing translation .*\.eprime-param\.fzn" detailed-output/out-*; then
+    echo "Essence instances solved with the direct backend pipeline"
+fi
@@ -0,0 +1,13 @@
+#!/bin/bash
+
+# Testing graded instance generation for the vessel loading problem with the minion solver, where minion is called directly on a Savile Row translation shared by all runs of an instance (see scripts/essence_backend.py)
+mkdir -p "$AUTOIG/experiments/vessel_loading-direct"
+cd "$AUTOIG/experiments/vessel_loading-direct"
+python3 "$AUTOIG/scripts/setup.py" --generatorModel "$AUTOIG/data/models/vessel-loading/generator.essence" --problemModel "$AUTOIG/data/models/vessel-loading/problem.essence" --instanceSetting graded --minSolverTime 0 --maxSolverTime 5 --solver minion --nRunsPerInstance 3 --maxEvaluations 180 --genSolverTimeLimit 3 --essenceTranslationReuse
+
+bash "$AUTOIG/experiments/vessel_loading-direct/run.sh"
+
+# the translation of an instance is only reused by the direct pipeline
+if grep -q "Reusing translation .*\.eprime-minion" detailed-output/out-*; then
+    echo "Essence instances solved with the direct backend pipeline"
+fi
@@ -0,0 +1,8 @@
+#!/bin/bash
+
+# Testing graded instance generation for the Macc problem using its small generator with the chuffed solver, where the two seeds of each instance are run concurrently on the same instance file (--nCoresPerEvaluation)
+mkdir -p "$AUTOIG/experiments/macc-graded-parallel-seeds"
+cd "$AUTOIG/experiments/macc-graded-parallel-seeds"
+python3 "$AUTOIG/scripts/setup.py" --generatorModel "$AUTOIG/data/models/macc/generator-small.essence" --problemModel "$AUTOIG/data/models/macc/problem.mzn" --instanceSetting graded --minSolverTime 0 --maxSolverTime 5 --solver chuffed --solverFlags="-f" --nRunsPerInstance 2 --nCoresPerEvaluation 2 --maxEvaluations 180 --genSolverTimeLimit 3
+
+bash "$AUTOIG/experiments/macc-graded-parallel-seeds/run.sh"
@@ -1,10 +1,10 @@
 import os
 import glob
-import subprocess
-import shlex
 import datetime
 import shutil
 
+import process_engine
+
 
 def log(logMessage):
     print(
@@ -30,10 +30,13 @@ def search_string(s, lsStrs):
     return lsOut
 
 
-def run_cmd(cmd, printOutput=False, outFile=None):
-    lsCmds = shlex.split(cmd)
-    p = subprocess.run(lsCmds, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-    output = p.stdout.decode("utf-8")
+def run_cmd(cmd, printOutput=False, outFile=None, timeLimit=None):
+    """
+    run a command (without a shell) and return its output (stdout and stderr) and return code
+        - timeLimit: wall-clock time limit (in seconds), the command and all processes started by it are killed when it is reached
+    """
+    p = process_engine.run(cmd, timeLimit=timeLimit)
+    output = p.output
     if outFile is not None:
         with open(outFile, "wt") as f:
             f.write(output)
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+
+# persistent evaluation worker, so that target-runner does not have to start a new python process (and re-import numpy, all evaluators and re-read config.json) for every irace evaluation
+# syntax:
+#   - server mode: python worker.py --serve [--socket <socketFile>] [--nWorkers <n>]
+#       load all dependencies of wrapper.py and config.json once, then wait for evaluation requests on a Unix socket. Each request is evaluated in a forked child process, so runs are isolated from each other.
+#       if the worker is disabled in config.json (evaluationWorker=false), the server exits immediately and target-runner keeps calling wrapper.py directly
+#   - client mode: python worker.py --client <socketFile> <outFile> <iraceConfigurationId> <1> <randomSeed> <dummyName> <configurationValues>
+#       send one evaluation request to the server and wait for it to finish. Same as with wrapper.py, all output of the run is written to <outFile> and its last line is the score returned to irace, so the resume mechanism of target-runner still works
+#       if the server cannot be reached, the client falls back to running wrapper.py itself
+# NOTE: the client mode only uses python's standard library, don't add any heavy import at the top of this file
+
+import os
+import sys
+import json
+import socket
+
+scriptDir = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(scriptDir)
+
+defaultSocketFile = "./detailed-output/worker.sock"
+
+
+def send_request(socketFile, outFile, args):
+    """
+    send an evaluation request to the worker server and return the exit code of the run
+    return None if the server cannot be reached
+    """
+    request = {"args": args, "outFile": os.path.abspath(outFile)}
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            s.connect(socketFile)
+            s.sendall((json.dumps(request) + "\n").encode("utf-8"))
+            with s.makefile("r") as f:
+                response = f.readline()
+    except (ConnectionError, FileNotFoundError, OSError):
+        return None
+    if response.strip() == "":  # the server was killed during the run
+        return None
+    return json.loads(response)["exitCode"]
+
+
+def run_client(argv):
+    socketFile, outFile = argv[0], argv[1]
+    args = ["wrapper.py"] + argv[2:]
+    exitCode = send_request(socketFile, outFile, args)
+    if exitCode is not None:
+        sys.exit(exitCode)
+
+    # fall back to running wrapper.py in this process
+    fd = os.open(outFile, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    os.dup2(fd, 1)
+    os.dup2(fd, 2)
+    os.close(fd)
+    os.execv(
+        sys.executable,
+        [sys.executable, "-u", os.path.join(scriptDir, "wrapper.py")] + argv[2:],
+    )
+
+
+def run_server(socketFile, nWorkers):
+    import socketserver
+    import threading
+    import signal
+    from utils import log
+    from wrapper_helpers import read_setting
+
+    setting = read_setting("./config.json")
+    if setting["generalSettings"]["evaluationWorker"] is False:
+        print("Evaluation worker is disabled in config.json. Exitting...")
+        return
+
+    # import wrapper.py (and all of its dependencies) only once
+    import wrapper
+
+    slots = threading.Semaphore(nWorkers)
+
+    class RequestHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            request = json.loads(self.rfile.readline().decode("utf-8"))
+            with slots:
+                exitCode = wrapper.run_to_output_file(
+                    request["args"], request["outFile"], setting
+                )
+            self.wfile.write((json.dumps({"exitCode": exitCode}) + "\n").encode("utf-8"))
+
+    class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+    # stop the server cleanly when run.sh kills it after irace finishes
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    # remove socket file left by a previous (killed) server
+    if os.path.exists(socketFile):
+        os.remove(socketFile)
+
+    with Server(socketFile, RequestHandler) as server:
+        log(f"Evaluation worker is listening on {socketFile} ({nWorkers} workers)")
+        try:
+            server.serve_forever()
+        finally:
+            if os.path.exists(socketFile):
+                os.remove(socketFile)
+
+
+def main():
+    import argparse
+
+    if len(sys.argv) > 1 and sys.argv[1] == "--client":
+        run_client(sys.argv[2:])
+        return
+
+    parser = argparse.ArgumentParser(description="Persistent evaluation worker for irace's target-runner")
+    parser.add_argument("--serve", action="store_true", required=True, help="start the worker server")
+    parser.add_argument("--socket", default=defaultSocketFile, type=str, help="path to the Unix socket file")
+    parser.add_argument("--nWorkers", default=None, type=int, help="maximum number of evaluations running in parallel (default: nCores in config.json)")
+    args = parser.parse_args()
+
+    nWorkers = args.nWorkers
+    if nWorkers is None:
+        with open("./config.json") as f:
+            nWorkers = json.load(f)["nCores"]
+    run_server(args.socket, nWorkers)
+
+
+if __name__ == "__main__":
+    main()
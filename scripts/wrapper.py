@@ -20,6 +20,8 @@ import pprint
 import math
 import conf
 import sys
+import traceback
+import signal
 
 from wrapper_helpers import read_setting, read_args
 
@@ -37,27 +39,53 @@ scriptDir = os.path.dirname(os.path.realpath(__file__))
 sys.path.append(scriptDir)
 
 from utils import log, read_file, search_string, run_cmd, delete_file
-from essence_pipeline_utils import encode_negative_table
-from generator import solve_generator
+from negative_table import encode_negative_table
+from generator import solve_generator, release_generator_artifacts, remove_from_pool
 from convert import convert_essence_instance_to_mzn
+import instance_index
+import resource_usage
+import core_allocator
+import savilerow_server
+import process_engine
 
 
-def main():
+def main(args=None, setting=None):
     startTime = time.time()
 
     # parse arguments
-    configurationId, seed, paramDict = read_args(sys.argv)
+    if args is None:
+        args = sys.argv
+    configurationId, seed, paramDict = read_args(args)
 
     # set random seed
     random.seed(seed)
 
-    # read all setting
-    setting = read_setting("./config.json")
+    # read all setting (a long-lived caller, e.g., worker.py, can pass in the setting it has already read)
+    if setting is None:
+        setting = read_setting("./config.json")
 
     print(setting)
 
+    # compressed store of generator artifacts (see artifact_store.py)
+    conf.artifactStoreQuota = setting["generatorSettings"]["artifactStoreQuota"]
+    conf.artifactColdAfter = setting["generatorSettings"]["artifactColdAfter"]
+
+    # persistent Savile Row service (see savilerow_server.py)
+    if setting["generalSettings"]["SRServer"]:
+        savilerow_server.enable()
+
+    # exclusive CPU set for this run (see core_allocator.py)
+    pinning = None
+    if setting["generalSettings"]["pinCores"]:
+        pinning = core_allocator.pin_current_run(
+            setting["generalSettings"]["nCores"],
+            setting["evaluationSettings"]["nCoresPerEvaluation"],
+        )
+
     # initialise run results
     score = status = None
+    # calls made before this run (e.g., by the caller) are not accounted to it
+    resource_usage.take()
     results = {"totalTime": 0, "genResults": {}, "instanceResults": {}}
 
     def print_results():
@@ -68,6 +96,9 @@ def main():
         results["totalTime"] = totalWrapperTime
         results["status"] = status
         results["score"] = score
+        if pinning is not None:
+            pinning.update(core_allocator.get_contention_metrics())
+            results["pinning"] = pinning
         print(results)
         print(str(score) + " " + str(np.round(totalWrapperTime, 2)))
 
@@ -86,16 +117,19 @@ def main():
         detailedOutputDir,
     )
     results["genResults"] = genResults
+    # resources used by external tools, per pipeline stage (see resource_usage.py)
+    results["genResults"]["resourceUsage"] = resource_usage.take()
 
     # if no instance is generated, return immediately
     status = "gen" + genStatus
     if genStatus != "sat":
         print("No instance file generated. Exitting...")
         # determine the score
-        if genStatus != "solverTimeOut":
-            score = "Inf"  # if the generator configuration is unsat/SRTimeOut/SRMemOut/solverMemOut, return "Inf", so that irace will discard this configuration immediately
+        if genStatus not in ["solverTimeOut", "duplicate"]:
+            score = "Inf"  # if the generator configuration is unsat/SRTimeOut/SRMemOut/solverMemOut (or exhausted: all its solutions are already generated or being evaluated), return "Inf", so that irace will discard this configuration immediately
         else:
-            score = 2  # if the generator configuration is unsolved because minion timeout, penalise it heavier than any other cases where the generator configuration is sat
+            score = 2  # if the generator configuration is unsolved because minion timeout (or only gives already generated solutions, with the externalDedupe exclusion backend), penalise it heavier than any other cases where the generator configuration is sat
+        release_generator_artifacts(genMinionFile)
         # print out score and exit
         print_results()
         return
@@ -132,8 +166,32 @@ def main():
             return ["unsat"]
         return ["sat"]
 
+    # persistent cache of solver runs, shared between experiments (see solver_cache.py)
+    conf.solverCacheDir = setting["evaluationSettings"]["solverCacheDir"]
+    conf.solverCacheMaxSize = setting["evaluationSettings"]["solverCacheMaxSize"]
+
+    # for Essence models: shared Savile Row translations and backend solvers called directly (see essence_backend.py)
+    conf.essenceTranslationReuse = setting["evaluationSettings"]["essenceTranslationReuse"]
+
+    # if the same instance has already been evaluated during this experiment (e.g., generated by another configuration), reuse its results instead of evaluating it again
+    reuseDuplicates = setting["evaluationSettings"]["reuseDuplicateInstances"]
+    indexEntry = None
+    if reuseDuplicates:
+        instanceHash = instance_index.get_instance_hash(instFile)
+        indexEntry = instance_index.lookup(instanceHash)
+
     # evaluate the generated instance
-    if modelType == "essence":
+    if indexEntry is not None:
+        score = indexEntry["score"]
+        instanceResults = copy.deepcopy(indexEntry["instanceResults"])
+        evaluatedInstFile = instFile
+        if modelType == "mzn":
+            # keep a copy of the converted instance, so that collect_results can recognise this run as a duplicate (via md5sum of inst-*.dzn)
+            evaluatedInstFile = instFile.replace(".param", ".dzn")
+            copyfile(indexEntry["instFile"], evaluatedInstFile)
+        instanceResults["instance"] = evaluatedInstFile
+        instanceResults["duplicateOf"] = indexEntry["instFile"]
+    elif modelType == "essence":
         es = setting["evaluationSettings"]
 
         # Case for graded
@@ -160,6 +218,8 @@ def main():
                 oracleSolver=oracleSolver,              
                 oracleSolverFlags=oracleSolverFlags,    
                 oracleSolverTimeLimit=oracleSolverTimeLimit,  
+                nParallelRuns=es["nCoresPerEvaluation"],
+                earlyStopping=es["earlyStopping"],
             )
         # Case for discriminating
         else: 
@@ -177,6 +237,8 @@ def main():
                 totalTimeLimit=es["baseSolver"]["totalTimeLimit"],
                 initSeed=seed,
                 gradedTypes=es["gradedTypes"],
+                nParallelRuns=es["nCoresPerEvaluation"],
+                baseTimeCapRatio=es["baseSolver"]["timeCapRatio"],
             )
     else:
         # convert the generated instance into .dzn
@@ -207,6 +269,8 @@ def main():
                 favouredSolverFlags=es["favouredSolver"]["solverFlags"],
                 totalTimeLimit=es["baseSolver"]["totalTimeLimit"],
                 initSeed=seed,
+                nParallelRuns=es["nCoresPerEvaluation"],
+                baseTimeCapRatio=es["baseSolver"]["timeCapRatio"],
             )
 
         # Case for graded instance generation
@@ -230,23 +294,77 @@ def main():
                 oracleSolver=oracleSolver,
                 oracleSolverFlags=oracleSolverFlags,
                 oracleSolverTimeLimit=oracleSolverTimeLimit,
+                nParallelRuns=es["nCoresPerEvaluation"],
+                earlyStopping=es["earlyStopping"],
             )
 
-    
+    instanceResults["resourceUsage"] = resource_usage.take()
+
+    # add the newly evaluated instance into the index of evaluated instances
+    if reuseDuplicates and (indexEntry is None):
+        instance_index.record(
+            instanceHash, instanceResults["instance"], score, instanceResults
+        )
+
     results["instanceResults"] = instanceResults
     print("instance results *******", instanceResults)
     status = instanceResults["status"]
 
     # add the generated instance into generator's minion negative table, so that next time when we solve this generator instance again we don't re-generate the same instance
-    encode_negative_table(genMinionFile, genMinionSolString)
+    gs = setting["generatorSettings"]
+    encode_negative_table(
+        genMinionFile, genMinionSolString, gs["genExclusion"], gs["genExclusionShardSize"]
+    )
+    # the instance has been evaluated, it can leave the solution pool of the generator instance
+    remove_from_pool(genMinionFile, genMinionSolString)
+    release_generator_artifacts(genMinionFile)
 
     # print out score and exit
     print_results()
 
-main()
+
+def run_to_output_file(args, outFile, setting=None):
+    """
+    run main() in a forked child process, with both stdout and stderr of the run redirected to outFile (same as target-runner does with "python wrapper.py ... > outFile 2>&1")
+    this lets a long-lived process (worker.py) pay the import and setting reading costs only once, while each run still starts from a clean copy of the process state
+    returns the exit code of the run
+    """
+    sys.stdout.flush()
+    sys.stderr.flush()
+    pid = os.fork()
+    if pid == 0:
+        exitCode = 1
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            fd = os.open(outFile, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            os.dup2(fd, 1)
+            os.dup2(fd, 2)
+            os.close(fd)
+            sys.stdout = os.fdopen(1, "wt", buffering=1)
+            sys.stderr = os.fdopen(2, "wt", buffering=1)
+            main(args, setting)
+            exitCode = 0
+        except SystemExit as e:
+            exitCode = e.code if isinstance(e.code, int) else 1
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            try:
+                # os._exit skips atexit hooks, including the one stopping solvers still running (see process_engine.py)
+                process_engine.kill_live_process_groups()
+                sys.stdout.flush()
+                sys.stderr.flush()
+            finally:
+                os._exit(exitCode)
+    _, waitStatus = os.waitpid(pid, 0)
+    return os.waitstatus_to_exitcode(waitStatus)
+
+
+if __name__ == "__main__":
+    main()
 
 # scoring for graded instances (single solver)
-# - gen unsat/SRTimeOut/SRMemOut/solverMemOut: Inf
+# - gen unsat/exhausted/SRTimeOut/SRMemOut/solverMemOut: Inf
 # - gen solverTimeout: 2
 # - inst unwanted type or SR timeout/memout or solver crash: 1
 # - solver timeout/memout: 0
@@ -256,7 +374,7 @@ main()
 #   and sum them up for final score
 
 # scoring for discriminating instances (two solvers)
-# - gen unsat/SRTimeOut/SRMemOut/solverMemOut: Inf
+# - gen unsat/exhausted/SRTimeOut/SRMemOut/solverMemOut: Inf
 # - gen solverTimeOut: 2
 # - inst unwanted type or SR timeout/memout (either solver) or solver crash (either solver): 1
 # - favoured solver timeout (any run) or base solver too easy (any run): 0
@@ -1,5 +1,6 @@
 from utils import log, read_file, search_string, run_cmd, delete_file
 import os
+import re
 import sys
 import json
 
@@ -21,6 +22,16 @@ def read_args(args):
     return configurationId, seed, paramDict
 
 
+def is_valid_score_line(line):
+    """
+    check if the last output line of a wrapper run starts with a valid score for irace (a number or Inf), same as checkScore in target-runner
+    """
+    score = line.strip().split(" ")[0]
+    return (score == "Inf") or (
+        re.match(r"^-?[0-9]+([.][0-9]+)?e?[+-]?([0-9]+)?$", score) is not None
+    )
+
+
 def read_setting(settingFile):
     if os.path.isfile(settingFile) is False:
         print("ERROR: setting file " + settingFile + " is missing.")
@@ -35,15 +46,30 @@ def read_setting(settingFile):
     c["generalSettings"]["modelFile"] = setting["problemModel"]
     c["generalSettings"]["generatorFile"] = setting["generatorModel"]
     c["generalSettings"]["runDir"] = setting["runDir"]
+    c["generalSettings"]["evaluationWorker"] = setting.get("evaluationWorker", False)
+    c["generalSettings"]["nCores"] = setting.get("nCores", 1)
+    c["generalSettings"]["SRServer"] = setting.get("SRServer", False)
+    c["generalSettings"]["nailgunJar"] = setting.get("nailgunJar", "")
+    c["generalSettings"]["pinCores"] = setting.get("pinCores", False)
 
     c["generatorSettings"]["genSRTimeLimit"] = setting["genSRTimeLimit"]
     c["generatorSettings"]["genSRFlags"] = setting["genSRFlags"]
     c["generatorSettings"]["genSolver"] = setting["genSolver"]
     c["generatorSettings"]["genSolverTimeLimit"] = setting["genSolverTimeLimit"]
     c["generatorSettings"]["genSolverFlags"] = setting["genSolverFlags"]
+    c["generatorSettings"]["genExclusion"] = setting.get("genExclusion", "negativeTable")
+    c["generatorSettings"]["genExclusionShardSize"] = setting.get("genExclusionShardSize", 1000)
+    c["generatorSettings"]["genSolutionPoolSize"] = setting.get("genSolutionPoolSize", 1)
+    c["generatorSettings"]["artifactStoreQuota"] = setting.get("artifactStoreQuota", None)
+    c["generatorSettings"]["artifactColdAfter"] = setting.get("artifactColdAfter", 3600)
 
     c["evaluationSettings"]["nEvaluations"] = setting["nRunsPerInstance"]
     c["evaluationSettings"]["gradedTypes"] = setting["instanceValidTypes"]
+    c["evaluationSettings"]["nCoresPerEvaluation"] = setting.get("nCoresPerEvaluation", 1)
+    c["evaluationSettings"]["reuseDuplicateInstances"] = setting.get("reuseDuplicateInstances", False)
+    c["evaluationSettings"]["solverCacheDir"] = setting.get("solverCacheDir", None)
+    c["evaluationSettings"]["solverCacheMaxSize"] = setting.get("solverCacheMaxSize", 1024)
+    c["evaluationSettings"]["essenceTranslationReuse"] = setting.get("essenceTranslationReuse", False)
     if setting["instanceSetting"] == "graded":
         c["evaluationSettings"]["solver"] = setting["solver"]
         print(setting)
@@ -55,6 +81,7 @@ def read_setting(settingFile):
         c["evaluationSettings"]["solverFlags"] = setting["solverFlags"]
         c["evaluationSettings"]["SRTimeLimit"] = setting["SRTimeLimit"]
         c["evaluationSettings"]["totalTimeLimit"] = setting["maxSolverTime"]
+        c["evaluationSettings"]["earlyStopping"] = setting.get("gradedEarlyStopping", False)
     else:
         c["evaluationSettings"][
             "scoringMethod"
@@ -64,6 +91,7 @@ def read_setting(settingFile):
             "solverMinTime": setting["minSolverTime"],
             "totalTimeLimit": setting["maxSolverTime"],
             "solverFlags": setting["baseSolverFlags"],
+            "timeCapRatio": setting.get("baseTimeCapRatio", None),
         }
         favouredSolverSettings = {
             "name": setting["favouredSolver"],